@@ -1,27 +1,132 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, g, request, jsonify, render_template, send_file, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_restx import Api, Resource, fields
-import os, base64
-from datetime import datetime, timedelta
-from obj_rec import objRec
-from ultralytics import YOLO
+import os, io, sys, csv, zlib, base64, json, hashlib, itertools, calendar, threading, time, struct, array
+import click
+from datetime import datetime, timedelta, timezone
+from blob_store import create_blob_store
+from inference import InferenceQueue, decode_image, dhash, hamming_distance, make_renditions
+from group_commit import GroupCommitWriter
+from events import EventBus, EVENT_TYPES, format_sse
+from metrics import Registry, CachedValue
 
 # Konfiguracja czasu dla strefy czasowej UTC+1
 utcplusone = lambda: datetime.utcnow() + timedelta(hours=1)
-# Wybranie modelu do analizy zdjęć
-yolo = YOLO("yolov8n.pt")
+# Wersje zdjęć tworzone przy przesłaniu: rozmiar -> szerokość w pikselach (None - pełna rozdzielczość)
+IMAGE_RENDITION_SIZES = {'thumb': 160, 'medium': 640}
+# Formaty wersji zdjęć i jakość kodowania
+IMAGE_RENDITION_FORMATS = {'jpeg': 75, 'webp': 70}
+IMAGE_MIME_TYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+# Kolejka analizy zdjęć w osobnych procesach (model wczytywany w procesach roboczych),
+# zdjęcia z wielu kamer są łączone w paczki analizowane jednym wywołaniem modelu
+inference_queue = InferenceQueue(
+    workers=int(os.environ.get('INFERENCE_WORKERS', max(1, (os.cpu_count() or 2) // 2))),
+    model_path="yolov8n.pt",
+    # Funkcja tworząca model 'moduł:funkcja' - domyślnie detektor wybrany przez DETECTOR_BACKEND
+    # (ultralytics, onnx, onnx-int8), do testów obciążeniowych np. 'load_test:fake_detector'
+    model_factory=os.environ.get('INFERENCE_MODEL_FACTORY', 'detectors:create_detector'),
+    max_batch_size=int(os.environ.get('INFERENCE_MAX_BATCH', 8)),
+    max_wait_ms=float(os.environ.get('INFERENCE_MAX_WAIT_MS', 50)),
+    renditions=[
+        (size, width, image_format, quality)
+        for size, width in IMAGE_RENDITION_SIZES.items()
+        for image_format, quality in IMAGE_RENDITION_FORMATS.items()
+    ]
+)
+# Pomijanie analizy klatek prawie identycznych z poprzednią z tej samej kamery: maksymalna
+# liczba różniących się bitów skrótu percepcyjnego (z 64) i maksymalny wiek wyniku (s),
+# po którym klatka jest analizowana ponownie nawet bez zmian (FRAME_CACHE_THRESHOLD=-1 wyłącza)
+FRAME_CACHE_THRESHOLD = int(os.environ.get('FRAME_CACHE_THRESHOLD', 4))
+FRAME_CACHE_MAX_AGE = float(os.environ.get('FRAME_CACHE_MAX_AGE', 600))
+# Wczytanie modelu już przy imporcie modułu, przed utworzeniem procesów (np. gunicorn --preload),
+# aby procesy współdzieliły wagi - domyślnie model wczytywany jest dopiero w procesach roboczych
+if os.environ.get('INFERENCE_PRELOAD') == '1':
+    inference_queue.preload()
 # Konfiguracja aplikacji Flask
 app = Flask(__name__)
 api = Api(app, version='1.0', title='Sensor Management API', description='API do zarządzania danymi z czujników')
 
+# Rozdzielczości agregatów pomiarów (w sekundach)
+ROLLUP_RESOLUTIONS = {'minute': 60, 'hour': 3600, 'day': 86400}
+ROLLUP_METRICS = ['temperature', 'humidity', 'smoke_level']
+# Maksymalna liczba przedziałów w jednej odpowiedzi z agregatami
+AGGREGATES_MAX_BUCKETS = 10000
+
+# Stronicowanie historii pomiarów
+HISTORY_DEFAULT_LIMIT = 1000
+HISTORY_MAX_LIMIT = 10000
+HISTORY_YIELD_PER = 500
+# Serie pomiarów pokoju w układzie kolumnowym: maksymalna liczba pomiarów w odpowiedzi i typ
+# binarnego formatu (wybierany nagłówkiem Accept, domyślnie JSON)
+SERIES_MAX_POINTS = 100000
+SERIES_BINARY_MIME = 'application/vnd.sensor-series'
+SERIES_BINARY_MAGIC = b'SSR1'
+# Eksport historii pomiarów: wiersze pobierane z kursora partiami (yield_per)
+# i wysyłane fragmentami po EXPORT_CHUNK_ROWS wierszy
+EXPORT_YIELD_PER = 2000
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_COLUMNS = ['device_id', 'timestamp', 'temperature', 'humidity', 'smoke_level']
+
+# Układ przechowywania pomiarów: rows - tabela sensor_data (id, room_id i device_id w każdym wierszu),
+# compact - tabela sensor_reading bez rowid z kluczem (device_key, ts), czas w ms od epoki.
+# Przejście na compact: flask migrate-sensor-storage, a potem uruchomienie z SENSOR_STORAGE=compact
+SENSOR_STORAGE = os.environ.get('SENSOR_STORAGE', 'rows')
+if SENSOR_STORAGE not in ('rows', 'compact'):
+    raise ValueError(f"Nieznany układ pomiarów SENSOR_STORAGE={SENSOR_STORAGE}, dostępne: rows, compact")
+COMPACT_STORAGE = SENSOR_STORAGE == 'compact'
+# Liczba wierszy sensor_data kopiowanych w jednej transakcji przy migracji
+SENSOR_MIGRATION_BATCH = 10000
+
 # Konfiguracja bazy danych
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sensor_data.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///sensor_data.db')
+# FULL - zatwierdzona transakcja przetrwa też utratę zasilania (w trybie WAL koszt fsync
+# rozkłada się na wszystkie zapisy grupowane przez sensor_writer), NORMAL - szybciej, mniej bezpiecznie
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'FULL')
+# Czas oczekiwania na blokadę bazy zajętej przez inny zapis (ms)
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+# Maksymalny czas oczekiwania żądania na zapis pomiarów (s)
+WRITER_TIMEOUT = 30
+
+# Jak długo limity są trzymane w pamięci podręcznej procesu (s) - ogranicza nieaktualność,
+# gdy limity zmieniono przez inny proces serwera
+LIMITS_CACHE_TTL = float(os.environ.get('LIMITS_CACHE_TTL', 30))
+# Klucz urządzenia dla limitów całego pokoju (używanych, gdy urządzenie nie ma własnych)
+ROOM_LIMITS = '*'
+
+# Zdarzenia dla strumieni SSE: bufor na subskrybenta (po zapełnieniu klient jest odłączany)
+# i odstęp komentarzy podtrzymujących połączenie (s)
+EVENTS_MAX_QUEUE = int(os.environ.get('EVENTS_MAX_QUEUE', 100))
+EVENTS_KEEPALIVE = float(os.environ.get('EVENTS_KEEPALIVE', 15))
+event_bus = EventBus(max_queue=EVENTS_MAX_QUEUE)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
+# Magazyn plików zdjęć poza bazą danych (katalog lub adres magazynu)
+app.config['BLOB_STORE'] = os.environ.get('BLOB_STORE', os.path.join(app.instance_path, 'blobs'))
+blob_store = create_blob_store(app.config['BLOB_STORE'])
+# Liczba zdjęć przenoszonych z bazy do magazynu w jednej transakcji przy migracji
+BLOB_MIGRATION_BATCH = 100
+
+# Retencja danych (0 wyłącza daną regułę)
+RETENTION_IMAGES_PER_SECTION = int(os.environ.get('RETENTION_IMAGES_PER_SECTION', 1000))
+RETENTION_SENSOR_DATA_DAYS = int(os.environ.get('RETENTION_SENSOR_DATA_DAYS', 90))
+RETENTION_MINUTE_ROLLUP_DAYS = int(os.environ.get('RETENTION_MINUTE_ROLLUP_DAYS', 30))
+# Co ile sekund uruchamiane jest czyszczenie
+RETENTION_INTERVAL = int(os.environ.get('RETENTION_INTERVAL', 3600))
+# Usuwanie małymi partiami z przerwami, aby nie blokować zapisów na długo
+RETENTION_BATCH_SIZE = 500
+RETENTION_BATCH_PAUSE = 0.05
+# Liczba stron zwalnianych przez jedno PRAGMA incremental_vacuum
+RETENTION_VACUUM_PAGES = 1000
+
 
 # Modele danych
 class SensorDevice(db.Model):
+    __table_args__ = (
+        db.Index('ix_sensor_device_room', 'room_id'),
+    )
     #    id = db.Column(db.Integer, nullable=False)
     device_id = db.Column(db.String(50), primary_key=True)  # Ustawienie jako klucz główny
     room_id = db.Column(db.String(50), nullable=False)
@@ -32,11 +137,19 @@ class SensorDevice(db.Model):
     sensor_data = db.relationship(
         'SensorData',  # Nazwa tabeli docelowej (modelu)
         back_populates='sensor_device',  # Powiązanie zwrotne
-        cascade="all, delete-orphan"  # Usuwanie powiązanych rekordów
+        cascade="all, delete-orphan",  # Usuwanie powiązanych rekordów
+        passive_deletes=True  # Pomiary usuwane jednym poleceniem przy usuwaniu urządzenia, bez wczytywania
     )
 
 
 class SensorData(db.Model):
+    __table_args__ = (
+        # Najnowsze/kolejne pomiary urządzenia w pokoju
+        db.Index('ix_sensor_data_room_device_id', 'room_id', 'device_id', 'id'),
+        # Zapytania o zakres czasu
+        db.Index('ix_sensor_data_room_device_timestamp', 'room_id', 'device_id', 'timestamp'),
+        db.Index('ix_sensor_data_timestamp', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     room_id = db.Column(db.String(50), nullable=False)
     device_id = db.Column(db.String(50), db.ForeignKey('sensor_device.device_id'))  # Klucz obcy
@@ -52,7 +165,31 @@ class SensorData(db.Model):
         return f'<SensorData {self.device_id} at {self.timestamp}>'
 
 
+class SensorKey(db.Model):
+    # Liczbowy klucz urządzenia w pokoju dla zwartego układu pomiarów
+    __table_args__ = (
+        db.UniqueConstraint('room_id', 'device_id', name='uq_sensor_key_room_device'),
+    )
+    device_key = db.Column(db.Integer, primary_key=True)
+    room_id = db.Column(db.String(50), nullable=False)
+    device_id = db.Column(db.String(50), nullable=False)
+
+
+class SensorReading(db.Model):
+    # Zwarty układ pomiarów (SENSOR_STORAGE=compact): bez rowid, więc wiersze leżą w B-drzewie klucza
+    # (device_key, ts) - pomiary urządzenia z zakresu czasu to ciągły fragment tabeli, bez osobnych indeksów
+    __table_args__ = {'sqlite_with_rowid': False}
+    device_key = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    ts = db.Column(db.Integer, primary_key=True, autoincrement=False)  # ms od epoki (czas UTC+1 jak w bazie)
+    temperature = db.Column(db.Float, nullable=True)
+    humidity = db.Column(db.Float, nullable=True)
+    smoke_level = db.Column(db.Integer, nullable=True)
+
+
 class CameraDevice(db.Model):
+    __table_args__ = (
+        db.Index('ix_camera_device_room', 'room_id'),
+    )
     device_id = db.Column(db.String(50), primary_key=True)
     room_id = db.Column(db.String(50), nullable=False)
     device_type = db.Column(db.String(50), default='camera')  # Typ urządzenia: camera
@@ -65,27 +202,570 @@ class CameraDevice(db.Model):
     )
 
 
+class Blob(db.Model):
+    # Plik zapisany w magazynie, identyfikowany skrótem SHA-256 zawartości
+    hash = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(50), nullable=False)
+    created_on = db.Column(db.DateTime, default=utcplusone)
+
+
+class ImageRendition(db.Model):
+    __table_args__ = (
+        db.Index('ix_image_rendition_blob_hash', 'blob_hash'),
+    )
+    # Pomniejszona/przekodowana wersja pliku zdjęcia (np. miniatura WebP)
+    source_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), primary_key=True)
+    size = db.Column(db.String(20), primary_key=True)
+    format = db.Column(db.String(10), primary_key=True)
+    blob_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), nullable=False)
+
+    blob = db.relationship('Blob', foreign_keys=[blob_hash])
+
+
 class Image(db.Model):
+    __table_args__ = (
+        db.Index('ix_image_section_id', 'section', 'id'),
+        db.Index('ix_image_timestamp', 'timestamp'),
+        db.Index('ix_image_blob_hash', 'blob_hash'),
+        # Usuwanie zdjęć razem z kamerą
+        db.Index('ix_image_device', 'device_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(50), db.ForeignKey('camera_device.device_id'))
     section = db.Column(db.String(1), nullable=False)
-    image_data = db.Column(db.LargeBinary, nullable=False)
+    blob_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), nullable=False)
     timestamp = db.Column(db.DateTime, default=utcplusone)
+    blob = db.relationship('Blob')
     # Relacja z SensorDevice
     camera_device = db.relationship('CameraDevice', back_populates='image')
 
 
 class ImageOut(db.Model):
+    __table_args__ = (
+        db.Index('ix_image_out_section_id', 'section', 'id'),
+        db.Index('ix_image_out_timestamp', 'timestamp'),
+        db.Index('ix_image_out_blob_hash', 'blob_hash'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     section = db.Column(db.String(1), nullable=False)
-    image_data = db.Column(db.LargeBinary, nullable=False)
+    blob_hash = db.Column(db.String(64), db.ForeignKey('blob.hash'), nullable=False)
     timestamp = db.Column(db.DateTime, default=utcplusone)
     people_num = db.Column(db.Integer, nullable=False)
+    blob = db.relationship('Blob')
+
+
+class InferenceJob(db.Model):
+    __table_args__ = (
+        db.Index('ix_inference_job_status', 'status'),
+        db.Index('ix_inference_job_image', 'image_id'),
+        db.Index('ix_inference_job_image_out', 'image_out_id'),
+    )
+    # Zadanie analizy przesłanego zdjęcia (queued -> done/failed)
+    id = db.Column(db.Integer, primary_key=True)
+    section = db.Column(db.String(1), nullable=False)
+    device_id = db.Column(db.String(50), nullable=True)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False)
+    image_out_id = db.Column(db.Integer, db.ForeignKey('image_out.id'), nullable=True)
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    people_num = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.String(500), nullable=True)
+    created_on = db.Column(db.DateTime, default=utcplusone)
+    finished_on = db.Column(db.DateTime, nullable=True)
+
+    image = db.relationship('Image')
+
+
+class SensorLimits(db.Model):
+    # Limity pomiarów dla urządzenia (lub całego pokoju, device_id = ROOM_LIMITS)
+    room_id = db.Column(db.String(50), primary_key=True)
+    device_id = db.Column(db.String(50), primary_key=True)
+    temperature = db.Column(db.Float, nullable=True)
+    humidity = db.Column(db.Float, nullable=True)
+    smoke_level = db.Column(db.Float, nullable=True)
+    people = db.Column(db.Integer, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Rośnie przy każdej zmianie
+    updated_on = db.Column(db.DateTime, default=utcplusone, onupdate=utcplusone)
+
+
+class SensorLatest(db.Model):
+    # Najnowszy pomiar każdego urządzenia, aktualizowany w tej samej transakcji co SensorData
+    room_id = db.Column(db.String(50), primary_key=True)
+    device_id = db.Column(db.String(50), primary_key=True)
+    data_id = db.Column(db.Integer, nullable=False)  # id rekordu w SensorData
+    temperature = db.Column(db.Float, nullable=True)
+    humidity = db.Column(db.Float, nullable=True)
+    smoke_level = db.Column(db.Integer, nullable=True)
+    timestamp = db.Column(db.DateTime)
+
+    # Zgodność z SensorData (np. w szablonie HTML)
+    id = db.synonym('data_id')
+
+
+class ImageLatest(db.Model):
+    # Najnowsze zdjęcie oryginalne i przetworzone dla każdej sekcji
+    section = db.Column(db.String(1), primary_key=True)
+    image_id = db.Column(db.Integer, nullable=True)
+    image_out_id = db.Column(db.Integer, nullable=True)
+    people_num = db.Column(db.Integer, nullable=True)
+    timestamp = db.Column(db.DateTime)
+
+
+class SensorRollup(db.Model):
+    __table_args__ = (
+        # Usuwanie starych agregatów danej rozdzielczości
+        db.Index('ix_sensor_rollup_resolution_bucket', 'resolution', 'bucket'),
+    )
+    # Agregaty pomiarów urządzenia w przedziałach czasu, aktualizowane przy każdym zapisie
+    room_id = db.Column(db.String(50), primary_key=True)
+    device_id = db.Column(db.String(50), primary_key=True)
+    resolution = db.Column(db.Integer, primary_key=True)  # Długość przedziału w sekundach
+    bucket = db.Column(db.Integer, primary_key=True)  # Początek przedziału (sekundy od epoki, czas UTC+1)
+    temperature_count = db.Column(db.Integer, nullable=False, default=0)
+    temperature_sum = db.Column(db.Float, nullable=False, default=0)
+    temperature_min = db.Column(db.Float, nullable=True)
+    temperature_max = db.Column(db.Float, nullable=True)
+    humidity_count = db.Column(db.Integer, nullable=False, default=0)
+    humidity_sum = db.Column(db.Float, nullable=False, default=0)
+    humidity_min = db.Column(db.Float, nullable=True)
+    humidity_max = db.Column(db.Float, nullable=True)
+    smoke_level_count = db.Column(db.Integer, nullable=False, default=0)
+    smoke_level_sum = db.Column(db.Float, nullable=False, default=0)
+    smoke_level_min = db.Column(db.Float, nullable=True)
+    smoke_level_max = db.Column(db.Float, nullable=True)
+
+
+def to_epoch(timestamp):
+    """Sekundy od epoki dla czasu bez strefy zapisanego w bazie"""
+    return calendar.timegm(timestamp.timetuple())
+
+
+def to_epoch_ms(timestamp):
+    """Milisekundy od epoki (zaokrąglone jak w SQLite, zgodnie z migracją)"""
+    return to_epoch(timestamp) * 1000 + (timestamp.microsecond + 500) // 1000
+
+
+def from_epoch_ms(ts):
+    """Czas bez strefy (jak w bazie) z milisekund od epoki"""
+    return datetime(1970, 1, 1) + timedelta(milliseconds=ts)
+
+
+def update_rollups(rows):
+    """Dodanie pomiarów do agregatów wszystkich rozdzielczości - bez commita"""
+    buckets = {}
+    for row in rows:
+        epoch = to_epoch(row["timestamp"])
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            key = (row["room_id"], row["device_id"], resolution, epoch - epoch % resolution)
+            bucket = buckets.setdefault(key, {
+                "room_id": key[0], "device_id": key[1], "resolution": key[2], "bucket": key[3],
+                **{f"{metric}_{part}": (0 if part in ("count", "sum") else None)
+                   for metric in ROLLUP_METRICS for part in ("count", "sum", "min", "max")}
+            })
+            for metric in ROLLUP_METRICS:
+                value = row.get(metric)
+                if value is None:
+                    continue
+                bucket[f"{metric}_count"] += 1
+                bucket[f"{metric}_sum"] += value
+                if bucket[f"{metric}_min"] is None or value < bucket[f"{metric}_min"]:
+                    bucket[f"{metric}_min"] = value
+                if bucket[f"{metric}_max"] is None or value > bucket[f"{metric}_max"]:
+                    bucket[f"{metric}_max"] = value
+    if not buckets:
+        return
+
+    stmt = sqlite_insert(SensorRollup)
+    excluded = stmt.excluded
+    update = {}
+    for metric in ROLLUP_METRICS:
+        for part in ("count", "sum"):
+            name = f"{metric}_{part}"
+            update[name] = getattr(SensorRollup, name) + excluded[name]
+        # Wielo-argumentowe min()/max() w SQLite zwraca NULL, gdy którakolwiek wartość to NULL
+        for part, func in (("min", db.func.min), ("max", db.func.max)):
+            name = f"{metric}_{part}"
+            column = getattr(SensorRollup, name)
+            update[name] = db.func.coalesce(func(column, excluded[name]), column, excluded[name])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SensorRollup.room_id, SensorRollup.device_id, SensorRollup.resolution, SensorRollup.bucket],
+        set_=update
+    )
+    db.session.execute(stmt, list(buckets.values()))
+
+
+def rebuild_rollups():
+    """Przeliczenie agregatów z pełnej historii pomiarów (np. dla istniejącej bazy)"""
+    SensorRollup.query.delete()
+    if COMPACT_STORAGE:
+        source, room_id, device_id = SensorReading, SensorKey.room_id, SensorKey.device_id
+        epoch = SensorReading.ts // 1000
+    else:
+        source, room_id, device_id = SensorData, SensorData.room_id, SensorData.device_id
+        epoch = db.cast(db.func.strftime('%s', SensorData.timestamp), db.Integer)
+    for resolution in ROLLUP_RESOLUTIONS.values():
+        bucket = (epoch // resolution) * resolution
+        columns = [room_id, device_id, db.literal(resolution), bucket]
+        names = ["room_id", "device_id", "resolution", "bucket"]
+        for metric in ROLLUP_METRICS:
+            column = getattr(source, metric)
+            columns += [db.func.count(column), db.func.total(column), db.func.min(column), db.func.max(column)]
+            names += [f"{metric}_count", f"{metric}_sum", f"{metric}_min", f"{metric}_max"]
+        query = db.select(*columns)
+        if COMPACT_STORAGE:
+            query = query.join(SensorKey, SensorKey.device_key == SensorReading.device_key)
+        else:
+            query = query.where(SensorData.timestamp.isnot(None))
+        query = query.group_by(room_id, device_id, bucket)
+        db.session.execute(db.insert(SensorRollup).from_select(names, query))
+    db.session.commit()
+
+
+def update_sensor_latest(rows):
+    """Upsert najnowszych pomiarów (rows zawierają data_id) - bez commita.
+    Najnowszy to pomiar o najpóźniejszym czasie (przy równym czasie - o większym data_id),
+    więc spóźniona paczka starszych pomiarów nie zastępuje bieżącego"""
+    def position(row):
+        return row["timestamp"], row["data_id"]
+
+    newest = {}
+    for row in rows:
+        key = (row["room_id"], row["device_id"])
+        if key not in newest or position(row) > position(newest[key]):
+            newest[key] = row
+    if not newest:
+        return
+
+    columns = ["data_id", "temperature", "humidity", "smoke_level", "timestamp"]
+    stmt = sqlite_insert(SensorLatest)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SensorLatest.room_id, SensorLatest.device_id],
+        set_={column: stmt.excluded[column] for column in columns},
+        # Nie nadpisujemy nowszego pomiaru starszym
+        where=db.tuple_(stmt.excluded.timestamp, stmt.excluded.data_id)
+        > db.tuple_(SensorLatest.timestamp, SensorLatest.data_id)
+    )
+    db.session.execute(stmt, [{key: row[key] for key in ["room_id", "device_id"] + columns} for row in newest.values()])
+
+
+def newest_row_readings():
+    """Najnowszy pomiar każdego urządzenia z tabeli sensor_data (w formacie dla update_sensor_latest)"""
+    ranked = db.select(SensorData.id, db.func.row_number().over(
+        partition_by=(SensorData.room_id, SensorData.device_id),
+        order_by=(SensorData.timestamp.desc(), SensorData.id.desc())
+    ).label('position')).subquery()
+    newest_ids = db.select(ranked.c.id).where(ranked.c.position == 1)
+    rows = db.session.execute(
+        db.select(SensorData).where(SensorData.id.in_(newest_ids))
+    ).scalars()
+    return [
+        {
+            "room_id": row.room_id,
+            "device_id": row.device_id,
+            "data_id": row.id,
+            "temperature": row.temperature,
+            "humidity": row.humidity,
+            "smoke_level": row.smoke_level,
+            "timestamp": row.timestamp
+        }
+        for row in rows
+    ]
+
+
+def newest_compact_readings():
+    """Najnowszy pomiar każdego urządzenia z tabeli sensor_reading - data_id to czas pomiaru w ms"""
+    newest = (
+        db.select(SensorReading.device_key, db.func.max(SensorReading.ts).label('ts'))
+        .group_by(SensorReading.device_key).subquery()
+    )
+    rows = db.session.execute(
+        db.select(SensorKey.room_id, SensorKey.device_id, SensorReading)
+        .join(newest, newest.c.device_key == SensorKey.device_key)
+        .join(SensorReading, db.and_(
+            SensorReading.device_key == newest.c.device_key, SensorReading.ts == newest.c.ts
+        ))
+    )
+    return [
+        {
+            "room_id": room_id,
+            "device_id": device_id,
+            "data_id": reading.ts,
+            "temperature": reading.temperature,
+            "humidity": reading.humidity,
+            "smoke_level": reading.smoke_level,
+            "timestamp": from_epoch_ms(reading.ts)
+        }
+        for room_id, device_id, reading in rows
+    ]
+
+
+def update_image_latest(section, image, image_out):
+    """Upsert najnowszych zdjęć sekcji po dodaniu nowej pary Image/ImageOut - bez commita"""
+    db.session.flush()  # Nadanie id nowym rekordom
+    stmt = sqlite_insert(ImageLatest).values(
+        section=section,
+        image_id=image.id,
+        image_out_id=image_out.id,
+        people_num=image_out.people_num,
+        timestamp=image_out.timestamp
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ImageLatest.section],
+        set_={column: stmt.excluded[column] for column in ["image_id", "image_out_id", "people_num", "timestamp"]},
+        # Analizy mogą kończyć się w innej kolejności niż przesłano zdjęcia
+        where=stmt.excluded.image_id >= ImageLatest.image_id
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_latest():
+    """Odbudowa tabel najnowszych wartości z pełnej historii (np. dla istniejącej bazy)"""
+    SensorLatest.query.delete()
+    update_sensor_latest(newest_compact_readings() if COMPACT_STORAGE else newest_row_readings())
+
+    ImageLatest.query.delete()
+    sections = db.session.execute(db.select(Image.section).distinct()).scalars().all()
+    for section in sections:
+        image = Image.query.filter_by(section=section).order_by(Image.id.desc()).first()
+        image_out = ImageOut.query.filter_by(section=section).order_by(ImageOut.id.desc()).first()
+        if image and image_out:
+            update_image_latest(section, image, image_out)
+    db.session.commit()
+
+
+def save_blob(data, mime_type):
+    """Zapis pliku w magazynie i rekordu Blob (bez commita), zwraca skrót"""
+    blob_hash = hashlib.sha256(data).hexdigest()
+    # Najpierw rekord - zajmuje blokadę zapisu bazy, więc czyszczenie nieużywanych plików
+    # (collect_unused_blobs) nie usunie pliku między jego zapisem a commitem tej transakcji
+    stmt = sqlite_insert(Blob).values(hash=blob_hash, size=len(data), mime_type=mime_type, created_on=utcplusone())
+    db.session.execute(stmt.on_conflict_do_nothing(index_elements=[Blob.hash]))
+    blob_store.put(data)
+    return blob_hash
+
+
+def save_renditions(source_hash, renditions):
+    """Zapis wersji zdjęcia {(rozmiar, format): dane} - bez commita"""
+    for (size, image_format), data in renditions.items():
+        stmt = sqlite_insert(ImageRendition).values(
+            source_hash=source_hash, size=size, format=image_format,
+            blob_hash=save_blob(data, IMAGE_MIME_TYPES[image_format])
+        )
+        db.session.execute(stmt.on_conflict_do_nothing())
+
+
+def read_blob(blob_hash):
+    """Odczyt zawartości pliku z magazynu"""
+    return blob_store.get(blob_hash)
+
+
+def migrate_image_blobs(model):
+    """Przeniesienie zdjęć z kolumny image_data starej tabeli do magazynu plików"""
+    table = model.__table__
+    legacy_name = f"{table.name}_legacy"
+    connection = db.session.connection()
+    # Indeksy przechodzą razem z tabelą przy zmianie nazwy, więc usuwamy je przed odtworzeniem tabeli
+    for index in table.indexes:
+        connection.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    connection.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {legacy_name}")
+    table.create(bind=connection)
+
+    # Kolumny bez zmian kopiujemy jednym zapytaniem, skróty plików uzupełniamy partiami
+    columns = ', '.join(column.name for column in table.columns if column.name != 'blob_hash')
+    connection.exec_driver_sql(
+        f"INSERT INTO {table.name} ({columns}, blob_hash) SELECT {columns}, '' FROM {legacy_name}"
+    )
+    last_id = 0
+    while True:
+        rows = connection.exec_driver_sql(
+            f"SELECT id, image_data FROM {legacy_name} WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, BLOB_MIGRATION_BATCH)
+        ).all()
+        if not rows:
+            break
+        for row_id, image_data in rows:
+            connection.execute(
+                db.update(table).where(table.c.id == row_id).values(blob_hash=save_blob(image_data, 'image/jpeg'))
+            )
+            last_id = row_id
+    connection.exec_driver_sql(f"DROP TABLE {legacy_name}")
+
+
+def migrate_schema():
+    """Migracja istniejącej bazy: zdjęcia do magazynu plików i brakujące indeksy
+    (create_all tworzy indeksy tylko dla nowych tabel)"""
+    inspector = db.inspect(db.engine)
+    migrated = False
+    for model in (Image, ImageOut):
+        if 'image_data' in [column['name'] for column in inspector.get_columns(model.__tablename__)]:
+            migrate_image_blobs(model)
+            migrated = True
+    db.session.commit()
+    if migrated:
+        # Zwolnienie miejsca po usuniętych danych zdjęć
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("VACUUM")
+
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+    # Tryb auto_vacuum zmienia się w istniejącej bazie dopiero po pełnym VACUUM (jednorazowo)
+    if db.session.execute(db.text("PRAGMA auto_vacuum")).scalar() != 2:
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+            connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.exec_driver_sql("VACUUM")
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Ustawienia SQLite dla każdego nowego połączenia"""
+    cursor = dbapi_connection.cursor()
+    # Dla nowej bazy - miejsce po usuniętych danych zwalniane przez PRAGMA incremental_vacuum
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # Odczyty nie blokują zapisów, a commit dopisuje tylko do pliku WAL
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+    cursor.close()
 
 
 # Tworzenie tabel w bazie danych jeśli nie istnieją
 with app.app_context():
+    db.event.listen(db.engine, 'connect', set_sqlite_pragmas)
     db.create_all()
+    migrate_schema()
+    # Wypełnienie tabel najnowszych wartości dla bazy utworzonej przed ich wprowadzeniem
+    readings_model = SensorReading if COMPACT_STORAGE else SensorData
+    if not SensorLatest.query.first() and readings_model.query.first():
+        rebuild_latest()
+    if not SensorRollup.query.first() and readings_model.query.first():
+        rebuild_rollups()
+
+
+# Metryki w formacie Prometheusa (/metrics) - pomiar to kilka operacji pod blokadą,
+# więc zbieranie może być stale włączone
+metrics = Registry()
+# Jak często odświeżane są liczby wierszy w tabelach (COUNT(*) czyta całą tabelę) (s)
+METRICS_ROW_COUNT_TTL = float(os.environ.get('METRICS_ROW_COUNT_TTL', 60))
+REQUEST_COUNT = metrics.counter('http_requests_total', 'Liczba obsłużonych żądań', ['method', 'route', 'status'])
+REQUEST_LATENCY = metrics.histogram(
+    'http_request_duration_seconds', 'Czas obsługi żądania (do wysłania nagłówków)', ['method', 'route', 'status']
+)
+DB_QUERY_LATENCY = metrics.histogram(
+    'db_query_duration_seconds', 'Czas wykonania zapytania SQL', ['statement'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+DB_COMMIT_LATENCY = metrics.histogram('db_commit_duration_seconds', 'Czas zatwierdzenia transakcji (z flush)')
+INFERENCE_BATCH_SIZE = metrics.histogram(
+    'inference_batch_size', 'Liczba zdjęć w paczce analizy', buckets=(1, 2, 4, 8, 16, 32)
+)
+INFERENCE_QUEUE_WAIT = metrics.histogram('inference_queue_wait_seconds', 'Czas oczekiwania zdjęcia na analizę')
+INFERENCE_BATCH_LATENCY = metrics.histogram('inference_batch_duration_seconds', 'Czas analizy paczki zdjęć')
+INFERENCE_STAGE_LATENCY = metrics.histogram(
+    'inference_stage_duration_seconds', 'Czas etapów analizy paczki (decode, detect, encode)', ['stage']
+)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Czas startu w kontekście wykonania - zapytanie zakończone błędem nie zostawia go dla kolejnych
+    context._query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = context._query_start
+    # Etykietą jest tylko rodzaj zapytania (SELECT, INSERT...), aby liczba serii była stała
+    DB_QUERY_LATENCY.observe(time.perf_counter() - start, statement=statement.lstrip().split(None, 1)[0].upper())
+
+
+def before_commit(session):
+    session.info['commit_start'] = time.perf_counter()
+
+
+def after_commit(session):
+    start = session.info.pop('commit_start', None)
+    if start is not None:
+        DB_COMMIT_LATENCY.observe(time.perf_counter() - start)
+
+
+def observe_inference_batch(size, waits, duration, timings):
+    INFERENCE_BATCH_SIZE.observe(size)
+    for wait in waits:
+        INFERENCE_QUEUE_WAIT.observe(wait)
+    INFERENCE_BATCH_LATENCY.observe(duration)
+    for stage, stage_time in timings.items():
+        INFERENCE_STAGE_LATENCY.observe(stage_time, stage=stage)
+
+
+def database_size():
+    """Rozmiar pliku bazy wraz z plikiem WAL (B)"""
+    path = db.engine.url.database
+    return {
+        (name,): os.path.getsize(path + suffix)
+        for name, suffix in [('main', ''), ('wal', '-wal')] if os.path.exists(path + suffix)
+    }
+
+
+def table_row_counts():
+    with app.app_context():
+        return {
+            (model.__tablename__,): db.session.execute(db.select(db.func.count()).select_from(model)).scalar()
+            for model in [SensorData, SensorReading, Image, ImageOut, Blob, InferenceJob]
+        }
+
+
+with app.app_context():
+    db.event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    db.event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+db.event.listen(db.session, 'before_commit', before_commit)
+db.event.listen(db.session, 'after_commit', after_commit)
+inference_queue.on_batch = observe_inference_batch
+
+metrics.gauge('inference_jobs_pending', 'Zadania analizy oczekujące lub w trakcie', lambda: inference_queue.pending())
+metrics.gauge('sensor_writer_pending', 'Zlecenia zapisu pomiarów w kolejce', lambda: sensor_writer.pending())
+metrics.gauge('sensor_writer_commits_total', 'Transakcje zatwierdzone przez wątek zapisu',
+              lambda: sensor_writer.commits, type_name='counter')
+metrics.gauge('sensor_writer_writes_total', 'Zlecenia zapisane przez wątek zapisu',
+              lambda: sensor_writer.writes, type_name='counter')
+metrics.gauge('frame_cache_hits_total', 'Klatki, dla których użyto wyniku poprzedniej analizy',
+              lambda: frame_cache.hits, type_name='counter')
+metrics.gauge('frame_cache_misses_total', 'Klatki wysłane do analizy mimo sprawdzenia pamięci podręcznej',
+              lambda: frame_cache.misses, type_name='counter')
+metrics.gauge('mqtt_bridge_messages_total', 'Wiadomości odebrane przez most MQTT wg wyniku',
+              lambda: mqtt_bridge and {
+                  result: mqtt_bridge.stats()[result] for result in ['stored', 'duplicates', 'invalid', 'failed']
+              }, ['result'], type_name='counter')
+metrics.gauge('mqtt_bridge_pending', 'Wiadomości MQTT oczekujące na zapis',
+              lambda: mqtt_bridge and mqtt_bridge.pending())
+metrics.gauge('events_subscribers', 'Otwarte strumienie zdarzeń SSE', lambda: event_bus.subscribers())
+metrics.gauge('events_dropped_total', 'Subskrybenci SSE odłączeni z powodu pełnego bufora',
+              lambda: event_bus.dropped, type_name='counter')
+metrics.gauge('database_size_bytes', 'Rozmiar plików bazy danych', database_size, ['file'])
+metrics.gauge('database_rows', 'Liczba wierszy w tabelach (odświeżana co METRICS_ROW_COUNT_TTL s)',
+              CachedValue(table_row_counts, METRICS_ROW_COUNT_TTL), ['table'])
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Szablon trasy zamiast ścieżki, aby id pokoi i urządzeń nie tworzyły nowych serii
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = dict(method=request.method, route=route, status=response.status_code)
+        REQUEST_COUNT.inc(**labels)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, **labels)
+    return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Metryki serwera w formacie tekstowym Prometheusa"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # Namespace i modele dla RESTx
 ns = api.namespace('rooms', description='Zarządzanie urządzeniami i danymi w pokojach')
@@ -100,6 +780,195 @@ data_model = api.model('SensorData', {
     'smoke_level': fields.Integer(description='Poziom zadymienia')
 })
 
+reading_model = api.model('SensorReading', {
+    'device_id': fields.String(required=True, description='ID urządzenia'),
+    'temperature': fields.Float(description='Temperatura'),
+    'humidity': fields.Float(description='Wilgotność'),
+    'smoke_level': fields.Integer(description='Poziom zadymienia'),
+    'timestamp': fields.DateTime(description='Czas pomiaru po stronie urządzenia (ISO 8601, opcjonalny)')
+})
+
+batch_model = api.model('SensorReadingBatch', {
+    'readings': fields.List(fields.Nested(reading_model), required=True, description='Lista pomiarów')
+})
+
+
+def parse_timestamp(value):
+    """Zamiana znacznika czasu ISO 8601 na czas lokalny (UTC+1) bez strefy, tak jak w bazie"""
+    if value is None:
+        return None
+    timestamp = datetime.fromisoformat(str(value))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None) + timedelta(hours=1)
+    return timestamp
+
+
+def encode_cursor(last_id):
+    """Nieprzezroczysty kursor stronicowania (id ostatniego zwróconego rekordu)"""
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Odczyt kursora stronicowania - ValueError dla nieprawidłowej wartości"""
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"])
+    except (TypeError, KeyError, json.JSONDecodeError, UnicodeDecodeError, base64.binascii.Error) as e:
+        raise ValueError(f"Nieprawidłowy kursor: {e}")
+
+
+def invalid_measurement(reading):
+    """Nazwa pierwszego pola pomiaru, które nie jest liczbą ani null (None, gdy pomiar jest poprawny)"""
+    for field in ROLLUP_METRICS:
+        value = reading.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return field
+    return None
+
+
+def reading_rows(room_id, readings):
+    """Wiersze SensorData dla listy pomiarów z pokoju"""
+    return [
+        {
+            "room_id": room_id,
+            "device_id": reading["device_id"],
+            "temperature": reading.get("temperature"),
+            "humidity": reading.get("humidity"),
+            "smoke_level": reading.get("smoke_level"),
+            # Wszystkie wiersze muszą mieć te same klucze, więc domyślny czas ustawiamy tutaj
+            "timestamp": reading.get("timestamp") or utcplusone()
+        }
+        for reading in readings
+    ]
+
+
+# Klucze urządzeń zwartego układu pomiarów: (room_id, device_id) -> device_key (klucze się nie zmieniają)
+_device_keys = {}
+_device_keys_lock = threading.Lock()
+
+
+def device_keys(pairs, create=False):
+    """Klucze device_key dla par (room_id, device_id) - z create=True brakujące są tworzone (bez commita)"""
+    pairs = set(pairs)
+    with _device_keys_lock:
+        result = {pair: _device_keys[pair] for pair in pairs if pair in _device_keys}
+
+    def select_keys(missing):
+        found = {}
+        for room_id, device_id in missing:
+            key = db.session.execute(
+                db.select(SensorKey.device_key).filter_by(room_id=room_id, device_id=device_id)
+            ).scalar()
+            if key is not None:
+                found[(room_id, device_id)] = key
+        return found
+
+    found = select_keys(pairs - result.keys())
+    with _device_keys_lock:
+        _device_keys.update(found)
+    result.update(found)
+
+    missing = pairs - result.keys()
+    if missing and create:
+        db.session.execute(
+            sqlite_insert(SensorKey).on_conflict_do_nothing(index_elements=[SensorKey.room_id, SensorKey.device_id]),
+            [{"room_id": room_id, "device_id": device_id} for room_id, device_id in missing]
+        )
+        # Klucze z niezatwierdzonej transakcji nie trafiają do pamięci - mogą zostać wycofane
+        result.update(select_keys(missing))
+    return result
+
+
+def insert_compact_rows(rows):
+    """Wstawienie pomiarów do sensor_reading - zwraca listę zgodną z rows: wstawiony wiersz z data_id
+    (czas pomiaru w ms) i czasem zaokrąglonym do ms, tak jak w sensor_reading, albo None dla powtórzenia"""
+    keys = device_keys({(row["room_id"], row["device_id"]) for row in rows}, create=True)
+    values = [
+        {
+            "device_key": keys[(row["room_id"], row["device_id"])],
+            "ts": to_epoch_ms(row["timestamp"]),
+            "temperature": row["temperature"],
+            "humidity": row["humidity"],
+            "smoke_level": row["smoke_level"]
+        }
+        for row in rows
+    ]
+    # Pomiar urządzenia z tą samą milisekundą to powtórzenie - zostaje pierwszy zapis
+    stmt = sqlite_insert(SensorReading).on_conflict_do_nothing()
+    stmt = stmt.returning(SensorReading.device_key, SensorReading.ts)
+    inserted = {tuple(key) for key in db.session.execute(stmt, values)}
+    stored = []
+    for row, value in zip(rows, values):
+        key = (value["device_key"], value["ts"])
+        # Powtórzenie w obrębie paczki - wstawiony został tylko pierwszy wiersz
+        if key in inserted:
+            inserted.discard(key)
+            stored.append(dict(row, data_id=value["ts"], timestamp=from_epoch_ms(value["ts"])))
+        else:
+            stored.append(None)
+    return stored
+
+
+def insert_reading_rows(rows):
+    """Wstawienie zbiorcze wierszy pomiarów wraz z najnowszymi wartościami i agregatami (bez commita),
+    zwraca listę zgodną z rows: zapisany wiersz albo None dla pominiętego powtórzenia"""
+    if not rows:
+        return []
+    if COMPACT_STORAGE:
+        stored = insert_compact_rows(rows)
+    else:
+        ids = db.session.execute(
+            db.insert(SensorData).returning(SensorData.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        stored = [dict(row, data_id=data_id) for row, data_id in zip(rows, ids)]
+    # Aktualizacja najnowszych wartości i agregatów w tej samej transakcji - tylko o zapisane pomiary
+    saved = [row for row in stored if row is not None]
+    update_sensor_latest(saved)
+    update_rollups(saved)
+    return stored
+
+
+def flush_readings(payloads):
+    """Zapis zleceń (room_id, pomiary) z wielu żądań w jednej transakcji - wywoływane przez sensor_writer"""
+    with app.app_context():
+        rows = [reading_rows(room_id, readings) for room_id, readings in payloads]
+        try:
+            stored = insert_reading_rows(list(itertools.chain.from_iterable(rows)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        # Powiadomienie subskrybentów dopiero po zatwierdzeniu transakcji - tylko o zapisanych pomiarach
+        counts = []
+        stored = iter(stored)
+        for item in rows:
+            saved = [row for row in itertools.islice(stored, len(item)) if row is not None]
+            for row in saved:
+                publish_reading(row)
+            counts.append(len(saved))
+        return counts
+
+
+def publish_reading(row):
+    event_bus.publish(row["room_id"], 'reading', {
+        "temperature": row["temperature"],
+        "humidity": row["humidity"],
+        "smoke_level": row["smoke_level"],
+        "timestamp": row["timestamp"].isoformat()
+    }, device_id=row["device_id"])
+
+
+# Wątek zapisu pomiarów - wiele żądań zatwierdzanych jednym commitem (jednym fsync)
+sensor_writer = GroupCommitWriter(
+    flush_readings,
+    max_batch=int(os.environ.get('WRITER_MAX_BATCH', 1000)),
+    max_latency_ms=float(os.environ.get('WRITER_MAX_LATENCY_MS', 5))
+)
+
+
+def write_readings(room_id, readings):
+    """Zapis pomiarów przez wątek zapisu - kończy się po trwałym zapisaniu w bazie"""
+    return sensor_writer.write((room_id, readings), timeout=WRITER_TIMEOUT)
+
 
 @ns.route('/<string:room_id>/sensor-devices')
 class SensorDeviceResource(Resource):
@@ -169,6 +1038,13 @@ class DeleteSensorDeviceResource(Resource):
 
         # Usuń urządzenie
         db.session.delete(sensor_device)
+        SensorData.query.filter_by(room_id=room_id, device_id=device_id).delete()
+        key = device_keys([(room_id, device_id)]).get((room_id, device_id))
+        if key is not None:
+            # W układzie compact pomiary nie są powiązane relacją z urządzeniem
+            SensorReading.query.filter_by(device_key=key).delete()
+        SensorLatest.query.filter_by(room_id=room_id, device_id=device_id).delete()
+        SensorRollup.query.filter_by(room_id=room_id, device_id=device_id).delete()
         db.session.commit()
 
         return {"message": "Urządzenie czujnikowe zostało usunięte"}, 200
@@ -191,30 +1067,163 @@ class DeleteCameraDeviceResource(Resource):
         return {"message": "Urządzenie kamery zostało usunięte"}, 200
 
 
+class LimitsCache:
+    """Pamięć podręczna limitów w procesie: (room_id, device_id) -> (ETag, limity), unieważniana przy zapisie"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Licznik unieważnień - wynik odczytu sprzed zapisu nie może trafić do pamięci po nim
+        self.generation = 0
+
+    def get(self, room_id, device_id):
+        with self._lock:
+            entry = self._entries.get((room_id, device_id))
+        if entry is None or time.monotonic() - entry[2] > self.ttl:
+            return None
+        return entry[0], entry[1]
+
+    def put(self, room_id, device_id, etag, limits, generation):
+        """Zapamiętanie limitów wczytanych, gdy licznik unieważnień miał wartość generation"""
+        with self._lock:
+            if generation == self.generation:
+                self._entries[(room_id, device_id)] = (etag, limits, time.monotonic())
+
+    def invalidate(self, room_id):
+        # Zmiana limitów pokoju wpływa na wszystkie urządzenia bez własnych limitów
+        with self._lock:
+            self.generation += 1
+            for key in [key for key in self._entries if key[0] == room_id]:
+                del self._entries[key]
+
+
+limits_cache = LimitsCache(LIMITS_CACHE_TTL)
+
+
+def limits_json(limits):
+    """Limity w odpowiedzi API (None, gdy nie ustawiono)"""
+    if limits is None:
+        return None
+    return {
+        "temperature": limits.temperature,
+        "humidity": limits.humidity,
+        "smoke_level": limits.smoke_level,
+        "people_num": limits.people,
+        "version": limits.version
+    }
+
+
+def load_limits(room_id, device_id):
+    """Limity urządzenia (lub pokoju) z pamięci podręcznej albo bazy - zwraca (ETag, limity lub None)"""
+    cached = limits_cache.get(room_id, device_id)
+    if cached is not None:
+        return cached
+
+    generation = limits_cache.generation
+    limits = db.session.get(SensorLimits, (room_id, device_id))
+    if limits is None and device_id != ROOM_LIMITS:
+        limits = db.session.get(SensorLimits, (room_id, ROOM_LIMITS))
+    # Wersja i źródło limitów (urządzenie lub pokój) jednoznacznie określają zawartość
+    etag = f"{limits.device_id}-{limits.version}" if limits is not None else None
+    result = limits_json(limits)
+    limits_cache.put(room_id, device_id, etag, result, generation)
+    return etag, result
+
+
+# Pola limitów w żądaniu -> kolumny SensorLimits (people_num jak w odpowiedzi GET)
+LIMIT_FIELDS = [('temperature', 'temperature'), ('humidity', 'humidity'), ('smoke_level', 'smoke_level'),
+                ('people', 'people'), ('people_num', 'people')]
+
+
+def invalid_limits(data):
+    """Opis błędu w przesłanych limitach (None, gdy są poprawne) - sprawdzane przed zapisem wersji"""
+    if not data or not isinstance(data, dict) or not any(key in data for key, _ in LIMIT_FIELDS):
+        return "Brak danych do zapisania"
+    for key, _ in LIMIT_FIELDS:
+        value = data.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return f"Pole {key} musi być liczbą"
+    return None
+
+
+def save_limits(room_id, device_id, data):
+    """Zapis limitów przesłanych w żądaniu (tylko podane wartości) - zwraca nową wersję"""
+    values = {}
+    for key, column in LIMIT_FIELDS:
+        if key in data:
+            values[column] = data[key]
+    # Wersja zwiększana w SQL w tym samym poleceniu - równoczesne zapisy dostają różne wersje
+    stmt = sqlite_insert(SensorLimits).values(room_id=room_id, device_id=device_id, version=1, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SensorLimits.room_id, SensorLimits.device_id],
+        set_=dict(values, version=SensorLimits.version + 1, updated_on=utcplusone())
+    ).returning(SensorLimits).execution_options(populate_existing=True)
+    # Wartości odczytane przed commitem - po nim obiekt byłby wczytany ponownie, być może już z cudzą zmianą
+    saved = limits_json(db.session.execute(stmt).scalar_one())
+    db.session.commit()
+    limits_cache.invalidate(room_id)
+    # Limity pokoju dotyczą wszystkich urządzeń, więc zdarzenie nie ma device_id
+    event_bus.publish(room_id, 'limits', saved, device_id=None if device_id == ROOM_LIMITS else device_id)
+    return saved["version"]
+
+
+def limits_response(room_id, device_id):
+    """Odpowiedź GET dla limitów z obsługą If-None-Match (304 bez odczytu bazy)"""
+    etag, limits = load_limits(room_id, device_id)
+    if limits is None:
+        return {"error": "Nie ustawiono limitów"}, 404
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return limits, 200, {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+
+
+limits_model = api.model('SensorLimits', {
+    'temperature': fields.Float(description='Limit temperatury'),
+    'humidity': fields.Float(description='Limit wilgotności'),
+    'smoke_level': fields.Float(description='Limit zadymienia'),
+    'people': fields.Integer(description='Limit liczby osób')
+})
+
+
+@ns.route('/<string:room_id>/sensor-devices/limits')
+class RoomLimitsResource(Resource):
+    @api.expect(limits_model)
+    def put(self, room_id):
+        """Ustaw limity dla wszystkich urządzeń w pokoju"""
+        data = request.get_json()
+        error = invalid_limits(data)
+        if error:
+            return {"error": error}, 400
+
+        version = save_limits(room_id, ROOM_LIMITS, data)
+
+        return {"message": "Dane zaktualizowane pomyślnie", "version": version}, 200
+
+    def get(self, room_id):
+        """Pobierz limity pokoju (ETag - wersja limitów)"""
+        return limits_response(room_id, ROOM_LIMITS)
+
+
 @ns.route('/<string:room_id>/sensor-devices/<string:device_id>/limits')
 class SensorLimitsResource(Resource):
-    @api.expect(data_model)
+    @api.expect(limits_model)
     def put(self, room_id, device_id):
+        """Ustaw limity dla urządzenia"""
         data = request.get_json()
-        if not data:
-            return {"error": "Brak danych do zapisania"}, 400
+        error = invalid_limits(data)
+        if error:
+            return {"error": error}, 400
 
-        self.temp_limit = data.get('temperature')
-        self.hum_limit = data.get('humidity')
-        self.smoke_limit = data.get('smoke_level')
-        self.ppl_limit = data.get('people')
+        version = save_limits(room_id, device_id, data)
 
-        return {"message": "Dane zaktualizowane pomyślnie"}, 200
+        return {"message": "Dane zaktualizowane pomyślnie", "version": version}, 200
 
     def get(self, room_id, device_id):
-        limits = {
-            "temp limit": self.temp_limit,
-            "hum_limit": self.hum_limit,
-            "smoke_limit": self.smoke_limit,
-            "ppl_limit": self.ppl_limit
-        }
-
-        return limits, {200}
+        """Pobierz limity urządzenia lub, jeśli ich nie ustawiono, limity pokoju (ETag - wersja limitów)"""
+        return limits_response(room_id, device_id)
 
 
 @ns.route('/<string:room_id>/sensor-devices/<string:device_id>/data')
@@ -224,34 +1233,29 @@ class SensorDataResource(Resource):
         """Aktualizuj dane z czujnika"""
 
         data = request.get_json()
-        if not data:
+        if not data or not isinstance(data, dict):
             return {"error": "Brak danych do zapisania"}, 400
-
-        temperature = data.get('temperature')
-        humidity = data.get('humidity')
-        smoke_level = data.get('smoke_level')
+        field = invalid_measurement(data)
+        if field:
+            return {"error": f"Pole {field} musi być liczbą"}, 400
 
         # Utwórz nowy rekord z danymi
-        new_record = SensorData(
-            room_id=room_id,
-            device_id=device_id,
-            temperature=temperature,
-            humidity=humidity,
-            smoke_level=smoke_level
-        )
-        db.session.add(new_record)
-        db.session.commit()
+        try:
+            write_readings(room_id, [{
+                "device_id": device_id,
+                "temperature": data.get('temperature'),
+                "humidity": data.get('humidity'),
+                "smoke_level": data.get('smoke_level')
+            }])
+        except TimeoutError:
+            return {"error": "Przekroczono czas oczekiwania na zapis danych"}, 503
 
         return {"message": "Dane zaktualizowane pomyślnie"}, 200
 
     def get(self, room_id, device_id):
         """Pobierz najnowsze dane z czujnika na podstawie id"""
-        # Pobierz rekord o najwyższym id dla podanego room_id i device_id
-        latest_data = (
-            SensorData.query.filter_by(room_id=room_id, device_id=device_id)
-            .order_by(SensorData.id.desc())  # Sortowanie malejące po id
-            .first()  # Pobierz pierwszy rekord
-        )
+        # Pobierz najnowszy rekord z tabeli najnowszych wartości
+        latest_data = db.session.get(SensorLatest, (room_id, device_id))
 
         if not latest_data:
             return {"error": "Nie znaleziono danych dla urządzenia"}, 404
@@ -268,23 +1272,529 @@ class SensorDataResource(Resource):
         return {"data": result}, 200
 
 
+@ns.route('/<string:room_id>/sensor-data/batch')
+class SensorDataBatchResource(Resource):
+    @api.expect(batch_model)
+    def post(self, room_id):
+        """Zapisz paczkę pomiarów z wielu czujników w jednej transakcji"""
+        data = request.get_json(silent=True)
+        # Dopuszczamy zarówno {"readings": [...]} jak i samą listę
+        readings = data.get('readings') if isinstance(data, dict) else data
+        if not readings or not isinstance(readings, list):
+            return {"error": "Brak danych do zapisania"}, 400
+
+        parsed = []
+        for index, reading in enumerate(readings):
+            if not isinstance(reading, dict) or not reading.get('device_id'):
+                return {"error": f"Pomiar nr {index} nie zawiera device_id"}, 400
+            if not isinstance(reading['device_id'], str):
+                return {"error": f"Pole device_id w pomiarze nr {index} musi być tekstem"}, 400
+            field = invalid_measurement(reading)
+            if field:
+                return {"error": f"Pole {field} w pomiarze nr {index} musi być liczbą"}, 400
+            try:
+                timestamp = parse_timestamp(reading.get('timestamp'))
+            except ValueError:
+                return {"error": f"Nieprawidłowy znacznik czasu w pomiarze nr {index}"}, 400
+            parsed.append(dict(reading, timestamp=timestamp))
+
+        # Jedno wstawienie zbiorcze w jednej transakcji dla całej paczki
+        try:
+            count = write_readings(room_id, parsed)
+        except TimeoutError:
+            return {"error": "Przekroczono czas oczekiwania na zapis danych"}, 503
+
+        return {"message": "Dane zaktualizowane pomyślnie", "count": count}, 200
+
+
+@ns.route('/<string:room_id>/events')
+class RoomEventsResource(Resource):
+    @api.doc(params={
+        'device_id': 'Tylko zdarzenia danego urządzenia (oraz zdarzenia całego pokoju)',
+        'types': f'Typy zdarzeń rozdzielone przecinkami: {", ".join(EVENT_TYPES)}'
+    })
+    def get(self, room_id):
+        """Strumień zdarzeń (Server-Sent Events): nowe pomiary, liczba osób i zmiany limitów"""
+        types = request.args.get('types')
+        types = [item.strip() for item in types.split(',') if item.strip()] if types else None
+        if types and not set(types) <= set(EVENT_TYPES):
+            return {"error": f"Nieznany typ zdarzenia, dozwolone: {', '.join(EVENT_TYPES)}"}, 400
+
+        subscription = event_bus.subscribe(room_id, request.args.get('device_id'), types)
+
+        def stream():
+            try:
+                # Pierwszy komentarz od razu potwierdza klientowi otwarcie strumienia
+                yield ": connected\n\n"
+                while True:
+                    event = subscription.get(timeout=EVENTS_KEEPALIVE)
+                    if event is not None:
+                        yield format_sse(event)
+                    elif subscription.dropped:
+                        # Klient nie nadążał - kończymy strumień, a klient połączy się ponownie
+                        return
+                    else:
+                        yield ": keepalive\n\n"
+            finally:
+                subscription.close()
+
+        return Response(stream(), mimetype='text/event-stream', headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        })
+
+
+def reading_history(room_id, device_id, metric_type, after_id=None, time_from=None, time_to=None, limit=None):
+    """Pomiary urządzenia (id, wartość, czas) w kolejności zapisu, z pominięciem pustych wartości.
+    Stronicowanie po kluczu (id > after_id) zamiast OFFSET - w układzie compact id to czas w ms"""
+    if COMPACT_STORAGE:
+        key = device_keys([(room_id, device_id)]).get((room_id, device_id))
+        if key is None:
+            return iter(())
+        column = getattr(SensorReading, metric_type)
+        query = db.select(SensorReading.ts, column).where(SensorReading.device_key == key, column.isnot(None))
+        if after_id is not None:
+            query = query.where(SensorReading.ts > after_id)
+        if time_from is not None:
+            query = query.where(SensorReading.ts >= to_epoch_ms(time_from))
+        if time_to is not None:
+            query = query.where(SensorReading.ts < to_epoch_ms(time_to))
+        query = query.order_by(SensorReading.ts).limit(limit).execution_options(yield_per=HISTORY_YIELD_PER)
+        return ((ts, value, from_epoch_ms(ts)) for ts, value in db.session.execute(query))
+
+    column = getattr(SensorData, metric_type)
+    query = (
+        db.select(SensorData.id, column, SensorData.timestamp)
+        .filter_by(room_id=room_id, device_id=device_id)
+        .where(column.isnot(None))
+    )
+    if after_id is not None:
+        query = query.where(SensorData.id > after_id)
+    if time_from is not None:
+        query = query.where(SensorData.timestamp >= time_from)
+    if time_to is not None:
+        query = query.where(SensorData.timestamp < time_to)
+    query = query.order_by(SensorData.id).limit(limit).execution_options(yield_per=HISTORY_YIELD_PER)
+    return iter(db.session.execute(query))
+
+
 @ns.route('/<string:room_id>/sensor-devices/<string:device_id>/data/<string:metric_type>')
 class MetricDataResource(Resource):
+    @api.doc(params={
+        'from': 'Początek zakresu czasu (ISO 8601, włącznie)',
+        'to': 'Koniec zakresu czasu (ISO 8601, wyłącznie)',
+        'limit': f'Maksymalna liczba rekordów (domyślnie {HISTORY_DEFAULT_LIMIT}, maks. {HISTORY_MAX_LIMIT})',
+        'cursor': 'Kursor następnej strony (next_cursor z poprzedniej odpowiedzi)'
+    })
     def get(self, room_id, device_id, metric_type):
-        """Pobierz dane dla konkretnego typu pomiaru"""
+        """Pobierz dane dla konkretnego typu pomiaru (stronicowane, strumieniowane)"""
         if metric_type not in ["temperature", "humidity", "smoke_level"]:
             return {"error": "Nieprawidłowy typ pomiaru, oczekiwano: temperature, humidity lub smoke_level"}, 400
 
-        data = SensorData.query.filter_by(room_id=room_id, device_id=device_id).all()
-        if not data:
+        try:
+            time_from = parse_timestamp(request.args.get('from'))
+            time_to = parse_timestamp(request.args.get('to'))
+        except ValueError:
+            return {"error": "Nieprawidłowy znacznik czasu, oczekiwano formatu ISO 8601"}, 400
+        try:
+            limit = min(int(request.args.get('limit', HISTORY_DEFAULT_LIMIT)), HISTORY_MAX_LIMIT)
+            if limit <= 0:
+                raise ValueError
+            cursor = request.args.get('cursor')
+            after_id = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return {"error": "Nieprawidłowy limit lub kursor"}, 400
+
+        rows = reading_history(room_id, device_id, metric_type, after_id, time_from, time_to, limit)
+        first = next(rows, None)
+        if first is None and cursor is None:
             return {"error": "Nie znaleziono danych dla urządzenia"}, 404
 
-        result = [
-            {"id": record.id, metric_type: getattr(record, metric_type), "timestamp": record.timestamp}
-            for record in data if getattr(record, metric_type) is not None
-        ]
+        def generate():
+            # Rekordy są serializowane pojedynczo, więc pamięć nie zależy od zakresu
+            yield '{"data": ['
+            count = 0
+            last_id = None
+            if first is not None:
+                for record_id, value, timestamp in itertools.chain([first], rows):
+                    yield (',' if count else '') + json.dumps(
+                        {"id": record_id, metric_type: value, "timestamp": timestamp.isoformat()}
+                    )
+                    count += 1
+                    last_id = record_id
+            next_cursor = encode_cursor(last_id) if count == limit else None
+            yield '], "next_cursor": ' + json.dumps(next_cursor) + '}\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+@ns.route('/<string:room_id>/sensor-devices/<string:device_id>/aggregates')
+class AggregatesResource(Resource):
+    @api.doc(params={
+        'from': 'Początek zakresu czasu (ISO 8601), domyślnie doba przed "to"',
+        'to': 'Koniec zakresu czasu (ISO 8601), domyślnie teraz',
+        'bucket': 'Długość przedziału w sekundach lub minute/hour/day (domyślnie hour)',
+        'metrics': 'Lista pomiarów oddzielona przecinkami (domyślnie wszystkie)'
+    })
+    def get(self, room_id, device_id):
+        """Pobierz min/max/średnią pomiarów w przedziałach czasu z tabel agregatów"""
+        bucket_arg = request.args.get('bucket', 'hour')
+        try:
+            bucket_size = ROLLUP_RESOLUTIONS[bucket_arg] if bucket_arg in ROLLUP_RESOLUTIONS else int(bucket_arg)
+            time_to = parse_timestamp(request.args.get('to')) or utcplusone()
+            time_from = parse_timestamp(request.args.get('from')) or time_to - timedelta(days=1)
+        except ValueError:
+            return {"error": "Nieprawidłowy parametr bucket, from lub to"}, 400
+
+        metrics = request.args.get('metrics', ','.join(ROLLUP_METRICS)).split(',')
+        if any(metric not in ROLLUP_METRICS for metric in metrics):
+            return {"error": "Nieprawidłowy typ pomiaru, oczekiwano: temperature, humidity lub smoke_level"}, 400
+
+        finest = min(ROLLUP_RESOLUTIONS.values())
+        if bucket_size <= 0 or bucket_size % finest:
+            return {"error": f"Długość przedziału musi być wielokrotnością {finest} s"}, 400
+
+        # Granice zakresu wyrównane do najmniejszej rozdzielczości
+        epoch_from = to_epoch(time_from) // finest * finest
+        epoch_to = -(-to_epoch(time_to) // finest) * finest
+        if epoch_to <= epoch_from:
+            return {"error": "Koniec zakresu musi być późniejszy niż początek"}, 400
+        if (epoch_to - epoch_from) // bucket_size > AGGREGATES_MAX_BUCKETS:
+            return {"error": f"Zbyt wiele przedziałów (maks. {AGGREGATES_MAX_BUCKETS})"}, 400
+
+        # Najgrubsza rozdzielczość, która dzieli przedział i jest wyrównana z zakresem
+        resolution = max(
+            res for res in ROLLUP_RESOLUTIONS.values()
+            if bucket_size % res == 0 and epoch_from % res == 0 and epoch_to % res == 0
+        )
+
+        bucket = (SensorRollup.bucket // bucket_size) * bucket_size
+        columns = [bucket]
+        for metric in metrics:
+            columns += [
+                db.func.sum(getattr(SensorRollup, f"{metric}_count")),
+                db.func.sum(getattr(SensorRollup, f"{metric}_sum")),
+                db.func.min(getattr(SensorRollup, f"{metric}_min")),
+                db.func.max(getattr(SensorRollup, f"{metric}_max")),
+            ]
+        query = (
+            db.select(*columns)
+            .filter_by(room_id=room_id, device_id=device_id, resolution=resolution)
+            .where(SensorRollup.bucket >= epoch_from, SensorRollup.bucket < epoch_to)
+            .group_by(bucket)
+            .order_by(bucket)
+        )
+
+        result = []
+        for row in db.session.execute(query):
+            item = {"bucket": datetime.utcfromtimestamp(row[0]).isoformat()}
+            for index, metric in enumerate(metrics):
+                count, total, minimum, maximum = row[1 + 4 * index:5 + 4 * index]
+                item[metric] = {
+                    "count": count,
+                    "min": minimum,
+                    "max": maximum,
+                    "avg": total / count if count else None
+                }
+            result.append(item)
+
+        return {"resolution": resolution, "bucket": bucket_size, "data": result}, 200
+
+
+def room_series(room_id, device_ids, metrics, time_from, time_to, max_points):
+    """Pomiary wybranych urządzeń pokoju (lub wszystkich) jednym zapytaniem uporządkowanym po czasie,
+    w układzie kolumnowym: (czasy w ms, {(device_id, pomiar): wartości}) - brak wartości to None.
+    Pomiary z tą samą milisekundą dzielą pozycję osi czasu. None, gdy pomiarów jest więcej niż max_points"""
+    if COMPACT_STORAGE:
+        keys = db.select(SensorKey.device_key).where(SensorKey.room_id == room_id)
+        if device_ids:
+            keys = keys.where(SensorKey.device_id.in_(device_ids))
+        query = (
+            db.select(SensorKey.device_id, SensorReading.ts, *(getattr(SensorReading, metric) for metric in metrics))
+            .join(SensorKey, SensorKey.device_key == SensorReading.device_key)
+            .where(SensorReading.device_key.in_(keys),
+                   SensorReading.ts >= to_epoch_ms(time_from), SensorReading.ts < to_epoch_ms(time_to))
+            .order_by(SensorReading.ts)
+        )
+    else:
+        # Lista urządzeń z tabeli najnowszych wartości - zakres czasu przeszukiwany w indeksie
+        # (room_id, device_id, timestamp) osobno dla każdego urządzenia
+        devices = device_ids or db.select(SensorLatest.device_id).where(SensorLatest.room_id == room_id)
+        query = (
+            db.select(SensorData.device_id, SensorData.timestamp, *(getattr(SensorData, metric) for metric in metrics))
+            .where(SensorData.room_id == room_id, SensorData.device_id.in_(devices),
+                   SensorData.timestamp >= time_from, SensorData.timestamp < time_to)
+            .order_by(SensorData.timestamp)
+        )
+    query = query.limit(max_points + 1).execution_options(yield_per=HISTORY_YIELD_PER)
+
+    timestamps = []
+    columns = {}
+    for count, (device_id, timestamp, *values) in enumerate(db.session.execute(query)):
+        if count == max_points:
+            return None
+        ts = timestamp if COMPACT_STORAGE else to_epoch_ms(timestamp)
+        if not timestamps or timestamps[-1] != ts:
+            timestamps.append(ts)
+            for column in columns.values():
+                column.append(None)
+        for metric, value in zip(metrics, values):
+            column = columns.get((device_id, metric))
+            if column is None:
+                column = columns[(device_id, metric)] = [None] * len(timestamps)
+            column[-1] = value
+    return timestamps, columns
+
+
+def encode_series_binary(header, timestamps, values):
+    """Format binarny serii: SSR1, długość nagłówka (uint32), nagłówek JSON dopełniony spacjami
+    do wielokrotności 8 bajtów, czasy w ms (int64) i kolejno wartości każdej serii (float64, brak - NaN).
+    Liczby w kolejności little-endian - do odczytu np. przez numpy.frombuffer"""
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+    arrays = [array.array('q', timestamps)] + [
+        array.array('d', (float('nan') if value is None else value for value in column)) for column in values
+    ]
+    if sys.byteorder == 'big':
+        for item in arrays:
+            item.byteswap()
+    return b''.join([SERIES_BINARY_MAGIC, struct.pack('<I', len(header_bytes)), header_bytes]
+                    + [item.tobytes() for item in arrays])
+
+
+@ns.route('/<string:room_id>/series')
+class RoomSeriesResource(Resource):
+    @api.doc(params={
+        'devices': 'Lista urządzeń oddzielona przecinkami (domyślnie wszystkie urządzenia pokoju)',
+        'metrics': 'Lista pomiarów oddzielona przecinkami (domyślnie wszystkie)',
+        'from': 'Początek zakresu czasu (ISO 8601), domyślnie doba przed "to"',
+        'to': 'Koniec zakresu czasu (ISO 8601), domyślnie teraz'
+    })
+    def get(self, room_id):
+        """Pobierz pomiary wielu urządzeń pokoju w układzie kolumnowym (JSON lub format binarny wg Accept)"""
+        try:
+            time_to = parse_timestamp(request.args.get('to')) or utcplusone()
+            time_from = parse_timestamp(request.args.get('from')) or time_to - timedelta(days=1)
+        except ValueError:
+            return {"error": "Nieprawidłowy znacznik czasu, oczekiwano formatu ISO 8601"}, 400
+        if time_to <= time_from:
+            return {"error": "Koniec zakresu musi być późniejszy niż początek"}, 400
+
+        metrics = request.args.get('metrics', ','.join(ROLLUP_METRICS)).split(',')
+        if any(metric not in ROLLUP_METRICS for metric in metrics):
+            return {"error": "Nieprawidłowy typ pomiaru, oczekiwano: temperature, humidity lub smoke_level"}, 400
+        metrics = list(dict.fromkeys(metrics))
+        device_ids = [device_id for device_id in request.args.get('devices', '').split(',') if device_id]
+
+        result = room_series(room_id, device_ids, metrics, time_from, time_to, SERIES_MAX_POINTS)
+        if result is None:
+            return {"error": f"Zbyt wiele pomiarów (maks. {SERIES_MAX_POINTS}), zawęź zakres czasu"}, 400
+        timestamps, columns = result
+
+        # Kolejność serii: urządzenia w kolejności z zapytania (lub alfabetycznie), pomiary jak w metrics
+        order = device_ids or sorted({device_id for device_id, _ in columns})
+        series = [(device_id, metric) for device_id in order for metric in metrics if (device_id, metric) in columns]
+        header = {
+            "room_id": room_id,
+            "from": time_from.isoformat(),
+            "to": time_to.isoformat(),
+            "count": len(timestamps),
+            "series": [{"device_id": device_id, "metric": metric} for device_id, metric in series]
+        }
+
+        if request.accept_mimetypes.best_match(['application/json', SERIES_BINARY_MIME]) == SERIES_BINARY_MIME:
+            data = encode_series_binary(header, timestamps, [columns[key] for key in series])
+            return Response(data, mimetype=SERIES_BINARY_MIME, headers={"Vary": "Accept"})
+        for item, key in zip(header["series"], series):
+            item["values"] = columns[key]
+        header["timestamps"] = timestamps
+        response = jsonify(header)
+        response.headers["Vary"] = "Accept"
+        return response
+
+
+def iter_readings(room_id, device_ids=None, time_from=None, time_to=None):
+    """Pomiary pokoju jako krotki (device_id, czas, temperatura, wilgotność, zadymienie), po urządzeniu
+    i czasie - kolejność indeksu (lub klucza tabeli compact), więc bez sortowania i obiektów ORM"""
+    if COMPACT_STORAGE:
+        query = (
+            db.select(SensorKey.device_id, SensorReading.ts, SensorReading.temperature,
+                      SensorReading.humidity, SensorReading.smoke_level)
+            .join(SensorReading, SensorReading.device_key == SensorKey.device_key)
+            .where(SensorKey.room_id == room_id)
+            .order_by(SensorKey.device_id, SensorReading.ts)
+        )
+        if device_ids:
+            query = query.where(SensorKey.device_id.in_(device_ids))
+        if time_from is not None:
+            query = query.where(SensorReading.ts >= to_epoch_ms(time_from))
+        if time_to is not None:
+            query = query.where(SensorReading.ts < to_epoch_ms(time_to))
+    else:
+        query = (
+            db.select(SensorData.device_id, SensorData.timestamp, SensorData.temperature,
+                      SensorData.humidity, SensorData.smoke_level)
+            .where(SensorData.room_id == room_id)
+            .order_by(SensorData.device_id, SensorData.timestamp)
+        )
+        if device_ids:
+            query = query.where(SensorData.device_id.in_(device_ids))
+        if time_from is not None:
+            query = query.where(SensorData.timestamp >= time_from)
+        if time_to is not None:
+            query = query.where(SensorData.timestamp < time_to)
+
+    rows = db.session.execute(query.execution_options(yield_per=EXPORT_YIELD_PER))
+    if COMPACT_STORAGE:
+        return ((device_id, from_epoch_ms(ts), *values) for device_id, ts, *values in rows)
+    return rows
+
+
+def export_chunks(rows, export_format, compress=False):
+    """Kolejne fragmenty pliku eksportu (bajty) - w pamięci jest najwyżej EXPORT_CHUNK_ROWS wierszy.
+    compress=True - strumień gzip tworzony na bieżąco"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if export_format == 'csv':
+        writer.writerow(EXPORT_COLUMNS)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    for count, (device_id, timestamp, *values) in enumerate(rows, 1):
+        timestamp = timestamp.isoformat() if timestamp else None
+        if export_format == 'csv':
+            writer.writerow([device_id, timestamp, *values])
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, [device_id, timestamp, *values]))) + '\n')
+        if count % EXPORT_CHUNK_ROWS == 0:
+            chunk = flush()
+            if chunk:
+                yield chunk
+    chunk = flush()
+    if compressor:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
+
+
+@ns.route('/<string:room_id>/export')
+class RoomExportResource(Resource):
+    @api.doc(params={
+        'devices': 'Lista urządzeń oddzielona przecinkami (domyślnie wszystkie urządzenia pokoju)',
+        'from': 'Początek zakresu czasu (ISO 8601), domyślnie cała historia',
+        'to': 'Koniec zakresu czasu (ISO 8601)',
+        'format': 'csv (domyślnie) lub ndjson'
+    })
+    def get(self, room_id):
+        """Pobierz historię pomiarów pokoju jako strumień CSV lub NDJSON (gzip, gdy klient go akceptuje)"""
+        try:
+            time_from = parse_timestamp(request.args.get('from'))
+            time_to = parse_timestamp(request.args.get('to'))
+        except ValueError:
+            return {"error": "Nieprawidłowy znacznik czasu, oczekiwano formatu ISO 8601"}, 400
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return {"error": "Nieprawidłowy format, oczekiwano: csv lub ndjson"}, 400
+        device_ids = [device_id for device_id in request.args.get('devices', '').split(',') if device_id]
+
+        compress = request.accept_encodings.best_match(['gzip']) == 'gzip'
+        rows = iter_readings(room_id, device_ids, time_from, time_to)
+        headers = {
+            "Content-Disposition": f'attachment; filename="{room_id}.{export_format}"',
+            "Vary": "Accept-Encoding",
+            "X-Accel-Buffering": "no"
+        }
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return Response(stream_with_context(export_chunks(rows, export_format, compress)),
+                        mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
+
+class FrameCache:
+    """Wynik analizy ostatniej klatki z każdej kamery, wyszukiwany po skrócie percepcyjnym.
+
+    Klatka różniąca się od poprzedniej na co najwyżej threshold bitach skrótu dostaje wynik
+    poprzedniej (liczba osób i zdjęcie z oznaczeniami) bez ponownej analizy"""
+
+    def __init__(self, threshold, max_age):
+        self.threshold = threshold
+        self.max_age = max_age
+        self._entries = {}
+        # Skróty klatek, których analiza trwa: job_id -> (kamera, skrót)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.threshold >= 0
+
+    def lookup(self, camera, frame_hash):
+        """Zapamiętany wynik (liczba osób, skrót zdjęcia z oznaczeniami) dla podobnej klatki lub None.
+        Trafienie liczy dopiero record() - wynik może okazać się nieaktualny"""
+        with self._lock:
+            entry = self._entries.get(camera)
+            if entry is not None and time.monotonic() - entry[3] <= self.max_age \
+                    and hamming_distance(entry[0], frame_hash) <= self.threshold:
+                return entry[1], entry[2]
+            return None
+
+    def record(self, hit):
+        """Zliczenie wyniku wyszukiwania (trafienie użyte zamiast analizy lub chybienie)"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def expect(self, job_id, camera, frame_hash):
+        """Zapamiętanie skrótu klatki wysłanej do analizy"""
+        with self._lock:
+            self._pending[job_id] = (camera, frame_hash)
+
+    def complete(self, job_id, people_num=None, blob_hash=None):
+        """Zapisanie wyniku analizy (bez wyniku - tylko zapomnienie skrótu)"""
+        with self._lock:
+            pending = self._pending.pop(job_id, None)
+            if pending is not None and blob_hash is not None:
+                camera, frame_hash = pending
+                self._entries[camera] = (frame_hash, people_num, blob_hash, time.monotonic())
+
+    def invalidate(self, camera):
+        with self._lock:
+            self._entries.pop(camera, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "threshold": self.threshold,
+                "max_age_s": self.max_age,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None
+            }
 
-        return {"data": result}, 200
+
+frame_cache = FrameCache(FRAME_CACHE_THRESHOLD, FRAME_CACHE_MAX_AGE)
+
+
+def publish_people(job):
+    """Zdarzenie z nową liczbą osób po zatwierdzeniu zakończonego zadania"""
+    event_bus.publish(job.section, 'people', {
+        "people_num": job.people_num,
+        "job_id": job.id,
+        # Poza żądaniem nie da się zbudować adresu - klient używa /images/<kind>/<id>
+        "image_id": job.image_id,
+        "image_out_id": job.image_out_id,
+        "timestamp": job.finished_on.isoformat()
+    }, device_id=job.device_id)
 
 
 @ns.route('/<string:room_id>/cameras/<string:device_id>/images')
@@ -302,80 +1812,797 @@ class ImageUploadResource(Resource):
         if not file.filename.lower().endswith(('.jpg', '.jpeg')):
             return {"error": "Nieprawidłowy format pliku, dozwolone są tylko pliki JPG"}, 400
 
-        # Odczytanie danych obrazu
+        # Odczytanie danych obrazu i zapisanie oryginału
         image_data = file.read()
-        temp_file_path = 'static/temp_image.jpg'
-        with open(temp_file_path, 'wb') as temp_file:
-            temp_file.write(image_data)
+        image = Image(blob_hash=save_blob(image_data, 'image/jpeg'), section=room_id)
+        job = InferenceJob(section=room_id, device_id=device_id, image=image)
+        db.session.add_all([image, job])
+
+        camera = (room_id, device_id)
+        frame_hash = None
+        if frame_cache.enabled:
+            try:
+                frame_hash = dhash(image_data)
+            except ValueError:
+                pass  # Uszkodzone zdjęcie - błąd zgłosi analiza
+        cached = frame_cache.lookup(camera, frame_hash) if frame_hash is not None else None
+        # Zdjęcie z oznaczeniami mogło zostać już usunięte przez czyszczenie danych
+        if cached is not None and db.session.get(Blob, cached[1]) is None:
+            frame_cache.invalidate(camera)
+            cached = None
+        if frame_hash is not None:
+            frame_cache.record(cached is not None)
+
+        if cached is not None:
+            # Klatka praktycznie bez zmian - wynik poprzedniej analizy bez uruchamiania modelu
+            people_num, blob_hash = cached
+            image_out = ImageOut(blob_hash=blob_hash, people_num=people_num, section=room_id)
+            db.session.add(image_out)
+            # Wersje zdjęcia z oznaczeniami już istnieją, nowy oryginał potrzebuje własnych
+            if inference_queue.renditions:
+                save_renditions(image.blob_hash, make_renditions(decode_image(image_data), inference_queue.renditions))
+            update_image_latest(room_id, image, image_out)
+            job.status = 'done'
+            job.people_num = people_num
+            job.image_out_id = image_out.id
+            job.finished_on = utcplusone()
+            db.session.commit()
+            publish_people(job)
+        else:
+            db.session.commit()
+            if frame_hash is not None:
+                frame_cache.expect(job.id, camera, frame_hash)
+            # Liczenie osób odbywa się w tle, wynik dostępny przez status zadania
+            inference_queue.submit(job.id, image_data, complete_inference_job)
+
+        job_url = api.url_for(InferenceJobResource, room_id=room_id, device_id=device_id, job_id=job.id)
+        if cached is not None:
+            return {"message": "Zdjęcie bez zmian, użyto poprzedniego wyniku", "job_id": job.id,
+                    "status": job.status, "people_num": job.people_num}, 200, {"Location": job_url}
+        return {"message": "Zdjęcie przyjęte do analizy", "job_id": job.id, "status": job.status}, 202, \
+            {"Location": job_url}
 
-        # Sprawdzenie liczby osób
-        file_path_out = 'static/image_out/'
-        people_num, file_path_out_fin = objRec(temp_file_path, file_path_out, yolo)
+    def get(self, room_id, device_id):
+        """Pobierz najnowsze zdjęcia dla urządzenia (adresy plików zamiast danych base64)"""
+        latest = db.session.get(ImageLatest, room_id)
+        if not latest:
+            return {"error": "Brak zdjęć dla tego urządzenia"}, 404
 
-        with open(file_path_out_fin, 'rb') as analyzed_file:
-            analyzed_image_data = analyzed_file.read()
+        result = {
+            "original_image_url": image_url(room_id, 'original', latest.image_id),
+            "processed_image_url": image_url(room_id, 'processed', latest.image_out_id),
+            "people_num": latest.people_num,
+            "timestamp": latest.timestamp.isoformat()
+        }
+
+        return {"data": result}, 200
+
+
+@ns.route('/<string:room_id>/cameras/<string:device_id>/jobs/<int:job_id>')
+class InferenceJobResource(Resource):
+    def get(self, room_id, device_id, job_id):
+        """Pobierz stan zadania analizy zdjęcia"""
+        job = InferenceJob.query.filter_by(id=job_id, section=room_id).first()
+        if not job:
+            return {"error": "Nie znaleziono zadania"}, 404
+
+        status = job.status
+        if status == 'queued' and inference_queue.is_running(job.id):
+            status = 'running'
 
-        # Zapisanie zdjęć do bazy danych
-        image = Image(image_data=image_data, section=room_id)
-        db.session.add(image)
+        result = {
+            "job_id": job.id,
+            "status": status,
+            "image_id": job.image_id,
+            "image_out_id": job.image_out_id,
+            "people_num": job.people_num,
+            "error": job.error,
+            "created_on": job.created_on.isoformat(),
+            "finished_on": job.finished_on.isoformat() if job.finished_on else None
+        }
+
+        return {"data": result}, 200
 
-        image_out = ImageOut(image_data=analyzed_image_data, people_num=people_num, section=room_id)
-        db.session.add(image_out)
 
+@app.route('/inference/stats')
+def inference_stats():
+    """Statystyki kolejki analizy zdjęć (rozmiary paczek, czas oczekiwania) i pomijania niezmienionych klatek"""
+    return jsonify(dict(inference_queue.stats(), frame_cache=frame_cache.stats()))
+
+
+def complete_inference_job(job_id, future):
+    """Zapisanie wyniku analizy (wywoływane przez kolejkę po zakończeniu zadania)"""
+    with app.app_context():
+        try:
+            people_num, analyzed_image_data, renditions = future.result()
+        except Exception as e:
+            values = dict(status='failed', error=str(e)[:500])
+        else:
+            values = dict(status='done', people_num=people_num)
+        # Zakończenie tylko niezakończonego zadania - warunkowa zmiana zajmuje blokadę zapisu, więc drugie
+        # zakończenie (np. zadania wznowionego w innym procesie) czeka na commit i nic nie zmienia
+        finished = db.session.execute(
+            db.update(InferenceJob)
+            .where(InferenceJob.id == job_id, InferenceJob.status.in_(('queued', 'running')))
+            .values(finished_on=utcplusone(), **values)
+        ).rowcount
+        job = db.session.get(InferenceJob, job_id) if finished else None
+        if job is None:
+            # Zadanie już zakończone albo usunięte w międzyczasie - wynik nie ma gdzie trafić
+            db.session.rollback()
+            frame_cache.complete(job_id)
+            return
+        if job.status == 'done':
+            image_out = ImageOut(
+                blob_hash=save_blob(analyzed_image_data, 'image/jpeg'), people_num=people_num, section=job.section
+            )
+            db.session.add(image_out)
+            save_renditions(job.image.blob_hash, renditions['original'])
+            save_renditions(image_out.blob_hash, renditions['processed'])
+            # Aktualizacja najnowszej liczby osób w sekcji
+            update_image_latest(job.section, job.image, image_out)
+            job.image_out_id = image_out.id
+        db.session.commit()
+        if job.status == 'done':
+            frame_cache.complete(job_id, job.people_num, image_out.blob_hash)
+            publish_people(job)
+        else:
+            frame_cache.complete(job_id)
+
+
+def resume_inference_jobs():
+    """Ponowne dodanie do kolejki zadań przerwanych np. restartem serwera"""
+    with app.app_context():
+        jobs = InferenceJob.query.filter_by(status='queued').order_by(InferenceJob.id).all()
+        for job in jobs:
+            inference_queue.submit(job.id, read_blob(job.image.blob_hash), complete_inference_job)
+
+
+def delete_in_batches(model, condition, before_delete=None, order_by=None):
+    """Usuwanie rekordów spełniających warunek małymi partiami, każda we własnej transakcji,
+    zwraca liczbę usuniętych rekordów. order_by (domyślnie id) powinno odpowiadać indeksowi warunku"""
+    deleted = 0
+    while True:
+        ids = db.session.execute(
+            db.select(model.id).where(condition).order_by(model.id if order_by is None else order_by)
+            .limit(RETENTION_BATCH_SIZE)
+        ).scalars().all()
+        if not ids:
+            return deleted
+        if before_delete:
+            before_delete(ids)
+        db.session.execute(db.delete(model).where(model.id.in_(ids)))
         db.session.commit()
+        deleted += len(ids)
+        # Przerwa pozwala innym zapisom uzyskać blokadę bazy
+        time.sleep(RETENTION_BATCH_PAUSE)
+
+
+def delete_images(model, keep):
+    """Usunięcie zdjęć poza `keep` najnowszymi w każdej sekcji"""
+    deleted = 0
+    section = ''
+    while True:
+        # Kolejna sekcja z indeksu (section, id) - bez skanowania całej tabeli jak przy DISTINCT
+        section = db.session.execute(db.select(db.func.min(model.section)).where(model.section > section)).scalar()
+        if section is None:
+            return deleted
+        # id najstarszego zachowywanego zdjęcia w sekcji
+        oldest_kept = db.session.execute(
+            db.select(model.id).filter_by(section=section).order_by(model.id.desc()).offset(keep - 1).limit(1)
+        ).scalar()
+        if oldest_kept is None:
+            continue
+        condition = (model.section == section) & (model.id < oldest_kept)
+        if model is Image:
+            # Zadania analizy dotyczą konkretnego oryginału - zdjęcia czekające na analizę zostają
+            # do następnego przejścia (complete_inference_job potrzebuje zadania i oryginału)
+            condition &= ~db.exists().where(InferenceJob.image_id == model.id, InferenceJob.status == 'queued')
+            before_delete = lambda ids: db.session.execute(
+                db.delete(InferenceJob).where(InferenceJob.image_id.in_(ids))
+            )
+        else:
+            before_delete = lambda ids: db.session.execute(
+                db.update(InferenceJob).where(InferenceJob.image_out_id.in_(ids)).values(image_out_id=None)
+            )
+        deleted += delete_in_batches(model, condition, before_delete)
+
+
+def collect_unused_blobs():
+    """Usunięcie wersji i plików zdjęć, do których nie odwołuje się już żaden rekord"""
+    def unused(column):
+        return (
+            ~db.exists().where(Image.blob_hash == column)
+            & ~db.exists().where(ImageOut.blob_hash == column)
+        )
 
-        # Usunięcie tymczasowych plików
-        os.remove(temp_file_path)
-        os.remove(file_path_out_fin)
+    while True:
+        # Sprawdzenie i usunięcie w jednym poleceniu - w tej samej transakcji zapisu
+        key = db.tuple_(ImageRendition.source_hash, ImageRendition.size, ImageRendition.format)
+        batch = (
+            db.select(ImageRendition.source_hash, ImageRendition.size, ImageRendition.format)
+            .where(unused(ImageRendition.source_hash)).limit(RETENTION_BATCH_SIZE)
+        )
+        count = db.session.execute(db.delete(ImageRendition).where(key.in_(batch))).rowcount
+        db.session.commit()
+        if not count:
+            break
+
+    deleted = 0
+    while True:
+        batch = (
+            db.select(Blob.hash)
+            .where(unused(Blob.hash), ~db.exists().where(ImageRendition.blob_hash == Blob.hash))
+            .limit(RETENTION_BATCH_SIZE)
+        )
+        hashes = db.session.execute(
+            db.delete(Blob).where(Blob.hash.in_(batch)).returning(Blob.hash)
+        ).scalars().all()
+        # Pliki usuwane przed commitem, gdy transakcja trzyma blokadę zapisu - równoległy zapis
+        # tego samego pliku (save_blob) czeka na nią i po commicie zapisze plik ponownie
+        for blob_hash in hashes:
+            blob_store.delete(blob_hash)
+        db.session.commit()
+        if not hashes:
+            return deleted
+        deleted += len(hashes)
+        time.sleep(RETENTION_BATCH_PAUSE)
 
-        return {"message": "Zdjęcie przesłane i przetworzone pomyślnie", "people_num": people_num}, 200
 
-    def get(self, room_id, device_id):
-        """Pobierz najnowsze zdjęcia dla urządzenia"""
-        original_image = Image.query.filter_by(section=room_id).order_by(Image.id.desc()).first()
-        processed_image = ImageOut.query.filter_by(section=room_id).order_by(ImageOut.id.desc()).first()
+def incremental_vacuum():
+    """Zwolnienie wolnych stron pliku bazy małymi krokami"""
+    # Bez auto_vacuum=INCREMENTAL (np. baza, której nie udało się przełączyć) polecenie nic nie zwalnia
+    if db.session.execute(db.text("PRAGMA auto_vacuum")).scalar() != 2:
+        db.session.commit()
+        return
+    previous = None
+    while True:
+        free_pages = db.session.execute(db.text("PRAGMA freelist_count")).scalar()
+        # Koniec także wtedy, gdy krok nic nie zwolnił - np. gdy inny proces trzyma blokadę zapisu
+        if not free_pages or free_pages == previous:
+            db.session.commit()
+            return
+        previous = free_pages
+        db.session.commit()
+        # PRAGMA incremental_vacuum zwalnia jedną stronę na krok zapytania, a execute() wykonuje
+        # tylko pierwszy krok - executescript wykonuje polecenie do końca
+        connection = db.engine.raw_connection()
+        try:
+            connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({RETENTION_VACUUM_PAGES})")
+        finally:
+            connection.close()
+        time.sleep(RETENTION_BATCH_PAUSE)
+
+
+def delete_compact_readings(cutoff_ms):
+    """Usuwanie pomiarów starszych niż cutoff_ms z sensor_reading - osobno dla każdego urządzenia,
+    partiami wyznaczanymi po kluczu (device_key, ts), każda we własnej transakcji"""
+    deleted = 0
+    for key in db.session.execute(db.select(SensorKey.device_key)).scalars().all():
+        while True:
+            # Czas ostatniego pomiaru partii - usuwamy wszystko do niego włącznie
+            boundary = db.session.execute(
+                db.select(SensorReading.ts).where(SensorReading.device_key == key, SensorReading.ts < cutoff_ms)
+                .order_by(SensorReading.ts).offset(RETENTION_BATCH_SIZE - 1).limit(1)
+            ).scalar()
+            condition = SensorReading.ts < cutoff_ms if boundary is None else SensorReading.ts <= boundary
+            deleted += db.session.execute(
+                db.delete(SensorReading).where(SensorReading.device_key == key, condition)
+            ).rowcount
+            db.session.commit()
+            if boundary is None:
+                break
+            time.sleep(RETENTION_BATCH_PAUSE)
+    return deleted
+
+
+def run_retention():
+    """Jedno przejście czyszczenia danych wg reguł retencji, zwraca liczbę usuniętych rekordów"""
+    deleted = {}
+    with app.app_context():
+        if RETENTION_IMAGES_PER_SECTION > 0:
+            deleted['image'] = delete_images(Image, RETENTION_IMAGES_PER_SECTION)
+            deleted['image_out'] = delete_images(ImageOut, RETENTION_IMAGES_PER_SECTION)
+            deleted['blob'] = collect_unused_blobs()
+        if RETENTION_SENSOR_DATA_DAYS > 0:
+            # Surowe pomiary są już uwzględnione w agregatach (aktualizowanych przy zapisie)
+            cutoff = utcplusone() - timedelta(days=RETENTION_SENSOR_DATA_DAYS)
+            if COMPACT_STORAGE:
+                deleted['sensor_reading'] = delete_compact_readings(to_epoch_ms(cutoff))
+            else:
+                deleted['sensor_data'] = delete_in_batches(
+                    SensorData, SensorData.timestamp < cutoff, order_by=SensorData.timestamp
+                )
+        if RETENTION_MINUTE_ROLLUP_DAYS > 0:
+            cutoff = to_epoch(utcplusone() - timedelta(days=RETENTION_MINUTE_ROLLUP_DAYS))
+            key = db.tuple_(SensorRollup.room_id, SensorRollup.device_id, SensorRollup.resolution, SensorRollup.bucket)
+            batch = (
+                db.select(SensorRollup.room_id, SensorRollup.device_id, SensorRollup.resolution, SensorRollup.bucket)
+                .filter_by(resolution=ROLLUP_RESOLUTIONS['minute']).where(SensorRollup.bucket < cutoff)
+                .limit(RETENTION_BATCH_SIZE)
+            )
+            deleted['sensor_rollup'] = 0
+            while True:
+                count = db.session.execute(db.delete(SensorRollup).where(key.in_(batch))).rowcount
+                db.session.commit()
+                if not count:
+                    break
+                deleted['sensor_rollup'] += count
+                time.sleep(RETENTION_BATCH_PAUSE)
+        incremental_vacuum()
+    return deleted
+
+
+def retention_loop(stop_event):
+    """Wątek okresowo uruchamiający czyszczenie danych"""
+    while not stop_event.wait(RETENTION_INTERVAL):
+        try:
+            deleted = run_retention()
+            print(f"Retencja danych - usunięto: {deleted}")
+        except Exception as e:
+            print(f"Błąd czyszczenia danych: {e}")
+
+
+retention_stop = threading.Event()
+
+
+@app.cli.command('run-retention')
+def run_retention_command():
+    """Jednorazowe czyszczenie danych wg reguł retencji"""
+    print(f"Usunięto: {run_retention()}")
+
+
+def migrate_sensor_storage(drop=False):
+    """Kopiowanie pomiarów z sensor_data do zwartej tabeli sensor_reading (partiami po id,
+    ponowne uruchomienie pomija skopiowane wiersze), zwraca liczbę skopiowanych wierszy"""
+    db.session.execute(
+        sqlite_insert(SensorKey).from_select(
+            ["room_id", "device_id"],
+            db.select(SensorData.room_id, SensorData.device_id).where(SensorData.device_id.isnot(None)).distinct()
+        ).on_conflict_do_nothing(index_elements=[SensorKey.room_id, SensorKey.device_id])
+    )
+    db.session.commit()
 
-        if not original_image or not processed_image:
-            return {"error": "Brak zdjęć dla tego urządzenia"}, 404
+    # Milisekundy od epoki wyliczane w SQLite - bez wczytywania wierszy do Pythona
+    ts = (
+        db.cast(db.func.strftime('%s', SensorData.timestamp), db.Integer) * 1000
+        + db.cast(db.func.substr(db.func.strftime('%f', SensorData.timestamp), 4), db.Integer)
+    )
+    last_id = 0
+    max_id = db.session.execute(db.select(db.func.max(SensorData.id))).scalar() or 0
+    copied = 0
+    while last_id < max_id:
+        upto = last_id + SENSOR_MIGRATION_BATCH
+        query = (
+            db.select(SensorKey.device_key, ts, SensorData.temperature, SensorData.humidity, SensorData.smoke_level)
+            .join(SensorKey, db.and_(
+                SensorKey.room_id == SensorData.room_id, SensorKey.device_id == SensorData.device_id
+            ))
+            .where(SensorData.id > last_id, SensorData.id <= upto, SensorData.timestamp.isnot(None))
+        )
+        copied += db.session.execute(
+            sqlite_insert(SensorReading).from_select(
+                ["device_key", "ts", "temperature", "humidity", "smoke_level"], query
+            ).on_conflict_do_nothing()
+        ).rowcount
+        db.session.commit()
+        last_id = upto
 
-        result = {
-            "original_image": base64.b64encode(original_image.image_data).decode('utf-8'),
-            "processed_image": base64.b64encode(processed_image.image_data).decode('utf-8'),
-            "people_num": processed_image.people_num,
-            "timestamp": processed_image.timestamp
-        }
+    if COMPACT_STORAGE:
+        # W układzie compact data_id najnowszych wartości to czas pomiaru w ms
+        SensorLatest.query.delete()
+        update_sensor_latest(newest_compact_readings())
+        db.session.commit()
+    if drop:
+        SensorData.query.delete()
+        db.session.commit()
+        incremental_vacuum()
+    return copied
+
+
+@app.cli.command('migrate-sensor-storage')
+@click.option('--drop', is_flag=True, help='Usuń pomiary z sensor_data po skopiowaniu')
+def migrate_sensor_storage_command(drop):
+    """Przeniesienie pomiarów do zwartego układu (SENSOR_STORAGE=compact)"""
+    copied = migrate_sensor_storage(drop)
+    print(f"Skopiowano {copied} pomiarów do sensor_reading")
+    if not COMPACT_STORAGE:
+        print("Uruchom polecenie i serwer z SENSOR_STORAGE=compact, aby używać nowej tabeli")
+
+
+def stored_reading_keys(room_id, keys):
+    """Które z par (device_id, czas) z pokoju są już zapisane w bazie"""
+    # Zakres czasu zamiast porównania par - SQLite przeszukuje wtedy indeks (lub klucz) urządzenia
+    # zamiast wszystkich pomiarów pokoju
+    timestamps = [timestamp for _, timestamp in keys]
+    if COMPACT_STORAGE:
+        device_ids = device_keys({(room_id, device_id) for device_id, _ in keys})
+        if not device_ids:
+            return set()
+        devices = {key: device_id for (_, device_id), key in device_ids.items()}
+        rows = db.session.execute(
+            db.select(SensorReading.device_key, SensorReading.ts).where(
+                SensorReading.device_key.in_(devices),
+                SensorReading.ts.between(to_epoch_ms(min(timestamps)), to_epoch_ms(max(timestamps)))
+            )
+        )
+        stored = {(devices[key], ts) for key, ts in rows}
+        return {(device_id, timestamp) for device_id, timestamp in keys if (device_id, to_epoch_ms(timestamp)) in stored}
+
+    rows = db.session.execute(
+        db.select(SensorData.device_id, SensorData.timestamp).where(
+            SensorData.room_id == room_id,
+            SensorData.device_id.in_({device_id for device_id, _ in keys}),
+            SensorData.timestamp.between(min(timestamps), max(timestamps))
+        )
+    )
+    return {(device_id, timestamp) for device_id, timestamp in rows} & keys
+
+
+def ingest_mqtt_readings(items):
+    """Zapis pomiarów odebranych przez most MQTT (lista (room_id, pomiar)) - pomija pomiary
+    zapisane już wcześniej (ponowne dostarczenie QoS 1), zwraca liczbę zapisanych"""
+    rooms = {}
+    for room_id, reading in items:
+        rooms.setdefault(room_id, []).append(dict(reading, timestamp=parse_timestamp(reading.get("timestamp"))))
+
+    with app.app_context():
+        for room_id, readings in rooms.items():
+            keys = {(reading["device_id"], reading["timestamp"]) for reading in readings if reading["timestamp"]}
+            existing = stored_reading_keys(room_id, keys) if keys else set()
+            unique = []
+            for reading in readings:
+                key = (reading["device_id"], reading["timestamp"])
+                if reading["timestamp"] is None or key not in existing:
+                    unique.append(reading)
+                    existing.add(key)
+            rooms[room_id] = unique
+
+    # Zapis przez wątek zapisu razem z pomiarami z HTTP - wiele paczek w jednym commicie
+    futures = [sensor_writer.submit((room_id, readings)) for room_id, readings in rooms.items() if readings]
+    return sum(future.result(timeout=WRITER_TIMEOUT) for future in futures)
+
+
+# Adres brokera dla mostu MQTT. Most działa albo w procesie serwera (MQTT_BRIDGE_IN_SERVER=1),
+# albo osobno (flask mqtt-bridge) - dwa mosty z tym samym client_id przejmowałyby sobie sesję
+MQTT_BROKER = os.environ.get('MQTT_BROKER')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+MQTT_BRIDGE_IN_SERVER = os.environ.get('MQTT_BRIDGE_IN_SERVER') == '1'
+mqtt_bridge = None
+
+
+def start_mqtt_bridge():
+    global mqtt_bridge
+    from mqtt_bridge import MqttBridge
+    mqtt_bridge = MqttBridge(
+        ingest_mqtt_readings, MQTT_BROKER, MQTT_PORT,
+        client_id=os.environ.get('MQTT_CLIENT_ID', 'sensor-server-bridge'),
+        max_batch=int(os.environ.get('MQTT_MAX_BATCH', 500)),
+        max_latency_ms=float(os.environ.get('MQTT_MAX_LATENCY_MS', 200))
+    )
+    mqtt_bridge.start()
+    return mqtt_bridge
+
+
+@app.cli.command('mqtt-bridge')
+def mqtt_bridge_command():
+    """Odbiór pomiarów z brokera MQTT (MQTT_BROKER) w osobnym procesie"""
+    if not MQTT_BROKER:
+        print("Nie ustawiono MQTT_BROKER")
+        return
+    if MQTT_BRIDGE_IN_SERVER:
+        print("Most MQTT działa w procesie serwera (MQTT_BRIDGE_IN_SERVER=1)")
+        return
+    bridge = start_mqtt_bridge()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"Most MQTT: {bridge.stats()}")
+    except KeyboardInterrupt:
+        bridge.stop()
+
+
+@app.cli.command('export-readings')
+@click.argument('room_id')
+@click.option('--devices', default='', help='Lista urządzeń oddzielona przecinkami (domyślnie wszystkie)')
+@click.option('--from', 'time_from', help='Początek zakresu czasu (ISO 8601)')
+@click.option('--to', 'time_to', help='Koniec zakresu czasu (ISO 8601)')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Kompresja gzip')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Plik wyjściowy (domyślnie stdout)')
+def export_readings_command(room_id, devices, time_from, time_to, export_format, compress, output):
+    """Eksport historii pomiarów pokoju do CSV lub NDJSON"""
+    rows = iter_readings(room_id, [device_id for device_id in devices.split(',') if device_id],
+                         parse_timestamp(time_from), parse_timestamp(time_to))
+    for chunk in export_chunks(rows, export_format, compress):
+        output.write(chunk)
+
+
+# Zadania w tle (analiza zdjęć, retencja, most MQTT) startują przy uruchomieniu skryptu lub przy pierwszym
+# żądaniu, gdy serwer uruchomiono inaczej (flask run, serwer WSGI) - BACKGROUND_WORKERS=0 wyłącza je
+# w procesie. Przy wielu procesach serwera wznawianie zadań, retencję i most MQTT wykonuje tylko proces
+# trzymający blokadę pliku BACKGROUND_LOCK_FILE (domyślnie obok pliku bazy)
+BACKGROUND_WORKERS = os.environ.get('BACKGROUND_WORKERS', '1') == '1'
+BACKGROUND_LOCK_FILE = os.environ.get('BACKGROUND_LOCK_FILE')
+background_workers_started = False
+_background_workers_lock = threading.Lock()
+# Otwarty plik blokady - zamknięcie (także przy awarii procesu) zwalnia blokadę dla kolejnego procesu
+_leader_lock_file = None
+
+
+def acquire_leader_lock():
+    """Próba zostania procesem wykonującym zadania wspólne dla wszystkich procesów serwera"""
+    global _leader_lock_file
+    try:
+        import fcntl
+    except ImportError:
+        return True  # Brak blokad plików (Windows) - zakładamy jeden proces serwera
+    path = BACKGROUND_LOCK_FILE
+    if not path:
+        with app.app_context():
+            path = db.engine.url.database + '.workers.lock'
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    _leader_lock_file = lock_file
+    return True
+
+
+def start_background_workers():
+    """Uruchomienie zadań działających w tle serwera (jednokrotne)"""
+    global background_workers_started
+    with _background_workers_lock:
+        if background_workers_started:
+            return
+        background_workers_started = True
+        # Procesy robocze wczytują i rozgrzewają model, zanim pojawi się pierwsze zdjęcie
+        inference_queue.start()
+        if not acquire_leader_lock():
+            return
+        resume_inference_jobs()
+        threading.Thread(target=retention_loop, args=(retention_stop,), name='retention', daemon=True).start()
+        if MQTT_BROKER and MQTT_BRIDGE_IN_SERVER:
+            start_mqtt_bridge()
+
+
+@app.before_request
+def ensure_background_workers():
+    if BACKGROUND_WORKERS and not background_workers_started:
+        start_background_workers()
+
+
+# Modele zdjęć dla rodzajów: oryginał i zdjęcie po analizie
+IMAGE_KINDS = {'original': Image, 'processed': ImageOut}
+
+
+def image_url(room_id, kind, image_id):
+    """Adres pliku zdjęcia o podanym id"""
+    if image_id is None:
+        return None
+    return api.url_for(ImageFileResource, room_id=room_id, kind=kind, image_id=image_id)
+
+
+def send_image(image, immutable):
+    """Wysłanie zdjęcia lub jego wersji wybranej parametrami size i format"""
+    size = request.args.get('size', 'original')
+    image_format = request.args.get('format')
+    if size != 'original' and size not in IMAGE_RENDITION_SIZES:
+        return {"error": f"Nieprawidłowy rozmiar, oczekiwano: original, {', '.join(IMAGE_RENDITION_SIZES)}"}, 400
+    if image_format is not None and image_format not in IMAGE_RENDITION_FORMATS:
+        return {"error": f"Nieprawidłowy format, oczekiwano: {', '.join(IMAGE_RENDITION_FORMATS)}"}, 400
+    if size == 'original':
+        # Oryginał nie jest przekodowywany - inne formaty mają tylko pomniejszone wersje
+        if image_format not in (None, 'jpeg'):
+            return {"error": f"Format {image_format} jest dostępny tylko dla rozmiarów: "
+                             f"{', '.join(IMAGE_RENDITION_SIZES)}"}, 400
+        return send_blob(image.blob_hash, image.blob.mime_type, immutable)
+
+    rendition = db.session.get(ImageRendition, (image.blob_hash, size, image_format or 'jpeg'))
+    if not rendition:
+        # Zdjęcia sprzed wprowadzenia wersji lub nieskonfigurowana wersja - wysyłamy oryginał
+        return send_blob(image.blob_hash, image.blob.mime_type, immutable)
+    return send_blob(rendition.blob_hash, rendition.blob.mime_type, immutable)
+
+
+def send_blob(blob_hash, mime_type, immutable):
+    """Wysłanie pliku z magazynu z obsługą ETag/If-None-Match (304) i Range (206)"""
+    if blob_hash in request.if_none_match:
+        # Klient ma aktualną wersję - nie sięgamy do dysku
+        response = Response(status=304)
+        response.set_etag(blob_hash)
+    else:
+        source = blob_store.path(blob_hash) or io.BytesIO(read_blob(blob_hash))
+        # Zawartość pliku nie zmienia się, więc skrót jest silnym ETagiem
+        response = send_file(source, mimetype=mime_type, etag=blob_hash, conditional=True)
+    response.cache_control.public = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        # Najnowsze zdjęcie może się zmienić - klient sprawdza ETag przy każdym odświeżeniu
+        response.cache_control.no_cache = True
+    return response
+
+
+@ns.route('/<string:room_id>/images/<string:kind>/<int:image_id>')
+class ImageFileResource(Resource):
+    @api.doc(params={
+        'kind': 'original lub processed',
+        'size': 'original (domyślnie) lub nazwa pomniejszonej wersji, np. thumb, medium',
+        'format': 'jpeg (domyślnie) lub webp (tylko dla pomniejszonych wersji)'
+    })
+    def get(self, room_id, kind, image_id):
+        """Pobierz plik zdjęcia o podanym id"""
+        if kind not in IMAGE_KINDS:
+            return {"error": "Nieprawidłowy rodzaj zdjęcia, oczekiwano: original lub processed"}, 400
+
+        image = IMAGE_KINDS[kind].query.filter_by(id=image_id, section=room_id).first()
+        if not image:
+            return {"error": "Nie znaleziono zdjęcia"}, 404
+
+        return send_image(image, immutable=True)
+
+
+@ns.route('/<string:room_id>/images/<string:kind>/latest')
+class LatestImageFileResource(Resource):
+    @api.doc(params={
+        'kind': 'original lub processed',
+        'size': 'original (domyślnie) lub nazwa pomniejszonej wersji, np. thumb, medium',
+        'format': 'jpeg (domyślnie) lub webp (tylko dla pomniejszonych wersji)'
+    })
+    def get(self, room_id, kind):
+        """Pobierz plik najnowszego zdjęcia w sekcji"""
+        if kind not in IMAGE_KINDS:
+            return {"error": "Nieprawidłowy rodzaj zdjęcia, oczekiwano: original lub processed"}, 400
+
+        latest = db.session.get(ImageLatest, room_id)
+        image_id = (latest.image_id if kind == 'original' else latest.image_out_id) if latest else None
+        image = db.session.get(IMAGE_KINDS[kind], image_id) if image_id else None
+        if not image:
+            return {"error": "Brak zdjęć dla tej sekcji"}, 404
+
+        return send_image(image, immutable=False)
+
+
+@app.route('/blobs/<string:blob_hash>')
+def get_blob(blob_hash):
+    """Wysłanie pliku z magazynu bezpośrednio z dysku"""
+    blob = db.session.get(Blob, blob_hash)
+    if not blob:
+        return jsonify({"error": "Nie znaleziono pliku"}), 404
+
+    return send_blob(blob.hash, blob.mime_type, immutable=True)
+
+
+def all_room_ids():
+    """Pokoje występujące w bazie (z urządzeniami, pomiarami, limitami lub zdjęciami) - jedno zapytanie"""
+    rooms = db.union(
+        db.select(SensorDevice.room_id),
+        db.select(CameraDevice.room_id),
+        db.select(SensorLatest.room_id),
+        db.select(SensorLimits.room_id),
+        db.select(ImageLatest.section)
+    ).subquery()
+    return sorted(db.session.execute(db.select(rooms.c[0])).scalars())
+
+
+def load_room_snapshots(room_ids):
+    """Stan pokoi (urządzenia, najnowsze pomiary, limity, ostatnia liczba osób) - po jednym zapytaniu
+    na tabelę niezależnie od liczby pokoi, z tabel najnowszych wartości"""
+    snapshots = {
+        room_id: {"devices": [], "latest": [], "limits": {}, "image": None}
+        for room_id in room_ids
+    }
+    if not snapshots:
+        return snapshots
+    for device in db.session.execute(
+        db.select(SensorDevice).where(SensorDevice.room_id.in_(room_ids)).order_by(SensorDevice.device_id)
+    ).scalars():
+        snapshots[device.room_id]["devices"].append(device)
+    for latest in db.session.execute(
+        db.select(SensorLatest).where(SensorLatest.room_id.in_(room_ids)).order_by(SensorLatest.device_id)
+    ).scalars():
+        snapshots[latest.room_id]["latest"].append(latest)
+    for limits in db.session.execute(
+        db.select(SensorLimits).where(SensorLimits.room_id.in_(room_ids))
+    ).scalars():
+        snapshots[limits.room_id]["limits"][limits.device_id] = limits
+    for image in db.session.execute(
+        db.select(ImageLatest).where(ImageLatest.section.in_(room_ids))
+    ).scalars():
+        snapshots[image.section]["image"] = image
+    return snapshots
+
+
+def snapshot_json(room_id, snapshot):
+    """Stan pokoju w odpowiedzi API - limity urządzenia jak w GET .../<device_id>/limits"""
+    room_limits = snapshot["limits"].get(ROOM_LIMITS)
+    image = snapshot["image"]
+    return {
+        "room_id": room_id,
+        "sensor_devices": [
+            {
+                "device_id": device.device_id,
+                "device_type": device.device_type,
+                "added_on": device.added_on.isoformat(),
+                "limits": limits_json(snapshot["limits"].get(device.device_id, room_limits))
+            }
+            for device in snapshot["devices"]
+        ],
+        "latest": [
+            {
+                "device_id": latest.device_id,
+                "id": latest.data_id,
+                "temperature": latest.temperature,
+                "humidity": latest.humidity,
+                "smoke_level": latest.smoke_level,
+                "timestamp": latest.timestamp.isoformat() if latest.timestamp else None
+            }
+            for latest in snapshot["latest"]
+        ],
+        "limits": limits_json(room_limits),
+        "people": {
+            "people_num": image.people_num,
+            "timestamp": image.timestamp.isoformat() if image.timestamp else None,
+            "original_image_url": image_url(room_id, 'original', image.image_id),
+            "processed_image_url": image_url(room_id, 'processed', image.image_out_id)
+        } if image else None
+    }
 
-        return {"data": result}, 200
+
+@ns.route('/<string:room_id>/snapshot')
+class RoomSnapshotResource(Resource):
+    def get(self, room_id):
+        """Pobierz stan pokoju jednym żądaniem: urządzenia, najnowsze pomiary, limity i liczbę osób"""
+        snapshot = load_room_snapshots([room_id])[room_id]
+        return {"data": snapshot_json(room_id, snapshot)}, 200
+
+
+@ns.route('/snapshot')
+class RoomsSnapshotResource(Resource):
+    @api.doc(params={'rooms': 'Lista pokoi oddzielona przecinkami (domyślnie wszystkie pokoje)'})
+    def get(self):
+        """Pobierz stan wielu pokoi jednym żądaniem"""
+        rooms = request.args.get('rooms')
+        room_ids = list(dict.fromkeys(room for room in rooms.split(',') if room)) if rooms else all_room_ids()
+        snapshots = load_room_snapshots(room_ids)
+        return {"data": [snapshot_json(room_id, snapshots[room_id]) for room_id in room_ids]}, 200
 
 
 @app.route('/site')
 def home():
     """Funkcja wyświetlająca dane na stronie HTML"""
-    # Pobranie najnowszych danych z czujników dla każdej sekcji
+    # Stan wszystkich pokoi ze stałej liczby zapytań
+    snapshots = load_room_snapshots(all_room_ids())
+
+    # Najnowszy pomiar z czujników dla każdej sekcji
     sensor_data = {
-        'A': SensorData.query.filter_by(room_id='A').order_by(SensorData.id.desc()).first(),
-        'B': SensorData.query.filter_by(room_id='B').order_by(SensorData.id.desc()).first(),
-        'C': SensorData.query.filter_by(room_id='C').order_by(SensorData.id.desc()).first()
+        room_id: max(snapshot["latest"], key=lambda latest: latest.data_id, default=None)
+        for room_id, snapshot in snapshots.items()
     }
 
-    # Pobranie najnowszych zdjęć oryginalnych i przetworzonych dla każdej sekcji
-    images_base64 = {}
-    for section in ['A', 'B', 'C']:
-        original_image = Image.query.filter_by(section=section).order_by(Image.id.desc()).first()
-        processed_image = ImageOut.query.filter_by(section=section).order_by(ImageOut.id.desc()).first()
-
-        images_base64[section] = {
-            "original": base64.b64encode(original_image.image_data).decode('utf-8') if original_image else None,
-            "processed": base64.b64encode(processed_image.image_data).decode('utf-8') if processed_image else None,
-            "people_num": processed_image.people_num if processed_image else None,
-            "timestamp": processed_image.timestamp if processed_image else None
+    # Adresy najnowszych zdjęć oryginalnych i przetworzonych dla każdej sekcji
+    # (przeglądarka pobiera je osobno i korzysta z pamięci podręcznej)
+    images = {}
+    for section, snapshot in snapshots.items():
+        latest = snapshot["image"]
+
+        images[section] = {
+            "original": image_url(section, 'original', latest.image_id) if latest else None,
+            "processed": image_url(section, 'processed', latest.image_out_id) if latest else None,
+            "people_num": latest.people_num if latest else None,
+            "timestamp": latest.timestamp if latest else None
         }
 
     # Przekazanie danych do szablonu HTML
     return render_template(
         'index.html',
         sensor_data=sensor_data,
-        images_base64=images_base64
+        images=images
     )
 
 
@@ -383,9 +2610,14 @@ if __name__ == '__main__':
     # Obsługa ustawienia REST API
     api.add_namespace(ns, path='/rooms')
 
+    debug = True  # Debugowanie (można wyłączyć w środowisku produkcyjnym)
+    # Przy debugowaniu kod wykonuje też proces nadzorujący przeładowanie - tam nie uruchamiamy zadań w tle
+    if BACKGROUND_WORKERS and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_background_workers()
+
     # Uruchomienie serwera Flask
     app.run(
         host='0.0.0.0',  # Hostuj na wszystkich dostępnych interfejsach
         port=1880,  # Port serwera
-        debug=True  # Debugowanie (można wyłączyć w środowisku produkcyjnym)
+        debug=debug
     )
\ No newline at end of file
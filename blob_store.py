@@ -0,0 +1,76 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+
+
+class BlobStore(ABC):
+    """Interfejs magazynu plików adresowanego zawartością (klucz to SHA-256 danych)"""
+
+    @abstractmethod
+    def put(self, data):
+        """Zapisuje dane i zwraca ich skrót SHA-256 (identyczne dane są zapisywane raz)"""
+
+    @abstractmethod
+    def get(self, blob_hash):
+        """Zwraca zawartość pliku"""
+
+    @abstractmethod
+    def delete(self, blob_hash):
+        """Usuwa plik (brak pliku nie jest błędem)"""
+
+    def path(self, blob_hash):
+        """Ścieżka na dysku (do wysyłania przez send_file) lub None, jeśli magazyn nie jest lokalny"""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """Magazyn w lokalnym katalogu, pliki rozdzielone na podkatalogi wg początku skrótu (ab/cd/abcd...)"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, blob_hash):
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def put(self, data):
+        blob_hash = hashlib.sha256(data).hexdigest()
+        final_path = self.path(blob_hash)
+        if os.path.exists(final_path):
+            return blob_hash
+
+        directory = os.path.dirname(final_path)
+        os.makedirs(directory, exist_ok=True)
+        # Zapis do pliku tymczasowego i atomowa zmiana nazwy - brak częściowo zapisanych plików
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            os.replace(temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return blob_hash
+
+    def get(self, blob_hash):
+        with open(self.path(blob_hash), 'rb') as blob_file:
+            return blob_file.read()
+
+    def delete(self, blob_hash):
+        try:
+            os.remove(self.path(blob_hash))
+        except FileNotFoundError:
+            pass
+
+
+def create_blob_store(location):
+    """Utworzenie magazynu na podstawie konfiguracji (ścieżka katalogu lub adres file://)"""
+    if location.startswith('file://'):
+        location = location[len('file://'):]
+    if '://' in location:
+        raise ValueError(f"Nieobsługiwany magazyn plików: {location}")
+    return LocalBlobStore(location)
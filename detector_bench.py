@@ -0,0 +1,95 @@
+"""Benchmark of the people detector backends (see detectors.py).
+
+Every backend analyses the sample camera frames, the report shows images/sec and whether its
+people count agrees with the reference backend on every frame.
+
+Examples:
+    python detector_bench.py
+    python detector_bench.py --backends ultralytics,onnx,onnx-int8 --imgsz 480 --threads 2 --batch 3
+"""
+import argparse
+import os
+import time
+
+import detectors
+from inference import _count_people, decode_image
+
+# Sample frames from the cameras
+FRAMES = ["cam-01.jpg", "cam-03.jpg", "camera-01.jpg"]
+
+
+def load_frames(names):
+    frames = []
+    for name in names:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as file:
+            frames.append(decode_image(file.read()))
+    return frames
+
+
+def count_people(model, frames, batch):
+    """People count for every frame, analysing batch frames per model call"""
+    counts = []
+    for start in range(0, len(frames), batch):
+        results = model(frames[start:start + batch], classes=[0], verbose=False)
+        counts.extend(_count_people(result) for result in results)
+    return counts
+
+
+def benchmark(model, frames, batch, iterations, warm_up):
+    """Images per second over the given number of passes over all frames"""
+    for _ in range(warm_up):
+        count_people(model, frames, batch)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        count_people(model, frames, batch)
+    return iterations * len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="People detector benchmark")
+    parser.add_argument("--model", default="yolov8n.pt", help="weights of the reference model")
+    parser.add_argument("--backends", default=",".join(detectors.BACKENDS))
+    parser.add_argument("--reference", default="ultralytics", help="backend whose counts are treated as correct")
+    parser.add_argument("--imgsz", type=int, default=detectors.DETECTOR_IMGSZ)
+    parser.add_argument("--threads", type=int, default=detectors.DETECTOR_THREADS)
+    parser.add_argument("--batch", type=int, default=1, help="frames per model call")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warm-up", type=int, default=2)
+    parser.add_argument("--frames", default=",".join(FRAMES))
+    args = parser.parse_args()
+
+    names = args.frames.split(",")
+    frames = load_frames(names)
+    backends = args.backends.split(",")
+    if args.reference not in backends:
+        backends.insert(0, args.reference)
+
+    rows = []
+    reference_counts = None
+    for backend in backends:
+        try:
+            model = detectors.create_detector(args.model, backend, args.imgsz, args.threads)
+        except Exception as e:
+            print(f"{backend}: not available ({e})")
+            continue
+        counts = count_people(model, frames, args.batch)
+        if backend == args.reference:
+            reference_counts = counts
+        images_per_second = benchmark(model, frames, args.batch, args.iterations, args.warm_up)
+        rows.append((backend, images_per_second, counts))
+
+    print(f"imgsz {args.imgsz}, threads {args.threads or 'default'}, batch {args.batch}")
+    print(f"{'backend':<14}{'images/s':>10}{'speedup':>10}  {'agreement':<12}people per frame ({', '.join(names)})")
+    reference_speed = next((speed for backend, speed, _ in rows if backend == args.reference), None)
+    for backend, images_per_second, counts in rows:
+        speedup = f"{images_per_second / reference_speed:.2f}x" if reference_speed else "-"
+        if reference_counts is None:
+            agreement = "-"
+        else:
+            matching = sum(1 for count, expected in zip(counts, reference_counts) if count == expected)
+            agreement = f"{matching}/{len(counts)}"
+        print(f"{backend:<14}{images_per_second:>10.1f}{speedup:>10}  {agreement:<12}{counts}")
+
+
+if __name__ == "__main__":
+    main()
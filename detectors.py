@@ -0,0 +1,215 @@
+import os
+import tempfile
+
+# Wybór implementacji detektora osób (przekazywany do procesów roboczych przez zmienne środowiskowe):
+# ultralytics - model PyTorch (wzorzec), onnx - wyeksportowany model w ONNX Runtime,
+# onnx-int8 - ten sam model z wagami kwantyzowanymi do int8
+DETECTOR_BACKEND = os.environ.get('DETECTOR_BACKEND', 'ultralytics')
+# Rozmiar obrazu wejściowego modelu (mniejszy - szybciej, ale gorzej widać małe postacie)
+DETECTOR_IMGSZ = int(os.environ.get('DETECTOR_IMGSZ', 640))
+# Liczba wątków obliczeń w jednym procesie roboczym (0 - domyślna biblioteki)
+DETECTOR_THREADS = int(os.environ.get('DETECTOR_THREADS', 0))
+# Minimalna pewność wykrycia i próg IoU przy usuwaniu nakładających się ramek
+DETECTOR_CONF = float(os.environ.get('DETECTOR_CONF', 0.25))
+DETECTOR_IOU = float(os.environ.get('DETECTOR_IOU', 0.7))
+
+BACKENDS = ('ultralytics', 'onnx', 'onnx-int8')
+
+
+class Boxes:
+    """Wykryte obiekty w formacie zgodnym z ultralytics (cls, conf, xyxy)"""
+
+    def __init__(self, xyxy, conf, cls):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+
+class Result:
+    """Wynik dla jednego obrazu - boxes i plot() jak w wynikach ultralytics"""
+
+    def __init__(self, image, boxes):
+        self.image = image
+        self.boxes = boxes
+
+    def plot(self):
+        import cv2
+        annotated = self.image.copy()
+        for (x1, y1, x2, y2), conf in zip(self.boxes.xyxy, self.boxes.conf):
+            cv2.rectangle(annotated, (int(x1), int(y1)), (int(x2), int(y2)), (56, 56, 255), 2)
+            cv2.putText(annotated, f"person {conf:.2f}", (int(x1), max(0, int(y1) - 5)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (56, 56, 255), 1, cv2.LINE_AA)
+        return annotated
+
+
+class UltralyticsDetector:
+    """Model ultralytics z ustawionym rozmiarem wejścia i liczbą wątków"""
+
+    def __init__(self, model_path, imgsz=DETECTOR_IMGSZ, threads=DETECTOR_THREADS):
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+
+    def __call__(self, images, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self.model(images, **kwargs)
+
+
+class OnnxDetector:
+    """Model YOLOv8 wyeksportowany do ONNX i uruchamiany w ONNX Runtime na CPU.
+
+    Przetwarzanie wstępne (letterbox) i końcowe (progi, NMS) jest wykonywane tutaj, więc
+    w procesie roboczym nie jest potrzebny PyTorch. Wywołanie jak modelu ultralytics."""
+
+    def __init__(self, onnx_path, imgsz=DETECTOR_IMGSZ, threads=DETECTOR_THREADS,
+                 conf=DETECTOR_CONF, iou=DETECTOR_IOU):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Model wyeksportowany ze stałym rozmiarem wejścia ma pierwszeństwo przed konfiguracją
+        height, width = model_input.shape[2:4]
+        self.imgsz = (height, width) if isinstance(height, int) and isinstance(width, int) else (imgsz, imgsz)
+        # Przy dynamicznym wymiarze paczki cała paczka idzie jednym wywołaniem
+        self.batched = not isinstance(model_input.shape[0], int)
+        self.conf = conf
+        self.iou = iou
+
+    def __call__(self, images, classes=None, verbose=False, **kwargs):
+        import numpy as np
+        if not isinstance(images, list):
+            images = [images]
+        prepared = [self.preprocess(image) for image in images]
+        tensors = np.stack([tensor for tensor, _ in prepared])
+        if self.batched:
+            outputs = self.session.run(None, {self.input_name: tensors})[0]
+        else:
+            outputs = np.concatenate([
+                self.session.run(None, {self.input_name: tensors[index:index + 1]})[0]
+                for index in range(len(images))
+            ])
+        return [
+            Result(image, self.postprocess(output, transform, image.shape, classes))
+            for image, output, (_, transform) in zip(images, outputs, prepared)
+        ]
+
+    def preprocess(self, image):
+        """Letterbox do rozmiaru wejścia (zachowane proporcje, szare marginesy), BGR -> RGB, NCHW float32"""
+        import cv2
+        import numpy as np
+        target_height, target_width = self.imgsz
+        height, width = image.shape[:2]
+        scale = min(target_height / height, target_width / width)
+        new_width, new_height = round(width * scale), round(height * scale)
+        left = (target_width - new_width) // 2
+        top = (target_height - new_height) // 2
+        canvas = np.full((target_height, target_width, 3), 114, dtype=np.uint8)
+        canvas[top:top + new_height, left:left + new_width] = cv2.resize(
+            image, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+        )
+        tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+        return np.ascontiguousarray(tensor), (scale, left, top)
+
+    def postprocess(self, output, transform, shape, classes=None):
+        """Wyjście YOLOv8 (4 + liczba klas, liczba propozycji) -> ramki w układzie oryginalnego obrazu"""
+        import cv2
+        import numpy as np
+        predictions = output.T
+        scores = predictions[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        keep = confidences >= self.conf
+        if classes is not None:
+            keep &= np.isin(class_ids, classes)
+        boxes, confidences, class_ids = predictions[keep, :4], confidences[keep], class_ids[keep]
+
+        scale, left, top = transform
+        # Środek, szerokość i wysokość -> narożniki, bez marginesów letterbox i w skali oryginału
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = (boxes[:, 0] - boxes[:, 2] / 2 - left) / scale
+        xyxy[:, 1] = (boxes[:, 1] - boxes[:, 3] / 2 - top) / scale
+        xyxy[:, 2] = (boxes[:, 0] + boxes[:, 2] / 2 - left) / scale
+        xyxy[:, 3] = (boxes[:, 1] + boxes[:, 3] / 2 - top) / scale
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+
+        indexes = []
+        if len(xyxy):
+            # NMS osobno dla każdej klasy, jak w ultralytics
+            for class_id in np.unique(class_ids):
+                selected = np.flatnonzero(class_ids == class_id)
+                rects = [[x1, y1, x2 - x1, y2 - y1] for x1, y1, x2, y2 in xyxy[selected].tolist()]
+                kept = cv2.dnn.NMSBoxes(rects, confidences[selected].tolist(), self.conf, self.iou)
+                indexes.extend(selected[np.array(kept, dtype=int).reshape(-1)])
+        indexes = np.array(sorted(indexes, key=lambda index: -confidences[index]), dtype=int)
+        return Boxes(xyxy[indexes], confidences[indexes], class_ids[indexes])
+
+
+def build_model_file(path, build):
+    """Jednokrotne utworzenie pliku modelu przez build(ścieżka tymczasowa) - procesy robocze startujące
+    równocześnie czekają na blokadę pliku, a gotowy plik pojawia się atomowo (bez częściowego zapisu)"""
+    if os.path.exists(path):
+        return path
+    with open(path + '.lock', 'a') as lock_file:
+        try:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except ImportError:
+            pass  # Brak blokad plików (Windows) - zostaje atomowa zamiana pliku
+        if not os.path.exists(path):
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp.onnx')
+            os.close(fd)
+            try:
+                build(temp_path)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+    return path
+
+
+def onnx_model_path(model_path, imgsz=DETECTOR_IMGSZ):
+    """Plik ONNX dla modelu - wskazany wprost lub wyeksportowany z wag .pt przy pierwszym użyciu"""
+    if model_path.endswith('.onnx'):
+        return model_path
+
+    def export(temp_path):
+        from ultralytics import YOLO
+        # Dynamiczny wymiar paczki - paczki zdjęć z kolejki analizowane jednym wywołaniem.
+        # Eksport zapisuje plik o stałej nazwie obok wag - pod blokadą build_model_file
+        exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        os.replace(exported, temp_path)
+
+    return build_model_file(f"{os.path.splitext(model_path)[0]}-{imgsz}.onnx", export)
+
+
+def int8_model_path(onnx_path):
+    """Wersja modelu ONNX z wagami int8 (kwantyzacja dynamiczna, bez danych kalibracyjnych)"""
+    def quantize(temp_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(onnx_path, temp_path, weight_type=QuantType.QUInt8)
+
+    return build_model_file(f"{os.path.splitext(onnx_path)[0]}-int8.onnx", quantize)
+
+
+def create_detector(model_path, backend=None, imgsz=None, threads=None):
+    """Detektor wybranego rodzaju - do użycia jako INFERENCE_MODEL_FACTORY='detectors:create_detector'"""
+    backend = backend or DETECTOR_BACKEND
+    imgsz = imgsz or DETECTOR_IMGSZ
+    threads = DETECTOR_THREADS if threads is None else threads
+    if backend == 'ultralytics':
+        return UltralyticsDetector(model_path, imgsz, threads)
+    if backend == 'onnx':
+        return OnnxDetector(onnx_model_path(model_path, imgsz), imgsz, threads)
+    if backend == 'onnx-int8':
+        return OnnxDetector(int8_model_path(onnx_model_path(model_path, imgsz)), imgsz, threads)
+    raise ValueError(f"Nieznany rodzaj detektora: {backend}, dostępne: {', '.join(BACKENDS)}")
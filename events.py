@@ -0,0 +1,97 @@
+import itertools
+import json
+import queue
+import threading
+
+# Typy zdarzeń publikowanych przez serwer
+EVENT_TYPES = ('reading', 'people', 'limits')
+
+
+class Subscription:
+    """Subskrypcja zdarzeń pokoju z ograniczonym buforem.
+
+    Jeśli klient nie nadąża z odbiorem i bufor się zapełni, subskrypcja jest zamykana -
+    publikujący nigdy nie czeka na wolnych odbiorców."""
+
+    def __init__(self, bus, room_id, device_id=None, types=None, max_queue=100):
+        self.bus = bus
+        self.room_id = room_id
+        self.device_id = device_id
+        self.types = set(types) if types else None
+        self.dropped = False
+        self._queue = queue.Queue(maxsize=max_queue)
+
+    def matches(self, event):
+        if self.types is not None and event['type'] not in self.types:
+            return False
+        # Zdarzenia dotyczące całego pokoju (bez device_id) trafiają do wszystkich subskrypcji pokoju
+        return self.device_id is None or event.get('device_id') in (None, self.device_id)
+
+    def offer(self, event):
+        """Dodanie zdarzenia do bufora bez blokowania - zwraca False, gdy odbiorca nie nadąża"""
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped = True
+            return False
+
+    def get(self, timeout=None):
+        """Następne zdarzenie lub None po upływie czasu (albo po zamknięciu subskrypcji)"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Publikowanie zdarzeń w obrębie procesu serwera do subskrybentów pogrupowanych wg pokoju"""
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # Statystyki
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, room_id, device_id=None, types=None):
+        subscription = Subscription(self, room_id, device_id, types, self.max_queue)
+        with self._lock:
+            self._subscriptions.setdefault(room_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.room_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.room_id]
+
+    def publish(self, room_id, event_type, data, device_id=None):
+        """Wysłanie zdarzenia do subskrybentów pokoju, wolni subskrybenci są odłączani"""
+        event = {'id': next(self._ids), 'type': event_type, 'room_id': room_id, 'device_id': device_id, 'data': data}
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(room_id, ()))
+            self.published += 1
+        for subscription in subscriptions:
+            if subscription.matches(event) and not subscription.offer(event):
+                self.dropped += 1
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribers(self):
+        """Liczba aktywnych subskrypcji"""
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+def format_sse(event):
+    """Zdarzenie w formacie text/event-stream"""
+    payload = {'room_id': event['room_id'], 'device_id': event['device_id'], **event['data']}
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(payload, default=str)}\n\n"
@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _WriteRequest:
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class GroupCommitWriter:
+    """Wątek zapisujący do bazy: zbiera zlecenia z kolejki i zatwierdza wiele z nich w jednej transakcji.
+
+    flush(payloads) zapisuje listę zleceń i zatwierdza transakcję, zwracając listę wyników w tej samej
+    kolejności. Zlecenie jest potwierdzane (future.result()) dopiero po zatwierdzeniu transakcji.
+    Po pierwszym zleceniu wątek czeka maks. max_latency_ms na kolejne, ale nie zbiera więcej niż max_batch."""
+
+    def __init__(self, flush, max_batch=1000, max_latency_ms=5):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_latency_ms = max_latency_ms
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        # Statystyki zatwierdzeń
+        self.commits = 0
+        self.writes = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, payload):
+        """Dodanie zlecenia zapisu, zwraca Future z wynikiem zapisu"""
+        self._start()
+        request = _WriteRequest(payload)
+        self._queue.put(request)
+        return request.future
+
+    def write(self, payload, timeout=None):
+        """Zapis i oczekiwanie na zatwierdzenie transakcji"""
+        return self.submit(payload).result(timeout)
+
+    def pending(self):
+        """Liczba zleceń oczekujących w kolejce"""
+        return self._queue.qsize()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued + self.max_latency_ms / 1000
+        while len(batch) < self.max_batch:
+            try:
+                # Zlecenia, które napłynęły w trakcie poprzedniego zapisu, są już w kolejce
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.flush([request.payload for request in batch])
+            except Exception:
+                # Błędne zlecenie nie może odrzucić całej grupy - zapisujemy pojedynczo
+                for request in batch:
+                    try:
+                        request.future.set_result(self.flush([request.payload])[0])
+                        self.commits += 1
+                    except Exception as e:
+                        request.future.set_exception(e)
+            else:
+                self.commits += 1
+                for request, result in zip(batch, results):
+                    request.future.set_result(result)
+            self.writes += len(batch)
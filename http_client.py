@@ -1,5 +1,8 @@
 import requests
+import array
 import json
+import struct
+import sys
 from rpi_sim import retry
 
 
@@ -30,6 +33,31 @@ def send_measurements(base_url, room_id, device_id, temp, hum, smoke):
         return
 
 
+@retry(max_attemps=3, delay=5)
+def send_measurements_batch(base_url, room_id, readings):
+    """Function for putting measurements of many devices in given room with a single request,
+        readings is a list of dicts with device_id, temperature, humidity, smoke_level and optional timestamp"""
+    if not readings:
+        return
+    # Defining data and headers
+    data = {"readings": readings}
+    headers = {"Content-Type": "application/json"}
+
+    # Parsing destination url
+    dest_url = base_url + "/rooms/" + str(room_id) + "/sensor-data/batch"
+
+    # Sending request
+    response = requests.post(dest_url, data=json.dumps(data), headers=headers)
+
+    # Checking response code
+    if response.status_code == 200:
+        print(f"Data sent successfully, response {response.json()}")
+        return
+    else:
+        print(f"Failed to send data, response {response.json()}")
+        return
+
+
 @retry(max_attemps=3, delay=5)
 def send_photo(base_url, room_id, camera_id, file_path):
     """Function for posting a photo taken in the given room by the given camera"""
@@ -44,8 +72,8 @@ def send_photo(base_url, room_id, camera_id, file_path):
     except Exception as e:
         print(f"Couldn't send photo, error: {e}")
 
-    # Checking response code
-    if response.status_code == 200:
+    # Checking response code (202 - photo accepted, people are counted in the background)
+    if response.status_code in (200, 202):
         print(f"Data sent successfully, response {response.json()}")
         return
     else:
@@ -76,6 +104,82 @@ def get_limits(base_url, room_id):
         return None
 
 
+def decode_series(content):
+    """Decoding the binary series format (application/vnd.sensor-series) into the same
+        dict as the JSON response, missing values are None"""
+    if content[:4] != b"SSR1":
+        raise ValueError("Not a sensor series response")
+    header_length = struct.unpack_from("<I", content, 4)[0]
+    data = json.loads(content[8:8 + header_length])
+    offset = 8 + header_length
+    count = data["count"]
+    arrays = []
+    for typecode in ["q"] + ["d"] * len(data["series"]):
+        values = array.array(typecode)
+        values.frombytes(content[offset:offset + 8 * count])
+        if sys.byteorder == "big":
+            values.byteswap()
+        arrays.append(values)
+        offset += 8 * count
+    data["timestamps"] = arrays[0].tolist()
+    for series, values in zip(data["series"], arrays[1:]):
+        series["values"] = [None if value != value else value for value in values]
+    return data
+
+
+@retry(max_attemps=3, delay=5)
+def get_room_series(base_url, room_id, devices=None, metrics=None, time_from=None, time_to=None, binary=True):
+    """Function for getting readings of many devices in given room with a single request,
+        returns a dict with timestamps (ms since epoch) and a list of series with values"""
+    dest_url = base_url + "/rooms/" + str(room_id) + "/series"
+    params = {}
+    if devices:
+        params["devices"] = ",".join(devices)
+    if metrics:
+        params["metrics"] = ",".join(metrics)
+    if time_from:
+        params["from"] = time_from
+    if time_to:
+        params["to"] = time_to
+    headers = {"Accept": "application/vnd.sensor-series" if binary else "application/json"}
+    try:
+        # Sending request
+        response = requests.get(dest_url, params=params, headers=headers, timeout=30)
+        response.raise_for_status()
+        if response.headers.get("Content-Type", "").startswith("application/vnd.sensor-series"):
+            return decode_series(response.content)
+        return response.json()
+    # Checking for exceptions
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to get series, response {e}")
+        return None
+    except ValueError:
+        print("Can't process the response")
+        return None
+
+
+@retry(max_attemps=3, delay=5)
+def get_room_snapshot(base_url, room_id):
+    """Function for getting the sensor devices, their latest readings, limits and the
+        latest people number of the given room with a single request"""
+    dest_url = base_url + "/rooms/" + str(room_id) + "/snapshot"
+    try:
+        # Sending request
+        response = requests.get(dest_url, timeout=10)
+        response.raise_for_status()
+        # Returning data if successfully received
+        data = response.json()
+        print(data)
+        return data["data"]
+    # Checking for exceptions
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to get room snapshot, response {e}")
+        return None
+    except ValueError:
+        print("Can't process the response as JSON")
+        return None
+
+
 @retry(max_attemps=3, delay=5)
 def get_people_number(base_url, room_id, camera_id):
     """Function for getting people number limit"""
@@ -0,0 +1,372 @@
+import importlib
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Model używany w procesach roboczych
+MODEL_PATH = "yolov8n.pt"
+# Rozmiar obrazu używanego do rozgrzania modelu
+WARM_UP_SIZE = 640
+# Formaty zapisu obrazów: rozszerzenie dla cv2.imencode i nazwa parametru jakości
+IMAGE_FORMATS = {'jpeg': ('.jpg', 'IMWRITE_JPEG_QUALITY'), 'webp': ('.webp', 'IMWRITE_WEBP_QUALITY')}
+
+# Model wczytany w bieżącym procesie - dostęp tylko przez get_model()
+_model = None
+_model_lock = threading.Lock()
+
+
+def load_factory(spec):
+    """Funkcja tworząca model podana jako 'moduł:funkcja' (np. 'load_test:fake_detector').
+    Tekst, a nie obiekt, aby dało się ją przekazać do procesów roboczych"""
+    module_name, _, name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), name)
+
+
+def get_model(model_path=MODEL_PATH, model_factory=None):
+    """Model wczytywany przy pierwszym użyciu (ultralytics importowany dopiero wtedy).
+    model_factory ('moduł:funkcja') zastępuje YOLO - funkcja dostaje model_path i zwraca obiekt
+    wywoływany jak model ultralytics"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            if model_factory:
+                _model = load_factory(model_factory)(model_path)
+            else:
+                from ultralytics import YOLO
+                _model = YOLO(model_path)
+        return _model
+
+
+def warm_up(model):
+    """Analiza pustego obrazu, aby pierwsze prawdziwe zdjęcie nie płaciło za inicjalizację modelu"""
+    import numpy as np
+    model(np.zeros((WARM_UP_SIZE, WARM_UP_SIZE, 3), dtype=np.uint8), verbose=False)
+
+
+def _init_worker(model_path, warm, model_factory=None):
+    """Przygotowanie procesu roboczego - przy starcie przez fork model jest już wczytany w rodzicu"""
+    model = get_model(model_path, model_factory)
+    if warm:
+        warm_up(model)
+
+
+def _ping():
+    return True
+
+
+def _count_people(result):
+    # Klasa 0 w zbiorze COCO to osoba
+    return int(sum(1 for cls in result.boxes.cls if int(cls) == 0))
+
+
+def objRecBatch(images, model):
+    """Analiza wielu obrazów (tablice BGR) jednym wywołaniem modelu,
+    zwraca listę (liczba osób, obraz z zaznaczonymi osobami)"""
+    results = model(list(images), classes=[0], verbose=False)
+    return [(_count_people(result), result.plot()) for result in results]
+
+
+def decode_image(image_data):
+    """Dekodowanie JPEG z pamięci do tablicy BGR"""
+    import cv2
+    import numpy as np
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Nie udało się zdekodować zdjęcia")
+    return image
+
+
+def dhash(image_data, hash_size=8):
+    """Skrót percepcyjny (dHash) zdjęcia JPEG - bity porównań jasności sąsiednich pikseli
+    w pomniejszonym obrazie. Podobne klatki mają skróty różniące się na niewielu bitach.
+    Dekodowanie od razu w 1/8 rozdzielczości, więc koszt jest niewielki w porównaniu z analizą"""
+    import cv2
+    import numpy as np
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        raise ValueError("Nie udało się zdekodować zdjęcia")
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return int.from_bytes(np.packbits(small[:, 1:] > small[:, :-1]).tobytes(), 'big')
+
+
+def hamming_distance(first, second):
+    """Liczba różniących się bitów dwóch skrótów"""
+    return bin(first ^ second).count('1')
+
+
+def encode_image(image, quality=90, image_format='jpeg'):
+    """Kodowanie tablicy BGR do JPEG (lub innego formatu z IMAGE_FORMATS) w pamięci"""
+    import cv2
+    extension, quality_flag = IMAGE_FORMATS[image_format]
+    ok, buffer = cv2.imencode(extension, image, [getattr(cv2, quality_flag), quality])
+    if not ok:
+        raise ValueError("Nie udało się zakodować zdjęcia")
+    return buffer.tobytes()
+
+
+def make_renditions(image, renditions):
+    """Pomniejszone i przekodowane wersje obrazu. renditions to lista krotek
+    (rozmiar, szerokość lub None dla pełnej rozdzielczości, format, jakość),
+    zwraca słownik {(rozmiar, format): dane}"""
+    import cv2
+    resized = {}
+    result = {}
+    for size, width, image_format, quality in renditions:
+        if size not in resized:
+            height, current_width = image.shape[:2]
+            # Bez powiększania obrazów mniejszych niż docelowa szerokość
+            if width and width < current_width:
+                new_height = max(1, round(height * width / current_width))
+                resized[size] = cv2.resize(image, (width, new_height), interpolation=cv2.INTER_AREA)
+            else:
+                resized[size] = image
+        result[(size, image_format)] = encode_image(resized[size], quality, image_format)
+    return result
+
+
+def detect_batch(images_data, renditions=(), timings=None):
+    """Analiza paczki zdjęć w procesie roboczym - dla każdego zdjęcia zwraca
+    (liczba osób, JPEG z oznaczeniami, wersje zdjęć) albo wyjątek, jeśli nie dało się go przetworzyć.
+    Wersje zdjęć to {'original': {...}, 'processed': {...}} w formacie make_renditions().
+    Jeśli podano słownik timings, zapisywany jest w nim czas etapów: decode, detect, encode (s)"""
+    results = [None] * len(images_data)
+    images = []
+    indexes = []
+    start = time.perf_counter()
+    for index, image_data in enumerate(images_data):
+        try:
+            images.append(decode_image(image_data))
+            indexes.append(index)
+        except Exception as e:
+            # Uszkodzone zdjęcie nie blokuje pozostałych z paczki
+            results[index] = e
+    decoded = time.perf_counter()
+    detected = decoded
+    if images:
+        analyzed = objRecBatch(images, get_model())
+        detected = time.perf_counter()
+        for index, image, (people_num, annotated) in zip(indexes, images, analyzed):
+            image_renditions = {
+                'original': make_renditions(image, renditions),
+                'processed': make_renditions(annotated, renditions)
+            }
+            results[index] = (people_num, encode_image(annotated), image_renditions)
+    if timings is not None:
+        timings.update(decode=decoded - start, detect=detected - decoded, encode=time.perf_counter() - detected)
+    return results
+
+
+def detect_batch_timed(images_data, renditions=()):
+    """detect_batch zwracający także czasy etapów - (wyniki, {etap: czas w s})"""
+    timings = {}
+    return detect_batch(images_data, renditions, timings), timings
+
+
+class _PendingFrame:
+    def __init__(self, job_id, image_data):
+        self.job_id = job_id
+        self.image_data = image_data
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class InferenceQueue:
+    """Kolejka analizy zdjęć w puli procesów (poza GIL-em serwera).
+
+    Zdjęcia napływające w krótkim oknie czasu są łączone w paczki (maks. max_batch_size zdjęć,
+    maks. max_wait_ms oczekiwania) i analizowane jednym wywołaniem modelu. Nowa paczka jest
+    wysyłana dopiero, gdy któryś proces roboczy jest wolny, więc przy obciążeniu paczki rosną."""
+
+    def __init__(self, workers=1, model_path=MODEL_PATH, max_batch_size=8, max_wait_ms=50, renditions=(),
+                 on_batch=None, model_factory=None):
+        self.workers = workers
+        self.model_path = model_path
+        self.model_factory = model_factory
+        # Wersje zdjęć tworzone razem z analizą (lista dla make_renditions)
+        self.renditions = list(renditions)
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        # on_batch(rozmiar paczki, czasy oczekiwania zdjęć, czas paczki, czasy etapów) - np. do metryk
+        self.on_batch = on_batch
+        self._executor = None
+        self._preloaded = False
+        self._thread = None
+        self._stopping = False
+        self._pending = []
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._free_workers = threading.Semaphore(workers)
+        # Statystyki do strojenia przepustowości względem opóźnienia
+        self._batches = 0
+        self._frames = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._batch_time_total = 0.0
+
+    def preload(self):
+        """Wczytanie i rozgrzanie modelu w bieżącym procesie przed utworzeniem procesów roboczych.
+
+        Procesy robocze (oraz procesy serwera uruchamiane np. przez gunicorn --preload) tworzone są
+        wtedy przez fork i współdzielą wagi modelu (copy-on-write) zamiast wczytywać je osobno.
+        Trzeba wywołać przed startem wątków serwera."""
+        warm_up(get_model(self.model_path, self.model_factory))
+        self._preloaded = True
+
+    def start(self):
+        """Uruchomienie procesów roboczych i rozgrzanie modelu przed przyjęciem pierwszych zdjęć"""
+        with self._lock:
+            self._start()
+            executor = self._executor
+        # Każde zadanie wymusza start procesu roboczego, a ten wczytuje i rozgrzewa model
+        for future in [executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def _start(self):
+        # Wywoływane z założoną blokadą
+        if self._executor is None:
+            self._stopping = False
+            context = multiprocessing.get_context('fork') if self._preloaded else None
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context,
+                initializer=_init_worker, initargs=(self.model_path, not self._preloaded, self.model_factory)
+            )
+            self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, job_id, image_data, callback):
+        """Dodanie zdjęcia do kolejki, callback(job_id, future) jest wywoływany po zakończeniu analizy"""
+        frame = _PendingFrame(job_id, image_data)
+
+        def done(finished):
+            try:
+                callback(job_id, finished)
+            finally:
+                with self._lock:
+                    self._futures.pop(job_id, None)
+
+        frame.future.add_done_callback(done)
+        with self._condition:
+            self._start()
+            self._futures[job_id] = frame.future
+            self._pending.append(frame)
+            self._condition.notify()
+        return frame.future
+
+    def _collect_batch(self):
+        """Oczekiwanie na pierwsze zdjęcie, a potem na kolejne do zapełnienia paczki lub upływu okna"""
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+            if self._stopping:
+                return []
+            deadline = self._pending[0].enqueued + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            self._free_workers.acquire()
+            batch = self._collect_batch()
+            if not batch:
+                self._free_workers.release()
+                if self._stopping:
+                    return
+                continue
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        now = time.monotonic()
+        waits = [now - frame.enqueued for frame in batch]
+        with self._lock:
+            self._batches += 1
+            self._frames += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for wait in waits:
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+        for frame in batch:
+            frame.future.set_running_or_notify_cancel()
+
+        try:
+            batch_future = self._executor.submit(
+                detect_batch_timed, [frame.image_data for frame in batch], self.renditions
+            )
+        except Exception as e:
+            self._free_workers.release()
+            for frame in batch:
+                frame.future.set_exception(e)
+            return
+
+        def route(finished):
+            # Przekazanie wyników paczki do zadań, z których pochodziły zdjęcia
+            self._free_workers.release()
+            duration = time.monotonic() - now
+            with self._lock:
+                self._batch_time_total += duration
+            try:
+                results, timings = finished.result()
+            except Exception as e:
+                for frame in batch:
+                    frame.future.set_exception(e)
+                return
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(len(batch), waits, duration, timings)
+                except Exception:
+                    pass
+            for frame, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    frame.future.set_exception(result)
+                else:
+                    frame.future.set_result(result)
+
+        batch_future.add_done_callback(route)
+
+    def is_running(self, job_id):
+        """Czy zadanie jest właśnie analizowane przez proces roboczy"""
+        with self._lock:
+            future = self._futures.get(job_id)
+        return future is not None and future.running()
+
+    def pending(self):
+        """Liczba zadań oczekujących lub w trakcie analizy"""
+        with self._lock:
+            return len(self._futures)
+
+    def stats(self):
+        """Statystyki paczek: rozmiary i czas oczekiwania zdjęć w kolejce"""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "workers": self.workers,
+                "pending": len(self._futures),
+                "queued": len(self._pending),
+                "batches": self._batches,
+                "frames": self._frames,
+                "avg_batch_size": self._frames / self._batches if self._batches else None,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "avg_queue_wait_ms": 1000 * self._wait_total / self._frames if self._frames else None,
+                "max_queue_wait_ms": 1000 * self._wait_max,
+                "avg_batch_time_ms": 1000 * self._batch_time_total / self._batches if self._batches else None
+            }
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            executor, self._executor = self._executor, None
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(wait=wait)
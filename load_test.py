@@ -0,0 +1,324 @@
+"""Load generator for the sensor API.
+
+Drives the API with a mix of sensor PUTs, latest-value GETs, metric history GETs and image
+uploads from N virtual rooms with M devices each and reports throughput and latency percentiles
+per operation. Traffic can be recorded to JSONL and replayed later, and reports can be saved and
+compared against a baseline.
+
+Examples:
+    python load_test.py --requests 2000 --concurrency 8 --record traffic.jsonl --report base.json
+    python load_test.py --replay traffic.jsonl --baseline base.json
+    python load_test.py --url http://localhost:1880 --mix put=80,latest=20
+
+By default the app is imported and driven in-process (Flask test client) on a fresh database in a
+temporary directory, with the people detector replaced by fake_detector, so runs don't depend on
+the YOLO weights. To use the fake detector with a real server, start it with
+INFERENCE_MODEL_FACTORY=load_test:fake_detector (and LOAD_TEST_DETECTOR_DELAY_MS).
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+# Default share of every operation in the generated traffic
+DEFAULT_MIX = {"put": 60, "latest": 25, "history": 10, "image": 5}
+# Sample camera frames sent by image uploads
+IMAGES = ["cam-01.jpg", "cam-03.jpg", "camera-01.jpg"]
+
+
+class FakeBoxes:
+    def __init__(self, people_num):
+        self.cls = [0] * people_num
+
+
+class FakeResult:
+    def __init__(self, image, people_num):
+        self.image = image
+        self.boxes = FakeBoxes(people_num)
+
+    def plot(self):
+        return self.image.copy()
+
+
+class FakeDetector:
+    """Stand-in for the ultralytics model: sleeps for delay seconds per call and returns
+    a people count derived from the image content (the same frame always gives the same count)"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __call__(self, images, **kwargs):
+        time.sleep(self.delay)
+        if not isinstance(images, list):
+            images = [images]
+        return [FakeResult(image, hashlib.sha256(image.tobytes()).digest()[0] % 5) for image in images]
+
+
+def fake_detector(model_path):
+    """Model factory for INFERENCE_MODEL_FACTORY, delay is taken from LOAD_TEST_DETECTOR_DELAY_MS"""
+    return FakeDetector(float(os.environ.get("LOAD_TEST_DETECTOR_DELAY_MS", 50)) / 1000)
+
+
+def parse_mix(text):
+    """Parsing 'put=60,latest=25' into a dict of weights"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}, allowed: {', '.join(DEFAULT_MIX)}")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def generate_operations(count, rooms, devices, mix, seed):
+    """Deterministic list of operations for the given seed"""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    operations = []
+    for _ in range(count):
+        op = rng.choices(names, weights)[0]
+        room_id = f"room-{rng.randrange(rooms)}"
+        device_id = f"sensor-{rng.randrange(devices)}"
+        operations.append(make_operation(op, room_id, device_id, rng))
+    return operations
+
+
+def make_operation(op, room_id, device_id, rng):
+    if op == "put":
+        return {"op": op, "method": "PUT", "path": f"/rooms/{room_id}/sensor-devices/{device_id}/data", "json": {
+            "temperature": round(rng.uniform(15, 30), 1),
+            "humidity": round(rng.uniform(20, 70), 1),
+            "smoke_level": round(rng.uniform(0, 20), 1)
+        }}
+    if op == "latest":
+        return {"op": op, "method": "GET", "path": f"/rooms/{room_id}/sensor-devices/{device_id}/data"}
+    if op == "history":
+        return {"op": op, "method": "GET",
+                "path": f"/rooms/{room_id}/sensor-devices/{device_id}/data/temperature?limit=100"}
+    return {"op": op, "method": "POST", "path": f"/rooms/{room_id}/cameras/camera-0/images",
+            "image": rng.choice(IMAGES)}
+
+
+def warm_up_operations(operations):
+    """One reading for every device that is read, so latest and history requests don't start with 404"""
+    rng = random.Random(0)
+    # Paths look like /rooms/<room_id>/sensor-devices/<device_id>/...
+    devices = sorted({
+        tuple(operation["path"].split("/")[2:5:2]) for operation in operations if operation["op"] in ("latest", "history")
+    })
+    return [make_operation("put", room_id, device_id, rng) for room_id, device_id in devices]
+
+
+def write_jsonl(path, operations):
+    with open(path, "w") as file:
+        for operation in operations:
+            file.write(json.dumps(operation) + "\n")
+
+
+def read_jsonl(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class InProcessClient:
+    """Sending operations to the app through the Flask test client"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def send(self, operation, image_data):
+        if not hasattr(self.local, "client"):
+            self.local.client = self.app.test_client()
+        client = self.local.client
+        if "image" in operation:
+            data = {"file": (io.BytesIO(image_data[operation["image"]]), operation["image"])}
+            response = client.open(operation["path"], method=operation["method"], data=data)
+        else:
+            response = client.open(operation["path"], method=operation["method"], json=operation.get("json"))
+        # Reading the body, so streamed responses are included in the latency
+        response.get_data()
+        return response.status_code
+
+
+class HttpClient:
+    """Sending operations to a running server"""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+        self.requests = requests
+
+    def send(self, operation, image_data):
+        if not hasattr(self.local, "session"):
+            self.local.session = self.requests.Session()
+        url = self.base_url + operation["path"]
+        if "image" in operation:
+            files = {"file": (operation["image"], image_data[operation["image"]], "image/jpeg")}
+            response = self.local.session.request(operation["method"], url, files=files, timeout=60)
+        else:
+            response = self.local.session.request(operation["method"], url, json=operation.get("json"), timeout=60)
+        return response.status_code
+
+
+def run_operations(client, operations, concurrency, image_data, paced=False):
+    """Sending operations from concurrency threads, returns (results, elapsed seconds, send offsets).
+    With paced=True operations are not sent before their recorded offset 't'"""
+    results = []
+    offsets = [None] * len(operations)
+    results_lock = threading.Lock()
+    next_index = iter(range(len(operations)))
+    index_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def worker():
+        while True:
+            with index_lock:
+                index = next(next_index, None)
+            if index is None:
+                return
+            operation = operations[index]
+            if paced and "t" in operation:
+                delay = operation["t"] - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            sent = time.perf_counter()
+            offsets[index] = sent - start
+            try:
+                status = client.send(operation, image_data)
+            except Exception as e:
+                print(f"{operation['op']} failed: {e}")
+                status = None
+            latency = time.perf_counter() - sent
+            with results_lock:
+                results.append((operation["op"], status, latency))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start, offsets
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))]
+
+
+def summarize(results, elapsed):
+    report = {"elapsed_s": elapsed, "operations": {}}
+    for op in sorted({result[0] for result in results}) + ["total"]:
+        selected = [result for result in results if op == "total" or result[0] == op]
+        latencies = sorted(result[2] for result in selected)
+        report["operations"][op] = {
+            "count": len(selected),
+            "errors": sum(1 for result in selected if result[1] is None or result[1] >= 400),
+            "throughput_rps": len(selected) / elapsed if elapsed else None,
+            "mean_ms": 1000 * sum(latencies) / len(latencies),
+            "p50_ms": 1000 * percentile(latencies, 0.50),
+            "p95_ms": 1000 * percentile(latencies, 0.95),
+            "p99_ms": 1000 * percentile(latencies, 0.99)
+        }
+    return report
+
+
+def print_report(report, baseline=None):
+    columns = ["count", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    print(f"elapsed: {report['elapsed_s']:.2f} s")
+    print(f"{'operation':<10}" + "".join(f"{column:>16}" for column in columns))
+    for op, stats in report["operations"].items():
+        line = f"{op:<10}"
+        for column in columns:
+            value = stats[column]
+            cell = f"{value:.1f}" if isinstance(value, float) else str(value)
+            reference = (baseline or {}).get("operations", {}).get(op, {}).get(column)
+            if column not in ("count", "errors") and reference:
+                cell += f" ({100 * (value - reference) / reference:+.0f}%)"
+            line += f"{cell:>16}"
+        print(line)
+    if "inference_drain_s" in report:
+        print(f"inference queue drained {report['inference_drain_s']:.2f} s after the last request")
+
+
+def create_app(workdir, detector_delay_ms):
+    """Importing the app on a fresh database in workdir with the fake detector"""
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(os.path.join(workdir, "load_test.db"))
+    os.environ["BLOB_STORE"] = os.path.join(workdir, "blobs")
+    os.environ.setdefault("INFERENCE_MODEL_FACTORY", "load_test:fake_detector")
+    os.environ["LOAD_TEST_DETECTOR_DELAY_MS"] = str(detector_delay_ms)
+    import api_kod
+    return api_kod
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the sensor API")
+    parser.add_argument("--url", help="base url of a running server (default: drive the app in-process)")
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--devices", type=int, default=3, help="sensor devices per room")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. put=60,latest=25,history=10,image=5")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--detector-delay-ms", type=float, default=50, help="fake detector delay (in-process only)")
+    parser.add_argument("--workdir", help="directory for the in-process database (default: temporary)")
+    parser.add_argument("--record", help="save the generated traffic to a JSONL file")
+    parser.add_argument("--replay", help="send traffic from a JSONL file instead of generating it")
+    parser.add_argument("--paced", action="store_true", help="replay with the recorded timing")
+    parser.add_argument("--report", help="save the report as JSON")
+    parser.add_argument("--baseline", help="compare with a report saved earlier")
+    args = parser.parse_args()
+
+    if args.replay:
+        operations = read_jsonl(args.replay)
+    else:
+        operations = generate_operations(args.requests, args.rooms, args.devices, args.mix, args.seed)
+
+    image_data = {}
+    for name in IMAGES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), "rb") as file:
+            image_data[name] = file.read()
+
+    api_kod = None
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        api_kod = create_app(args.workdir or tempfile.mkdtemp(prefix="load_test_"), args.detector_delay_ms)
+        client = InProcessClient(api_kod.app)
+    run_operations(client, warm_up_operations(operations), args.concurrency, image_data)
+
+    results, elapsed, offsets = run_operations(client, operations, args.concurrency, image_data, args.paced)
+    report = summarize(results, elapsed)
+
+    if api_kod is not None:
+        # Uploads only queue the frame, so waiting for the detector shows the real image throughput
+        drain_start = time.perf_counter()
+        while api_kod.inference_queue.pending():
+            time.sleep(0.01)
+        report["inference_drain_s"] = time.perf_counter() - drain_start
+        api_kod.inference_queue.shutdown()
+
+    if args.record:
+        # Offsets from this run, used by --paced replays
+        write_jsonl(args.record, [dict(operation, t=round(offset, 4)) for operation, offset in zip(operations, offsets)])
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import collections
+import json
+import threading
+import time
+from datetime import datetime
+
+# Temat, na którym czujniki publikują pomiary: published_data/<room_id>/<device_id>
+MQTT_TOPIC = 'published_data/#'
+# Wiadomości, których nie udało się zapisać, są publikowane ponownie z tym przedrostkiem tematu
+DEAD_LETTER_PREFIX = 'dead_letter/'
+MEASUREMENT_FIELDS = ('temperature', 'humidity', 'smoke_level')
+
+
+def parse_message(topic, payload):
+    """Pomiar z wiadomości czujnika (jak w rpi_zero_sim) - zwraca (room_id, pomiar)"""
+    parts = topic.split('/')
+    if len(parts) < 3 or parts[0] != 'published_data':
+        raise ValueError(f"Nieobsługiwany temat: {topic}")
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        raise ValueError("Wiadomość nie jest obiektem JSON")
+    if data.get("timestamp") is not None:
+        # Sprawdzenie formatu ISO 8601 już przy odbiorze
+        datetime.fromisoformat(str(data["timestamp"]))
+    for field in MEASUREMENT_FIELDS:
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"Pole {field} nie jest liczbą")
+    device_id = data.get("id") or parts[2]
+    if not isinstance(device_id, str):
+        raise ValueError("Pole id nie jest tekstem")
+    return parts[1], {
+        "device_id": device_id,
+        "temperature": data.get("temperature"),
+        "humidity": data.get("humidity"),
+        "smoke_level": data.get("smoke_level"),
+        "timestamp": data.get("timestamp")
+    }
+
+
+class MqttBridge:
+    """Odbiór pomiarów z brokera MQTT bezpośrednio na serwerze (bez pośrednictwa Rpi i HTTP).
+
+    Wiadomości QoS 1 są zbierane w paczki (maks. max_batch, maks. max_latency_ms oczekiwania)
+    i przekazywane do store(lista (room_id, pomiar)), które wraca po trwałym zapisie. Dopiero
+    wtedy wiadomości są potwierdzane (PUBACK) - przy awarii broker dostarczy je ponownie
+    (co najmniej raz), a powtórzenia odrzuca store na podstawie (device_id, timestamp).
+    Trwała sesja (stały client_id, clean_start=False) zachowuje wiadomości z czasu przerwy.
+
+    Paczka, której nie udało się zapisać max_retries razy, jest zapisywana po jednej wiadomości -
+    wiadomości, których zapis się nie udaje, trafiają na temat dead_letter/<temat> i są potwierdzane,
+    aby jedna błędna wiadomość nie wstrzymała odbioru pozostałych."""
+
+    def __init__(self, store, broker, port=1883, client_id='sensor-server-bridge', topic=MQTT_TOPIC,
+                 max_batch=500, max_latency_ms=200, retry_delay=5, max_retries=3, dedup_size=10000):
+        self.store = store
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id
+        self.topic = topic
+        self.max_batch = max_batch
+        self.max_latency_ms = max_latency_ms
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self._client = None
+        self._thread = None
+        self._stopping = False
+        self._buffer = []
+        self._condition = threading.Condition()
+        # Ostatnio zapisane (device_id, timestamp) - szybkie odrzucanie powtórzeń bez zapytania do bazy
+        self._recent = collections.OrderedDict()
+        self._dedup_size = dedup_size
+        # Statystyki
+        self.received = 0
+        self.stored = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+
+    def start(self):
+        import paho.mqtt.client as mqtt
+        from paho.mqtt.packettypes import PacketTypes
+        from paho.mqtt.properties import Properties
+
+        self._stopping = False
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=self.client_id,
+                             protocol=mqtt.MQTTv5, manual_ack=True)
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        properties = Properties(PacketTypes.CONNECT)
+        # Sesja (subskrypcja i niepotwierdzone wiadomości) przechowywana przez brokera przez dobę
+        properties.SessionExpiryInterval = 24 * 3600
+        # Broker może wysłać tyle niepotwierdzonych wiadomości, ile mieści jedna paczka
+        properties.ReceiveMaximum = min(self.max_batch, 65535)
+        client.connect_async(self.broker, self.port, keepalive=60, clean_start=False, properties=properties)
+        self._client = client
+        self._thread = threading.Thread(target=self._run, name='mqtt-bridge', daemon=True)
+        self._thread.start()
+        client.loop_start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if self._client is not None:
+            self._client.disconnect()
+            self._client.loop_stop()
+
+    def pending(self):
+        """Liczba odebranych, jeszcze niezapisanych wiadomości"""
+        with self._condition:
+            return len(self._buffer)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            print(f"Nie udało się połączyć z brokerem MQTT: {reason_code}")
+            return
+        client.subscribe(self.topic, qos=1)
+
+    def _on_message(self, client, userdata, message):
+        self.received += 1
+        try:
+            item = parse_message(message.topic, message.payload.decode())
+        except (ValueError, UnicodeDecodeError) as e:
+            # Błędna wiadomość nie zostanie poprawiona przez ponowne dostarczenie
+            print(f"Pominięto wiadomość z tematu {message.topic}: {e}")
+            self.invalid += 1
+            client.ack(message.mid, message.qos)
+            return
+        with self._condition:
+            self._buffer.append((message, item))
+            self._condition.notify()
+
+    def _collect(self):
+        with self._condition:
+            while not self._buffer and not self._stopping:
+                self._condition.wait()
+            if self._buffer:
+                deadline = time.monotonic() + self.max_latency_ms / 1000
+                while len(self._buffer) < self.max_batch and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            batch = self._buffer[:self.max_batch]
+            del self._buffer[:self.max_batch]
+            return batch
+
+    def _store(self, items):
+        """Zapis pomiarów - True, gdy się udał"""
+        try:
+            stored = self.store([item for _, item in items])
+        except Exception as e:
+            print(f"Nie udało się zapisać pomiarów z MQTT: {e}")
+            return False
+        # Pomiary zapisane już wcześniej (ponowne dostarczenie po awarii)
+        self.duplicates += len(items) - stored
+        self.stored += stored
+        for _, (room_id, reading) in items:
+            if reading["timestamp"] is not None:
+                self._recent[(reading["device_id"], reading["timestamp"])] = True
+        return True
+
+    def _dead_letter(self, message):
+        self.failed += 1
+        # Wiadomość zostaje u brokera (QoS 1) do ręcznego sprawdzenia
+        self._client.publish(DEAD_LETTER_PREFIX + message.topic, message.payload, qos=1)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            items = []
+            for message, (room_id, reading) in batch:
+                key = (reading["device_id"], reading["timestamp"])
+                if reading["timestamp"] is not None and key in self._recent:
+                    self.duplicates += 1
+                    continue
+                items.append((message, (room_id, reading)))
+            attempts = 0
+            while items and not self._store(items):
+                attempts += 1
+                if self._stopping:
+                    return
+                if attempts >= self.max_retries:
+                    # Błąd może dotyczyć jednej wiadomości - pozostałe zapisujemy osobno
+                    for message, item in items:
+                        if not self._store([(message, item)]):
+                            self._dead_letter(message)
+                    break
+                time.sleep(self.retry_delay)
+            while len(self._recent) > self._dedup_size:
+                self._recent.popitem(last=False)
+            for message, _ in batch:
+                self._client.ack(message.mid, message.qos)
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "stored": self.stored,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "pending": self.pending()
+        }
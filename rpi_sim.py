@@ -1,7 +1,8 @@
-from http_client import get_device_ids, get_limits, send_photo, send_measurements, get_people_number
+from http_client import get_room_snapshot, send_photo, send_measurements_batch
 import cv2
 from mqtt_client import mqtt_get_measurements
 import time
+from datetime import datetime
 from functools import wraps
 
 # Predefined room and camera id's
@@ -17,6 +18,11 @@ BASE_URL = "http://13.60.171.70:1880"
 # MQTT broker
 BROKER = "localhost"
 
+# Set to True when the server subscribes to the broker itself (MQTT_BROKER with MQTT_BRIDGE_IN_SERVER=1
+# or the flask mqtt-bridge command on the server),
+# measurements are then only used locally and not sent over HTTP
+SERVER_MQTT_BRIDGE = False
+
 
 class Sensor:
     """Class for storing the attributes of the sensor"""
@@ -50,9 +56,10 @@ class Sensor:
         self.smoke.value = values_json["smoke_level"]
 
     def update_all_limits(self, limits_json):
-        self.temp.limit = limits_json["temperature"]
-        self.hum.limit = limits_json["humidity"]
-        self.smoke.limit = limits_json["smoke_level"]
+        # Limits that are not set on the server (null) keep their previous values
+        for attribute in (self.temp, self.hum, self.smoke):
+            if limits_json.get(attribute.name) is not None:
+                attribute.limit = limits_json[attribute.name]
 
     def is_exceeded(self):
         return self.temp.is_exceeded() or self.hum.is_exceeded() or self.smoke.is_exceeded()
@@ -95,16 +102,14 @@ def retry(max_attemps, delay):
     return decorator
 
 
-def update_sensor_list(sensors):
-    """Function for checking changes in the sensors on the server and adding/deleting devices"""
+def update_sensor_list(sensors, devices):
+    """Function for checking changes in the sensors on the server (device list from the room snapshot)
+        and adding/deleting devices"""
     try:
         # Creating list of sensor ids
         sensor_ids = [sensor.id for sensor in sensors]
-        # Retrieving device list from server
-        data = get_device_ids(BASE_URL, ROOM_ID)
         # Creating a list of all device ids from the received json
         updated_sensor_ids = []
-        devices = data["sensor_devices"]
         for device in devices:
             updated_sensor_ids.append(device["device_id"])
 
@@ -125,17 +130,18 @@ def update_sensor_list(sensors):
         return None
 
 
-def update_sensor_limits(sensors):
-    """Function for updating sensor limits based on server data"""
-    # Updating limits for every sensor
-    limits_json = get_limits(BASE_URL, ROOM_ID)
-    if limits_json is None:
-        print("Couldn't access the limit values")
-        return None
+def update_sensor_limits(sensors, snapshot):
+    """Function for updating sensor limits based on server data (room snapshot),
+        devices with their own limits use them instead of the room limits"""
+    # Room without its own limits - devices can still have theirs
+    limits_json = snapshot["limits"] or {}
     try:
+        device_limits = {device["device_id"]: device["limits"] for device in snapshot["sensor_devices"]}
+        # Updating limits for every sensor, limits not set for the device come from the room
         for sensor in sensors:
             sensor.update_all_limits(limits_json)
-        ppl_limit = limits_json["people_num"]
+            sensor.update_all_limits(device_limits.get(sensor.id) or {})
+        ppl_limit = limits_json.get("people_num")
         # Return updated sensor list
         return sensors, ppl_limit
     except Exception as e:
@@ -143,10 +149,13 @@ def update_sensor_limits(sensors):
         return None
 
 
-def update_sensor_values(sensors, values_json):
-    """Function for updating sensor values from the given value"""
+def update_sensor_values(sensors, values_json, send=True):
+    """Function for updating sensor values from the given value, send=False skips sending them to the server"""
     try:
         print(values_json)
+        # Collecting readings of all sensors to send them in one request
+        readings = []
+        timestamp = datetime.now().astimezone().isoformat()
         for sensor in sensors:
             if sensor.id not in values_json:
                 print(f"No data from device {sensor.id}")
@@ -154,10 +163,18 @@ def update_sensor_values(sensors, values_json):
                 try:
                     sensor.update_all_values(values_json[sensor.id])
                     sensor.device_state = True
-                    send_measurements(BASE_URL, ROOM_ID, sensor.id, sensor.temp.value, sensor.hum.value, sensor.smoke.value)
+                    readings.append({
+                        "device_id": sensor.id,
+                        "temperature": sensor.temp.value,
+                        "humidity": sensor.hum.value,
+                        "smoke_level": sensor.smoke.value,
+                        "timestamp": timestamp
+                    })
                 except Exception as e:
                     print(f"Couldn't update {sensor.id} data, error {e}")
                     sensor.device_state = False
+        if send:
+            send_measurements_batch(BASE_URL, ROOM_ID, readings)
     except Exception as e:
         print(f"Couldn't update sensor values, error: {e}, returned old values")
         return None
@@ -229,25 +246,36 @@ def main():
         # Get data from mqtt devices
         meas_json = mqtt_get_measurements(BROKER, ROOM_ID)
 
-        # Check for changes in sensor list coming from the website
-        sensors = update_sensor_list(sensors) or sensors
+        # Get devices, limits and people number of the room with one request
+        snapshot = get_room_snapshot(BASE_URL, ROOM_ID)
+        if snapshot is None:
+            print("Couldn't get the room state from server, using old values")
+        else:
+            # Check for changes in sensor list coming from the website
+            sensors = update_sensor_list(sensors, snapshot["sensor_devices"]) or sensors
 
-        # Update sensor limits from website
-        sensors, ppl.limit = update_sensor_limits(sensors) or sensors, ppl.limit
+            # Update sensor limits from website
+            result = update_sensor_limits(sensors, snapshot)
+            if result is not None:
+                sensors, ppl_limit = result
+                # Keeping the previous people limit if it's not set on the server
+                ppl.limit = ppl.limit if ppl_limit is None else ppl_limit
+
+            # People number counted from the last photo sent
+            if snapshot["people"] is not None:
+                ppl.num = snapshot["people"]["people_num"]
 
         # If didn't receive sensor measurements, don't update values on server
         if meas_json is None:
             print("Error receiving data from sensors, can't update values on server")
         else:
             # Update previously measured sensor values and sending them to the server and database
-            sensors = update_sensor_values(sensors, meas_json) or sensors
+            sensors = update_sensor_values(sensors, meas_json, send=not SERVER_MQTT_BRIDGE) or sensors
 
-        # Take and update photo
+        # Take and update photo (people are counted in the background, the result comes
+        # with the next snapshot)
         photo_update(CAMERA_ID)
 
-        # Get people number from server
-        ppl.num = get_people_number(BASE_URL, ROOM_ID, CAMERA_ID) or ppl.num
-
         # Print all sensor info (for testing)
         sensors_info(sensors)
 
@@ -2,6 +2,7 @@ import time
 import paho.mqtt.client as mqtt
 import json
 import random
+from datetime import datetime
 
 BROKER = "localhost"
 
@@ -52,11 +53,13 @@ def on_message(client, userdata, msg):
             "temperature": avg_temp,
             "humidity": avg_hum,
             "smoke_level": avg_smk,
-            "id": SENSOR
+            "id": SENSOR,
+            # Czas pomiaru - serwer rozpoznaje po nim ponownie dostarczone wiadomosci
+            "timestamp": datetime.now().astimezone().isoformat()
         }
 
         message_json = json.dumps(message)
-        client.publish(RESPONSE_TOPIC, message_json)
+        client.publish(RESPONSE_TOPIC, message_json, qos=1)
         print(f"Opublikowano dane na temat {RESPONSE_TOPIC}: {message_json}")
 
     except Exception as e:
@@ -0,0 +1,50 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Aplikacja konfigurowana jest przy imporcie - osobna baza i magazyn plików dla testów,
+# detektor z load_test zamiast modelu YOLO
+WORKDIR = tempfile.mkdtemp(prefix='api_kod_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'test.db')
+os.environ['BLOB_STORE'] = os.path.join(WORKDIR, 'blobs')
+os.environ['INFERENCE_MODEL_FACTORY'] = 'load_test:fake_detector'
+os.environ['LOAD_TEST_DETECTOR_DELAY_MS'] = '0'
+os.environ['INFERENCE_WORKERS'] = '1'
+# Zadania w tle (retencja, wznawianie analiz) testy wywołują bezpośrednio
+os.environ['BACKGROUND_WORKERS'] = '0'
+
+import api_kod  # noqa: E402
+
+
+def clear_database():
+    with api_kod.app.app_context():
+        for table in reversed(api_kod.db.metadata.sorted_tables):
+            api_kod.db.session.execute(table.delete())
+        api_kod.db.session.commit()
+    api_kod.limits_cache = api_kod.LimitsCache(api_kod.LIMITS_CACHE_TTL)
+    api_kod._device_keys.clear()
+    api_kod.frame_cache = api_kod.FrameCache(api_kod.FRAME_CACHE_THRESHOLD, api_kod.FRAME_CACHE_MAX_AGE)
+
+
+@pytest.fixture
+def app():
+    """Moduł aplikacji na pustej bazie"""
+    clear_database()
+    yield api_kod
+
+
+@pytest.fixture
+def client(app):
+    return app.app.test_client()
+
+
+@pytest.fixture(params=['rows', 'compact'])
+def storage(request, app, monkeypatch):
+    """Test wykonywany dla obu układów przechowywania pomiarów"""
+    monkeypatch.setattr(app, 'COMPACT_STORAGE', request.param == 'compact')
+    return request.param
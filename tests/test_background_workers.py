@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+
+def test_first_request_starts_background_workers_once(app, client, monkeypatch, tmp_path):
+    calls = []
+    retention_started = threading.Event()
+    monkeypatch.setattr(app, 'BACKGROUND_WORKERS', True)
+    monkeypatch.setattr(app, 'BACKGROUND_LOCK_FILE', str(tmp_path / 'workers.lock'))
+    monkeypatch.setattr(app, '_leader_lock_file', None)
+    monkeypatch.setattr(app, 'background_workers_started', False)
+    monkeypatch.setattr(app.inference_queue, 'start', lambda: calls.append('inference'))
+    monkeypatch.setattr(app, 'resume_inference_jobs', lambda: calls.append('resume'))
+    monkeypatch.setattr(app, 'retention_loop', lambda stop_event: retention_started.set())
+
+    client.get('/inference/stats')
+    client.get('/inference/stats')
+
+    assert calls == ['inference', 'resume']
+    assert retention_started.wait(5)
+
+
+def test_background_workers_can_be_disabled(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'background_workers_started', False)
+    monkeypatch.setattr(app, 'start_background_workers', lambda: pytest.fail("zadania w tle uruchomione"))
+
+    client.get('/inference/stats')
+
+
+def test_only_lock_holder_resumes_jobs_and_runs_retention(app, monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(app, 'BACKGROUND_LOCK_FILE', str(tmp_path / 'workers.lock'))
+    monkeypatch.setattr(app, '_leader_lock_file', None)
+    monkeypatch.setattr(app.inference_queue, 'start', lambda: calls.append('inference'))
+    monkeypatch.setattr(app, 'resume_inference_jobs', lambda: calls.append('resume'))
+    monkeypatch.setattr(app, 'retention_loop', lambda stop_event: calls.append('retention'))
+
+    # Blokadę trzyma już inny proces serwera
+    assert app.acquire_leader_lock()
+    leader = app._leader_lock_file
+    monkeypatch.setattr(app, '_leader_lock_file', None)
+    try:
+        monkeypatch.setattr(app, 'background_workers_started', False)
+        app.start_background_workers()
+        assert calls == ['inference']
+    finally:
+        leader.close()
+
+    # Po zakończeniu tamtego procesu blokadę przejmuje kolejny
+    assert app.acquire_leader_lock()
+    app._leader_lock_file.close()
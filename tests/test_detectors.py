@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+import detectors
+
+
+def test_model_file_is_built_once_by_concurrent_workers(tmp_path):
+    path = str(tmp_path / 'model-640-int8.onnx')
+    builds = []
+
+    def build(temp_path):
+        builds.append(temp_path)
+        with open(temp_path, 'wb') as model_file:
+            model_file.write(b'part-')
+            # Drugi proces roboczy sprawdza plik w trakcie zapisu
+            time.sleep(0.05)
+            model_file.write(b'complete')
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(detectors.build_model_file(path, build)))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert results == [path] * 4
+    assert len(builds) == 1
+    with open(path, 'rb') as model_file:
+        assert model_file.read() == b'part-complete'
+    assert not [name for name in tmp_path.iterdir() if name.name.endswith('.tmp.onnx')]
+
+
+def test_failed_build_leaves_no_model_file(tmp_path):
+    path = str(tmp_path / 'model.onnx')
+
+    def build(temp_path):
+        with open(temp_path, 'wb') as model_file:
+            model_file.write(b'part-')
+        raise RuntimeError("export failed")
+
+    with pytest.raises(RuntimeError):
+        detectors.build_model_file(path, build)
+    assert [name.name for name in tmp_path.iterdir()] == ['model.onnx.lock']
@@ -0,0 +1,69 @@
+import sqlite3
+import threading
+
+import pytest
+
+from group_commit import GroupCommitWriter
+
+
+class RecordingFlush:
+    """Zapis zleceń do listy - pierwsza grupa czeka na zwolnienie, aby kolejne zlecenia trafiły do kolejki"""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, payloads):
+        self.started.set()
+        self.release.wait(5)
+        if self.fail_on in payloads:
+            raise ValueError(f"Nieprawidłowe zlecenie {self.fail_on}")
+        self.batches.append(list(payloads))
+        return [payload * 2 for payload in payloads]
+
+
+def test_requests_queued_during_flush_are_committed_together():
+    flush = RecordingFlush()
+    writer = GroupCommitWriter(flush, max_batch=3, max_latency_ms=0)
+    first = writer.submit(1)
+    assert flush.started.wait(5)
+    futures = [writer.submit(payload) for payload in range(2, 7)]
+    assert writer.pending() == 5
+    flush.release.set()
+
+    assert [future.result(5) for future in [first] + futures] == [2, 4, 6, 8, 10, 12]
+    # Zlecenia z kolejki łączone w grupy nie większe niż max_batch
+    assert flush.batches == [[1], [2, 3, 4], [5, 6]]
+    assert (writer.commits, writer.writes) == (3, 6)
+
+
+def test_failed_batch_falls_back_to_single_writes():
+    flush = RecordingFlush(fail_on=3)
+    flush.release.set()
+    writer = GroupCommitWriter(flush, max_batch=3, max_latency_ms=5000)
+    futures = [writer.submit(payload) for payload in (1, 3, 5)]
+
+    assert futures[0].result(5) == 2
+    assert futures[2].result(5) == 10
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    # Grupa odrzucona w całości, poprawne zlecenia zapisane pojedynczo
+    assert flush.batches == [[1], [5]]
+    assert (writer.commits, writer.writes) == (2, 3)
+
+
+def test_write_returns_after_readings_are_committed(app, client, storage):
+    with app.app.app_context():
+        database = app.db.engine.url.database
+    commits = app.sensor_writer.commits
+    assert app.write_readings('A', [{"device_id": 's1', "temperature": 20},
+                                    {"device_id": 's2', "temperature": 21}]) == 2
+
+    # Osobne połączenie widzi tylko zatwierdzone dane - pomiary przetrwają zamknięcie procesu
+    table = 'sensor_reading' if storage == 'compact' else 'sensor_data'
+    with sqlite3.connect(database) as connection:
+        assert connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0] == 2
+    assert app.sensor_writer.commits == commits + 1
+    assert client.get('/rooms/A/sensor-devices/s2/data').json["data"]["temperature"] == 21
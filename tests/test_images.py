@@ -0,0 +1,111 @@
+import io
+import os
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def upload(client, image_data):
+    return client.post('/rooms/A/cameras/cam-01/images', data={"file": (io.BytesIO(image_data), 'frame.jpg')})
+
+
+def wait_for_job(client, response):
+    for _ in range(200):
+        job = client.get(response.headers['Location']).json["data"]
+        if job["status"] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("Zadanie analizy nie zakończyło się")
+
+
+def frame():
+    with open(os.path.join(ROOT, 'cam-01.jpg'), 'rb') as image_file:
+        return image_file.read()
+
+
+def test_frame_cache_hit_gets_renditions(app, client):
+    image_data = frame()
+    assert wait_for_job(client, upload(client, image_data))["status"] == 'done'
+
+    # Ta sama klatka ponownie zapisana przez kamerę - inne bajty, ten sam obraz
+    response = upload(client, image_data + b'\0')
+    assert response.status_code == 200
+    job = response.json
+
+    assert app.frame_cache.stats()["hits"] == 1
+    with app.app.app_context():
+        image = app.db.session.get(app.InferenceJob, job["job_id"]).image
+        sizes = {(rendition.size, rendition.format) for rendition in
+                 app.ImageRendition.query.filter_by(source_hash=image.blob_hash)}
+    assert sizes == {(size, image_format) for size, _, image_format, _ in app.inference_queue.renditions}
+    thumb = client.get(f'/rooms/A/images/original/{image.id}', query_string={"size": 'thumb'})
+    assert thumb.status_code == 200
+    assert thumb.headers['ETag'].strip('"') != image.blob_hash
+
+
+def test_frame_cache_hit_on_deleted_blob_counts_as_miss(app, client):
+    image_data = frame()
+    wait_for_job(client, upload(client, image_data))
+    with app.app.app_context():
+        # Wynik z pamięci wskazuje plik usunięty przez czyszczenie danych
+        app.ImageOut.query.delete()
+        app.ImageLatest.query.delete()
+        app.db.session.commit()
+        app.collect_unused_blobs()
+
+    response = upload(client, image_data + b'\0')
+    assert response.status_code == 202
+    stats = app.frame_cache.stats()
+    assert (stats["hits"], stats["misses"]) == (0, 2)
+    assert wait_for_job(client, response)["status"] == 'done'
+
+
+def test_original_size_is_only_served_as_jpeg(app, client):
+    response = upload(client, frame())
+    image_id = wait_for_job(client, response)["image_id"]
+
+    assert client.get(f'/rooms/A/images/original/{image_id}', query_string={"format": 'jpeg'}).status_code == 200
+    response = client.get(f'/rooms/A/images/original/{image_id}', query_string={"size": 'original', "format": 'webp'})
+    assert response.status_code == 400
+    assert "thumb" in response.json["error"]
+    response = client.get(f'/rooms/A/images/original/{image_id}', query_string={"size": 'thumb', "format": 'webp'})
+    assert response.mimetype == 'image/webp'
+
+
+def test_image_etag_returns_not_modified(app, client):
+    image_data = frame()
+    image_id = wait_for_job(client, upload(client, image_data))["image_id"]
+
+    response = client.get(f'/rooms/A/images/original/{image_id}')
+    assert response.status_code == 200
+    assert response.get_data() == image_data
+    assert 'immutable' in response.headers['Cache-Control']
+    etag = response.headers['ETag']
+
+    response = client.get(f'/rooms/A/images/original/{image_id}', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.get_data() == b''
+    assert response.headers['ETag'] == etag
+
+    # Najnowsze zdjęcie nie jest niezmienne - klient musi je sprawdzać przy każdym odświeżeniu
+    response = client.get('/rooms/A/images/original/latest', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert 'no-cache' in response.headers['Cache-Control']
+    blob_hash = etag.strip('"')
+    response = client.get(f'/blobs/{blob_hash}', headers={"If-None-Match": '"inny"'})
+    assert response.status_code == 200
+
+
+def test_blob_range_returns_partial_content(app, client):
+    image_data = frame()
+    image_id = wait_for_job(client, upload(client, image_data))["image_id"]
+    blob_hash = client.get(f'/rooms/A/images/original/{image_id}').headers['ETag'].strip('"')
+
+    response = client.get(f'/blobs/{blob_hash}', headers={"Range": 'bytes=10-109'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 10-109/{len(image_data)}'
+    assert response.get_data() == image_data[10:110]
+
+    response = client.get(f'/blobs/{blob_hash}', headers={"Range": f'bytes={len(image_data)}-'})
+    assert response.status_code == 416
+    assert client.get('/blobs/brak').status_code == 404
@@ -0,0 +1,48 @@
+class Result:
+    def __init__(self, people_num):
+        self.people_num = people_num
+
+    def result(self):
+        return self.people_num, b'analyzed-%d' % self.people_num, {'original': {}, 'processed': {}}
+
+
+def queued_job(app):
+    with app.app.app_context():
+        image = app.Image(blob_hash=app.save_blob(b'frame', 'image/jpeg'), section='A')
+        job = app.InferenceJob(section='A', image=image)
+        app.db.session.add_all([image, job])
+        app.db.session.commit()
+        return job.id
+
+
+def test_job_is_completed_only_once(app, monkeypatch):
+    published = []
+    monkeypatch.setattr(app, 'publish_people', lambda job: published.append(job.people_num))
+    job_id = queued_job(app)
+
+    # Ten sam wynik zgłoszony dwukrotnie, np. po wznowieniu zadania w drugim procesie
+    app.complete_inference_job(job_id, Result(3))
+    app.complete_inference_job(job_id, Result(5))
+
+    with app.app.app_context():
+        job = app.db.session.get(app.InferenceJob, job_id)
+        assert (job.status, job.people_num) == ('done', 3)
+        assert [image_out.people_num for image_out in app.ImageOut.query] == [3]
+        assert app.db.session.get(app.ImageLatest, 'A').people_num == 3
+    assert published == [3]
+
+
+def test_failed_job_is_not_completed_again(app, monkeypatch):
+    class Failed:
+        def result(self):
+            raise ValueError("Nie udało się zdekodować zdjęcia")
+
+    monkeypatch.setattr(app, 'publish_people', lambda job: None)
+    job_id = queued_job(app)
+    app.complete_inference_job(job_id, Failed())
+    app.complete_inference_job(job_id, Result(2))
+
+    with app.app.app_context():
+        job = app.db.session.get(app.InferenceJob, job_id)
+        assert (job.status, job.error) == ('failed', "Nie udało się zdekodować zdjęcia")
+        assert not app.ImageOut.query.all()
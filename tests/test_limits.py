@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+
+def test_limits_versions_and_etag(client):
+    response = client.put('/rooms/A/sensor-devices/limits', json={"temperature": 30, "people": 10})
+    assert response.json["version"] == 1
+    response = client.put('/rooms/A/sensor-devices/limits', json={"humidity": 50})
+    assert response.json["version"] == 2
+
+    response = client.get('/rooms/A/sensor-devices/limits')
+    assert response.json == {"temperature": 30, "humidity": 50, "smoke_level": None, "people_num": 10, "version": 2}
+    etag = response.headers["ETag"]
+    assert client.get('/rooms/A/sensor-devices/limits', headers={"If-None-Match": etag}).status_code == 304
+
+    client.put('/rooms/A/sensor-devices/limits', json={"temperature": 31})
+    response = client.get('/rooms/A/sensor-devices/limits', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json["temperature"] == 31
+
+
+def test_concurrent_limit_updates_get_distinct_versions(app):
+    versions = []
+    lock = threading.Lock()
+
+    def update(value):
+        client = app.app.test_client()
+        for _ in range(20):
+            response = client.put('/rooms/A/sensor-devices/limits', json={"temperature": value})
+            with lock:
+                versions.append(response.json["version"])
+
+    threads = [threading.Thread(target=update, args=(value,)) for value in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(versions) == list(range(1, 81))
+
+
+def test_write_during_load_does_not_cache_stale_limits(app, client):
+    client.put('/rooms/A/sensor-devices/limits', json={"temperature": 30})
+    with app.app.app_context():
+        generation = app.limits_cache.generation
+        stale = app.load_limits('A', app.ROOM_LIMITS)
+        app.limits_cache.invalidate('A')
+        client.put('/rooms/A/sensor-devices/limits', json={"temperature": 35})
+        app.limits_cache.put('A', app.ROOM_LIMITS, *stale, generation)
+    assert client.get('/rooms/A/sensor-devices/limits').json["temperature"] == 35
+
+
+@pytest.mark.parametrize('url', ['/rooms/A/sensor-devices/limits', '/rooms/A/sensor-devices/s1/limits'])
+@pytest.mark.parametrize('body, message', [
+    ({"temperature": "hot"}, "temperature"),
+    ({"people": True}, "people"),
+    ([1], "Brak danych"),
+    ({"unknown": 1}, "Brak danych"),
+])
+def test_invalid_limits_are_rejected_without_new_version(client, url, body, message):
+    assert client.put(url, json={"temperature": 30}).json["version"] == 1
+
+    response = client.put(url, json=body)
+    assert response.status_code == 400
+    assert message in response.json["error"]
+
+    response = client.get(url)
+    assert (response.json["temperature"], response.json["version"]) == (30, 1)
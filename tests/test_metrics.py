@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+def test_failed_query_does_not_shift_query_timings(app, monkeypatch):
+    times = [0.0, 100.0, 100.25]
+    perf_counter = app.time.perf_counter
+    observed = []
+    monkeypatch.setattr(app.time, 'perf_counter', lambda: times.pop(0) if times else perf_counter())
+    monkeypatch.setattr(app.DB_QUERY_LATENCY, 'observe', lambda value, **labels: observed.append(value))
+
+    with app.app.app_context():
+        connection = app.db.session.connection()
+        with pytest.raises(OperationalError):
+            connection.exec_driver_sql("SELECT * FROM missing_table")
+        app.db.session.rollback()
+        connection = app.db.session.connection()
+        connection.exec_driver_sql("SELECT 1")
+        # Po błędzie nie zostaje żaden zapamiętany czas startu
+        assert not connection.info.get('query_start')
+        app.db.session.rollback()
+
+    assert observed == [0.25]
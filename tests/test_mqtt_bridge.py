@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+import pytest
+
+from mqtt_bridge import MqttBridge, parse_message
+
+
+class Message:
+    def __init__(self, mid, topic, payload):
+        self.mid = mid
+        self.qos = 1
+        self.topic = topic
+        self.payload = json.dumps(payload).encode()
+
+
+class FakeClient:
+    def __init__(self):
+        self.acks = []
+        self.published = []
+
+    def ack(self, mid, qos):
+        self.acks.append(mid)
+
+    def publish(self, topic, payload, qos=0):
+        self.published.append(topic)
+
+    def disconnect(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+
+def reading(device_id, temperature, second=0):
+    return {"id": device_id, "temperature": temperature, "humidity": 40, "smoke_level": 1,
+            "timestamp": f"2026-10-18T10:00:{second:02d}+02:00"}
+
+
+@pytest.mark.parametrize('payload', [
+    {"temperature": "n/a"},
+    {"humidity": [1]},
+    {"smoke_level": True},
+    {"id": ["x"]},
+    {"timestamp": "wczoraj"},
+])
+def test_parse_message_rejects_invalid_fields(payload):
+    with pytest.raises(ValueError):
+        parse_message('published_data/A/sensor-01', json.dumps(payload))
+
+
+def run_bridge(store, messages):
+    bridge = MqttBridge(store, 'localhost', max_latency_ms=20, retry_delay=0, max_retries=2)
+    client = bridge._client = FakeClient()
+    bridge._thread = threading.Thread(target=bridge._run, daemon=True)
+    bridge._thread.start()
+    for message in messages:
+        bridge._on_message(client, None, message)
+    deadline = time.monotonic() + 5
+    while len(client.acks) < len(messages) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    bridge.stop()
+    return bridge, client
+
+
+def test_message_failing_to_store_is_dead_lettered_and_acked():
+    stored = []
+
+    def store(items):
+        if any(item["device_id"] == "poison" for _, item in items):
+            raise ValueError("nie da się zapisać")
+        stored.extend(item["device_id"] for _, item in items)
+        return len(items)
+
+    messages = [
+        Message(1, 'published_data/A/sensor-01', reading("sensor-01", 20)),
+        Message(2, 'published_data/A/poison', reading("poison", 21)),
+        Message(3, 'published_data/A/sensor-02', reading("sensor-02", 22)),
+        Message(4, 'published_data/A/sensor-02', {"temperature": "n/a"}),
+    ]
+    bridge, client = run_bridge(store, messages)
+
+    assert sorted(client.acks) == [1, 2, 3, 4]
+    assert sorted(stored) == ["sensor-01", "sensor-02"]
+    assert client.published == ['dead_letter/published_data/A/poison']
+    assert bridge.stats()["failed"] == 1
+    assert bridge.stats()["invalid"] == 1
@@ -0,0 +1,123 @@
+import io
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tabele rosnące z czasem - zapytania nie mogą ich skanować w całości.
+# Pozostałe (urządzenia, klucze, limity, najnowsze wartości, pliki zdjęć) mają rozmiar
+# ograniczony liczbą urządzeń lub retencją zdjęć
+LARGE_TABLES = {'sensor_data', 'sensor_reading', 'sensor_rollup', 'image', 'image_out', 'inference_job'}
+
+
+class StatementLog:
+    """Zapytania wykonane przez aplikację (SQL i parametry) przechwycone z silnika bazy"""
+
+    def __init__(self, app):
+        with app.app.app_context():
+            self.engine = app.db.engine
+        self.statements = {}
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self.record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self.record)
+
+    def record(self, connection, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            self.statements.setdefault(statement, tuple(parameters))
+
+
+def full_scans(app, statements):
+    """Kroki planu skanujące całą dużą tabelę wraz z zapytaniem"""
+    failures = []
+    with app.app.app_context():
+        connection = app.db.session.connection()
+        for statement, parameters in statements.items():
+            rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            for detail in (row[-1] for row in rows):
+                match = re.match(r'SCAN (\w+)', detail)
+                if match and match.group(1) in LARGE_TABLES:
+                    failures.append(f"{detail}:\n{statement}")
+    return failures
+
+
+def exercise_api(app, client):
+    """Wywołanie endpointów odczytu i zapisu w typowych wariantach parametrów"""
+    for device_id in ('s1', 's2'):
+        client.post('/rooms/A/sensor-devices', json={"device_id": device_id})
+    client.post('/rooms/A/cameras', json={"device_id": 'cam-01'})
+
+    start = datetime(2024, 1, 1)
+    readings = [
+        {"device_id": device_id, "temperature": 20 + i % 5, "humidity": 40, "smoke_level": 1,
+         "timestamp": (start + timedelta(minutes=i)).isoformat()}
+        for i in range(120) for device_id in ('s1', 's2')
+    ]
+    assert client.post('/rooms/A/sensor-data/batch', json={"readings": readings}).status_code == 200
+    assert client.put('/rooms/A/sensor-devices/s1/data', json={"temperature": 21}).status_code == 200
+
+    client.put('/rooms/A/sensor-devices/limits', json={"temperature": 30, "humidity": 60})
+    client.put('/rooms/A/sensor-devices/s1/limits', json={"temperature": 25})
+    client.get('/rooms/A/sensor-devices/s1/limits')
+    client.get('/rooms/A/sensor-devices/s2/limits')
+    client.get('/rooms/A/sensor-devices/limits')
+
+    time_range = {"from": start.isoformat(), "to": (start + timedelta(hours=2)).isoformat()}
+    client.get('/rooms/A/sensor-devices')
+    client.get('/rooms/A/sensor-devices/s1/data')
+    page = client.get('/rooms/A/sensor-devices/s1/data/temperature', query_string={"limit": 50}).json
+    client.get('/rooms/A/sensor-devices/s1/data/temperature', query_string={"cursor": page["next_cursor"]})
+    client.get('/rooms/A/sensor-devices/s1/data/humidity', query_string=time_range)
+    client.get('/rooms/A/sensor-devices/s1/aggregates', query_string=dict(time_range, bucket='minute'))
+    client.get('/rooms/A/sensor-devices/s1/aggregates', query_string=dict(time_range, bucket=600))
+    client.get('/rooms/A/series', query_string=time_range)
+    client.get('/rooms/A/series', query_string=dict(time_range, devices='s1,s2'))
+    client.get('/rooms/A/export').get_data()
+    client.get('/rooms/A/export', query_string=dict(time_range, devices='s1,s2')).get_data()
+    client.get('/rooms/A/snapshot')
+    client.get('/rooms/snapshot')
+
+    with open(os.path.join(ROOT, 'cam-01.jpg'), 'rb') as image_file:
+        image_data = image_file.read()
+    for _ in range(2):
+        response = client.post('/rooms/A/cameras/cam-01/images',
+                               data={"file": (io.BytesIO(image_data), 'frame.jpg')})
+        job_url = response.headers['Location']
+        for _ in range(200):
+            if client.get(job_url).json["data"]["status"] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+    client.get('/rooms/A/images/processed/latest')
+    client.get('/rooms/A/images/original/latest', query_string={"size": 'thumb', "format": 'webp'})
+    client.get('/rooms/A/images/original/1')
+    client.get('/rooms/A/images/processed/1', query_string={"size": 'medium'})
+    client.delete('/rooms/A/sensor-devices/s2')
+    client.delete('/rooms/A/cameras/cam-01')
+
+
+def test_endpoint_queries_use_indexes(app, client, storage):
+    with StatementLog(app) as log:
+        exercise_api(app, client)
+    assert len(log.statements) > 20
+    failures = full_scans(app, log.statements)
+    assert not failures, '\n\n'.join(failures)
+
+
+def test_retention_queries_use_indexes(app, client, storage, monkeypatch):
+    exercise_api(app, client)
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+    monkeypatch.setattr(app, 'RETENTION_IMAGES_PER_SECTION', 1)
+    monkeypatch.setattr(app, 'RETENTION_SENSOR_DATA_DAYS', 1)
+    monkeypatch.setattr(app, 'RETENTION_MINUTE_ROLLUP_DAYS', 1)
+    with StatementLog(app) as log:
+        deleted = app.run_retention()
+    assert deleted['image'] and deleted['sensor_reading' if storage == 'compact' else 'sensor_data']
+    failures = full_scans(app, log.statements)
+    assert not failures, '\n\n'.join(failures)
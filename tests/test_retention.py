@@ -0,0 +1,124 @@
+import os
+from datetime import datetime, timedelta
+
+
+def freelist_count(app):
+    return app.db.session.execute(app.db.text("PRAGMA freelist_count")).scalar()
+
+
+def test_incremental_vacuum_frees_all_pages(app, monkeypatch):
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+    monkeypatch.setattr(app, 'RETENTION_VACUUM_PAGES', 10)
+    with app.app.app_context():
+        start = datetime(2024, 1, 1)
+        app.db.session.execute(app.db.insert(app.SensorData), [
+            {"room_id": "A", "device_id": "s1", "temperature": 20.0, "timestamp": start + timedelta(seconds=i)}
+            for i in range(20000)
+        ])
+        app.db.session.commit()
+        app.SensorData.query.delete()
+        app.db.session.commit()
+        free_pages = freelist_count(app)
+        assert free_pages > 100
+
+        # Każdy krok (przerwa między krokami) powinien zwolnić RETENTION_VACUUM_PAGES stron
+        passes = []
+        monkeypatch.setattr(app.time, 'sleep', passes.append)
+        app.incremental_vacuum()
+
+        assert freelist_count(app) == 0
+        assert len(passes) == -(-free_pages // 10)
+
+
+def test_collect_unused_blobs_keeps_referenced_files(app, monkeypatch):
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+    with app.app.app_context():
+        used = app.save_blob(b'used', 'image/jpeg')
+        unused = app.save_blob(b'unused', 'image/jpeg')
+        app.save_renditions(unused, {('thumb', 'webp'): b'unused-thumb'})
+        app.db.session.add(app.Image(blob_hash=used, section='A'))
+        app.db.session.commit()
+        thumb = app.db.session.get(app.ImageRendition, (unused, 'thumb', 'webp')).blob_hash
+
+        assert app.collect_unused_blobs() == 2
+
+        assert app.db.session.get(app.Blob, used) is not None
+        assert app.read_blob(used) == b'used'
+        assert app.db.session.get(app.Blob, unused) is None
+        assert not app.ImageRendition.query.all()
+        for blob_hash in (unused, thumb):
+            assert not os.path.exists(app.blob_store.path(blob_hash))
+
+
+def test_save_blob_restores_file_collected_before_commit(app, monkeypatch):
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+    with app.app.app_context():
+        blob_hash = app.save_blob(b'frame', 'image/jpeg')
+        app.db.session.commit()
+        assert app.collect_unused_blobs() == 1
+        # Ponowny zapis tych samych danych po czyszczeniu tworzy rekord i plik od nowa
+        app.db.session.add(app.Image(blob_hash=app.save_blob(b'frame', 'image/jpeg'), section='A'))
+        app.db.session.commit()
+        assert app.read_blob(blob_hash) == b'frame'
+        assert app.collect_unused_blobs() == 0
+
+
+def test_delete_images_keeps_images_with_queued_jobs(app, monkeypatch):
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+    with app.app.app_context():
+        blob_hash = app.save_blob(b'frame', 'image/jpeg')
+        images = [app.Image(blob_hash=blob_hash, section='A') for _ in range(3)]
+        jobs = [
+            app.InferenceJob(section='A', image=images[0], status='queued'),
+            app.InferenceJob(section='A', image=images[1], status='done'),
+        ]
+        app.db.session.add_all(images + jobs)
+        app.db.session.commit()
+        queued_job = jobs[0].id
+
+        assert app.delete_images(app.Image, 1) == 1
+
+        assert [image.id for image in app.Image.query.order_by(app.Image.id)] == [images[0].id, images[2].id]
+        assert [job.id for job in app.InferenceJob.query] == [queued_job]
+
+
+def test_complete_inference_job_ignores_deleted_job(app):
+    class Result:
+        def result(self):
+            return 1, b'analyzed', {'original': {}, 'processed': {}}
+
+    app.complete_inference_job(12345, Result())
+
+    with app.app.app_context():
+        assert not app.ImageOut.query.all()
+
+
+def set_auto_vacuum(app, mode):
+    app.db.session.commit()
+    with app.db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        connection.exec_driver_sql(f"PRAGMA auto_vacuum={mode}")
+        connection.exec_driver_sql("VACUUM")
+
+
+def test_incremental_vacuum_stops_without_incremental_mode(app, monkeypatch):
+    monkeypatch.setattr(app, 'RETENTION_BATCH_PAUSE', 0)
+
+    def sleep(seconds):
+        raise AssertionError("PRAGMA incremental_vacuum bez auto_vacuum=INCREMENTAL nic nie zwalnia")
+
+    with app.app.app_context():
+        set_auto_vacuum(app, 'NONE')
+        try:
+            app.db.session.execute(app.db.insert(app.SensorData), [
+                {"room_id": "A", "device_id": "s1", "temperature": 20.0, "timestamp": datetime(2024, 1, 1)}
+                for _ in range(5000)
+            ])
+            app.db.session.commit()
+            app.SensorData.query.delete()
+            app.db.session.commit()
+            assert freelist_count(app) > 0
+
+            monkeypatch.setattr(app.time, 'sleep', sleep)
+            app.incremental_vacuum()
+        finally:
+            set_auto_vacuum(app, 'INCREMENTAL')
@@ -0,0 +1,139 @@
+import json
+import math
+import struct
+from datetime import datetime, timezone
+
+import pytest
+
+
+def post_batch(client, readings, room_id='A'):
+    return client.post(f'/rooms/{room_id}/sensor-data/batch', json={"readings": readings})
+
+
+def test_batch_is_stored(client, storage):
+    response = post_batch(client, [
+        {"device_id": "s1", "temperature": 20.5, "humidity": 40, "smoke_level": None},
+        {"device_id": "s2", "temperature": 21},
+    ])
+    assert response.status_code == 200
+    assert response.json["count"] == 2
+    assert client.get('/rooms/A/sensor-devices/s2/data').json["data"]["temperature"] == 21
+
+
+@pytest.mark.parametrize('reading, message', [
+    ({"temperature": 20}, "nie zawiera device_id"),
+    ({"device_id": ["x"], "temperature": 20}, "device_id"),
+    ({"device_id": "s1", "temperature": "hot"}, "temperature"),
+    ({"device_id": "s1", "smoke_level": True}, "smoke_level"),
+    ({"device_id": "s1", "timestamp": "wczoraj"}, "znacznik czasu"),
+])
+def test_invalid_reading_is_rejected_with_its_index(client, reading, message):
+    response = post_batch(client, [{"device_id": "s0", "temperature": 1}, reading])
+    assert response.status_code == 400
+    assert message in response.json["error"]
+    assert "nr 1" in response.json["error"]
+    assert client.get('/rooms/A/sensor-devices/s0/data').status_code == 404
+
+
+def test_invalid_single_reading_is_rejected(client):
+    response = client.put('/rooms/A/sensor-devices/s1/data', json={"temperature": "hot"})
+    assert response.status_code == 400
+
+
+def test_late_batch_does_not_replace_latest_reading(client, storage):
+    assert post_batch(client, [
+        {"device_id": "s1", "temperature": 22, "timestamp": "2024-01-01T12:00:00"},
+        {"device_id": "s1", "temperature": 21, "timestamp": "2024-01-01T11:00:00"},
+    ]).status_code == 200
+    # Spóźniona paczka starszych pomiarów (np. z bufora urządzenia po utracie łączności)
+    assert post_batch(client, [
+        {"device_id": "s1", "temperature": 10, "timestamp": "2024-01-01T08:00:00"},
+    ]).status_code == 200
+
+    latest = client.get('/rooms/A/sensor-devices/s1/data').json["data"]
+    assert (latest["temperature"], latest["timestamp"]) == (22, "2024-01-01T12:00:00")
+
+    assert post_batch(client, [
+        {"device_id": "s1", "temperature": 23, "timestamp": "2024-01-01T13:00:00"},
+    ]).status_code == 200
+    assert client.get('/rooms/A/sensor-devices/s1/data').json["data"]["temperature"] == 23
+
+
+def test_rebuild_latest_uses_newest_timestamp(app, client, storage):
+    post_batch(client, [
+        {"device_id": "s1", "temperature": 22, "timestamp": "2024-01-01T12:00:00"},
+        {"device_id": "s1", "temperature": 10, "timestamp": "2024-01-01T08:00:00"},
+    ])
+    with app.app.app_context():
+        app.rebuild_latest()
+        app.db.session.commit()
+    assert client.get('/rooms/A/sensor-devices/s1/data').json["data"]["temperature"] == 22
+
+
+def test_duplicate_readings_are_not_counted_in_rollups(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'COMPACT_STORAGE', True)
+    reading = {"device_id": "s1", "temperature": 20.0, "timestamp": "2024-01-01T12:00:00.123456"}
+    assert post_batch(client, [reading, dict(reading, temperature=30.0)]).status_code == 200
+    # Ponowne wysłanie tej samej paczki (np. po utracie odpowiedzi)
+    assert post_batch(client, [reading]).status_code == 200
+
+    with app.app.app_context():
+        rollups = app.SensorRollup.query.all()
+    assert {rollup.resolution for rollup in rollups} == set(app.ROLLUP_RESOLUTIONS.values())
+    assert all((rollup.temperature_count, rollup.temperature_sum) == (1, 20.0) for rollup in rollups)
+    latest = client.get('/rooms/A/sensor-devices/s1/data').json["data"]
+    assert (latest["temperature"], latest["timestamp"]) == (20.0, "2024-01-01T12:00:00.123000")
+
+
+def test_duplicates_are_not_counted_or_published(app, client, monkeypatch):
+    monkeypatch.setattr(app, 'COMPACT_STORAGE', True)
+    published = []
+    monkeypatch.setattr(app, 'publish_reading', lambda row: published.append(row["temperature"]))
+    reading = {"device_id": "s1", "temperature": 20.0, "timestamp": "2024-01-01T12:00:00"}
+
+    response = post_batch(client, [reading, dict(reading, temperature=30.0), dict(reading, device_id="s2")])
+    assert response.json["count"] == 2
+    assert post_batch(client, [reading]).json["count"] == 0
+    assert published == [20.0, 20.0]
+
+
+def decode_series(content):
+    """Odczyt formatu binarnego serii niezależny od klienta: nagłówek JSON, czasy (int64), wartości (float64)"""
+    assert content[:4] == b'SSR1'
+    header_length = struct.unpack_from('<I', content, 4)[0]
+    assert header_length % 8 == 0
+    data = json.loads(content[8:8 + header_length])
+    count = data["count"]
+    offset = 8 + header_length
+    data["timestamps"] = list(struct.unpack_from(f'<{count}q', content, offset))
+    for series in data["series"]:
+        offset += 8 * count
+        series["values"] = [None if math.isnan(value) else value
+                            for value in struct.unpack_from(f'<{count}d', content, offset)]
+    assert len(content) == offset + 8 * count
+    return data
+
+
+def test_binary_series_matches_json(client, storage):
+    assert post_batch(client, [
+        {"device_id": "s1", "temperature": 20.5, "humidity": 40, "timestamp": "2024-01-01T12:00:00"},
+        {"device_id": "s2", "temperature": 19, "humidity": 55, "timestamp": "2024-01-01T12:00:00"},
+        {"device_id": "s1", "temperature": 21.25, "timestamp": "2024-01-01T12:00:01.500"},
+        {"device_id": "s2", "humidity": 56, "timestamp": "2024-01-01T12:00:03"},
+    ]).status_code == 200
+    params = {"from": "2024-01-01T11:00:00", "to": "2024-01-01T13:00:00", "metrics": "temperature,humidity"}
+
+    expected = client.get('/rooms/A/series', query_string=params).json
+    response = client.get('/rooms/A/series', query_string=params,
+                          headers={"Accept": 'application/vnd.sensor-series'})
+    assert response.mimetype == 'application/vnd.sensor-series'
+    assert decode_series(response.get_data()) == expected
+
+    start = int(datetime(2024, 1, 1, 12, tzinfo=timezone.utc).timestamp() * 1000)
+    assert expected["timestamps"] == [start, start + 1500, start + 3000]
+    assert [(series["device_id"], series["metric"], series["values"]) for series in expected["series"]] == [
+        ('s1', 'temperature', [20.5, 21.25, None]),
+        ('s1', 'humidity', [40, None, None]),
+        ('s2', 'temperature', [19, None, None]),
+        ('s2', 'humidity', [55, None, 56]),
+    ]